@@ -0,0 +1,26 @@
+import os
+
+_arquivos_carregados = {}  # Arquivo .env -> chaves carregadas (lido uma vez por processo)
+
+def carregar_env(arquivo='.env', recarregar=False):
+    """Carrega variáveis do arquivo .env uma única vez por processo e devolve as chaves lidas"""
+    caminho = os.path.abspath(arquivo)
+    if caminho in _arquivos_carregados and not recarregar:
+        return _arquivos_carregados[caminho]
+
+    chaves = []
+    try:
+        with open(caminho, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if line and not line.startswith('#') and '=' in line:
+                    key, value = line.split('=', 1)
+                    os.environ[key.strip()] = value.strip()
+                    chaves.append(key.strip())
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        print(f"❌ Erro ao ler {arquivo}: {e}")
+
+    _arquivos_carregados[caminho] = chaves
+    return chaves
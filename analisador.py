@@ -1,63 +1,249 @@
 import os
-import openai
+import re
+import time
 import asyncio
+import functools
+import threading
+import contextvars
+import unicodedata
 from datetime import datetime
+from ambiente import carregar_env
+from backends import carregar_backends
+from pipeline import Requisicao, Metricas, CacheRespostas, RequisicoesRedundantes, criar_pipeline, executar_sincrono
+from ingestao import TAMANHO_TRECHO, FonteTrechos, dividir_texto, ler_trechos
+from modelos import capacidades_modelo
+from perfil import Perfil, fase
+
+# Vereditos aceitos na primeira fase do modo duas fases
+VEREDITOS = {
+    "APROVADO": "✅ APROVADO",
+    "PARCIAL": "⚠️ ATENDE PARCIALMENTE",
+    "NAO_ATENDE": "❌ NÃO ATENDE",
+}
+
+# Resultado dos critérios interrompidos antes de terminar
+MENSAGENS_STATUS = {
+    "tempo_esgotado": "⏱️ TEMPO ESGOTADO: a análise deste critério não terminou dentro do prazo",
+    "cancelado": "🛑 CANCELADO: a análise deste critério foi cancelada",
+}
+
+# Opções por critério aceitas no criterios.txt (linhas "@opção: valor" logo abaixo do título) e seus tipos
+OPCOES_CRITERIO = {
+    "modelo": str,  # Modelo usado só neste critério
+    "max_tokens": int,  # Tamanho máximo da resposta (análise e consolidação)
+    "temperatura": float,  # Temperatura da análise e da consolidação
+    "trecho": int,  # Caracteres por trecho ao dividir roteiros longos
+}
+
+# Instante (time.monotonic) em que a análise em andamento precisa terminar
+_limite_prazo = contextvars.ContextVar('limite_prazo', default=None)
+
+# Critério em análise, usado para escolher o backend das sub-requisições
+_criterio_atual = contextvars.ContextVar('criterio_atual', default=None)
+
+# Opções do critério em análise (modelo, max_tokens, temperatura, trecho)
+_opcoes_criterio = contextvars.ContextVar('opcoes_criterio', default={})
+
+# Callback do texto parcial (streaming) do critério em análise: ao_parcial(texto até agora)
+_ao_parcial = contextvars.ContextVar('ao_parcial', default=None)
+
+def id_criterio(criterio):
+    """Gera um identificador estável para o critério a partir do título (ex: "enfase-no-legal")"""
+    titulo = criterio['titulo'] if isinstance(criterio, dict) else criterio
+    sem_acentos = unicodedata.normalize('NFKD', titulo).encode('ascii', 'ignore').decode('ascii')
+    return re.sub(r'[^a-z0-9]+', '-', sem_acentos.lower()).strip('-')
+
+def opcoes_criterio(criterio):
+    """Opções próprias do critério (vazio se usar os padrões do analisador)"""
+    return criterio.get('opcoes', {}) if isinstance(criterio, dict) else {}
+
+def descrever_opcoes_criterio(criterio):
+    """Resumo das opções próprias do critério para exibição (ex: "gpt-4o · 800 tokens"); vazio se não houver"""
+    opcoes = opcoes_criterio(criterio)
+    partes = []
+    if 'modelo' in opcoes:
+        partes.append(opcoes['modelo'])
+    if 'max_tokens' in opcoes:
+        partes.append(f"{opcoes['max_tokens']} tokens")
+    if 'temperatura' in opcoes:
+        partes.append(f"temperatura {opcoes['temperatura']:g}")
+    if 'trecho' in opcoes:
+        partes.append(f"trechos de {opcoes['trecho']} caracteres")
+    return " · ".join(partes)
+
+def _ler_opcao_criterio(titulo, linha, opcoes):
+    """Interpreta uma linha "@opção: valor" do critério, avisando se for inválida"""
+    nome, _, valor = linha[1:].partition(':')
+    nome, valor = nome.strip().lower(), valor.strip()
+    tipo = OPCOES_CRITERIO.get(nome)
+    try:
+        if tipo is None or not valor:
+            raise ValueError
+        valor = tipo(valor)
+        if tipo is not str and (valor < 0 or valor == 0 and nome != 'temperatura'):
+            raise ValueError
+    except ValueError:
+        print(f"⚠️ Opção ignorada no critério '{titulo}': {linha}")
+        return
+    opcoes[nome] = valor
+
+def classificar_resultado(analise):
+    """Classifica o texto de uma análise em: aprovado, parcial, nao_atende ou erro"""
+    if VEREDITOS["APROVADO"] in analise:
+        return "aprovado"
+    if analise.startswith(tuple(mensagem.split(":")[0] for mensagem in MENSAGENS_STATUS.values())):
+        return "interrompido"
+    if analise.startswith("Erro n"):
+        return "erro"
+    if VEREDITOS["NAO_ATENDE"] in analise:
+        return "nao_atende"
+    return "parcial"
+
+def ler_arquivo_criterios(arquivo_criterios='criterios.txt'):
+    """Lê os critérios do arquivo TXT no formato: Título\n[@opção: valor\n]Descrição\n (FileNotFoundError se não existir)"""
+    with open(arquivo_criterios, 'r', encoding='utf-8') as f:
+        linhas = [linha.strip() for linha in f.readlines()]
+    
+    criterios = []
+    i = 0
+    while i < len(linhas):
+        if linhas[i]:  # Linha não vazia (título)
+            titulo = linhas[i]
+            descricao = ""
+            opcoes = {}
+            i += 1
+            
+            # Ler descrição (próximas linhas até linha vazia ou fim); linhas com @ são opções do critério
+            while i < len(linhas) and linhas[i]:
+                if linhas[i].startswith('@'):
+                    _ler_opcao_criterio(titulo, linhas[i], opcoes)
+                else:
+                    descricao += linhas[i] + " "
+                i += 1
+            
+            criterio = {
+                'titulo': titulo,
+                'descricao': descricao.strip()
+            }
+            if opcoes:
+                criterio['opcoes'] = opcoes
+            criterios.append(criterio)
+        else:
+            i += 1
+    
+    return criterios
 
 class AnalisadorRoteiro:
-    def __init__(self, api_key=None, modelo="gpt-4o-mini"):
-        self._load_env()
-        self.client = openai.OpenAI(
-            api_key=api_key or os.getenv('OPENAI_API_KEY')
-        )
-        self.async_client = openai.AsyncOpenAI(
-            api_key=api_key or os.getenv('OPENAI_API_KEY')
-        )
+    def __init__(self, api_key=None, modelo="gpt-4o-mini", duas_fases=False,
+                 limiar_similaridade=None, reverificar_trechos=False, backends=None, pipeline=None,
+                 duplicar_lentas=False, prioridade="interativa", usuario=None, chaves_api=None,
+                 gravar_em=None, reproduzir_de=None, perfilar=False, tamanho_cache=None, capacidades_modelos=None):
+        carregar_env()
+        # Backends e roteamento por critério (backends.json); clientes criados só na primeira requisição
+        # chaves_api: pool de chaves da OpenAI (textos ou dicionários com limites próprios)
+        self.roteador = backends or carregar_backends(api_key=api_key, chaves=chaves_api)
         self.modelo = modelo
+        # Capacidades informadas pelo usuário ({modelo: {campo: valor}}); as demais vêm do registro
+        self.capacidades_modelos = capacidades_modelos or {}
+        self.duas_fases = duas_fases  # Veredito curto primeiro, explicação só se reprovado
         self.log_requisicoes = []  # Log de todas as requisições
-    
-    def _load_env(self):
-        """Carrega variáveis do arquivo .env"""
-        try:
-            with open('.env', 'r', encoding='utf-8') as f:
-                content = f.read()
-                for line in content.splitlines():
-                    line = line.strip()
-                    if line and not line.startswith('#') and '=' in line:
-                        key, value = line.split('=', 1)
-                        os.environ[key.strip()] = value.strip()
-                        print(f"Carregado: {key.strip()}")  # Debug
-        except FileNotFoundError:
-            print("Arquivo .env não encontrado!")
-        except Exception as e:
-            print(f"Erro ao ler .env: {e}")
+        # Vez na fila do escalonador: "interativa" passa à frente do "lote"; o usuário divide as vagas
+        self.prioridade = prioridade
+        self.usuario = usuario
+        self.ao_despachar = None  # Chamado antes do envio de cada requisição (ex: orçamento da pré-análise)
+        self._cancelamento = threading.Event()  # Sinalizado por cancelar() (pode vir de outra thread)
+        self._prazo_imposto = None  # (prazo, limite) definido por impor_prazo() com a análise já em andamento
+        # Tempo de cada fase (leitura, trechos, fila, modelo, relatório); ver perfil.py
+        self.perfil = Perfil() if perfilar else None
+        
+        # Toda chamada ao modelo passa pelo pipeline (log, métricas, cache, limite de taxa, retentativas)
+        self.metricas = Metricas()
+        # duplicar_lentas: requisições acima do p95 de latência ganham uma duplicata (hedging)
+        # gravar_em / reproduzir_de: grava as respostas do modelo ou as reproduz sem rede (gravacao.py)
+        opcoes_pipeline = {}
+        if gravar_em or reproduzir_de:
+            from gravacao import GravadorRequisicoes, ReproducaoRequisicoes
+            if gravar_em:
+                opcoes_pipeline['gravador'] = GravadorRequisicoes(gravar_em)
+            if reproduzir_de:
+                opcoes_pipeline['transporte'] = ReproducaoRequisicoes(reproduzir_de)
+        # tamanho_cache: respostas guardadas para requisições idênticas (ex: modo observação, que reanalisa sempre)
+        self.pipeline = pipeline or criar_pipeline(
+            self.log_requisicoes, modelo, self.metricas,
+            cache=CacheRespostas(tamanho_cache) if tamanho_cache else None,
+            redundancia=RequisicoesRedundantes() if duplicar_lentas else None,
+            **opcoes_pipeline
+        )
         
+        # Reaproveitamento de trechos quase idênticos a trechos já aprovados
+        self.indice_similaridade = None
+        self.reverificar_trechos = reverificar_trechos  # Reanalisa só as regiões alteradas
+        if limiar_similaridade:
+            from similaridade import IndiceSimilaridade
+            self.indice_similaridade = IndiceSimilaridade(limiar=limiar_similaridade)
+    
+    def _backend(self):
+        """Backend do critério em análise (ou o padrão)"""
+        return self.roteador.backend_para(_criterio_atual.get())
+
+    def _modelo_criterio(self):
+        """Modelo do critério em análise (ou o do analisador)"""
+        return _opcoes_criterio.get().get('modelo', self.modelo)
+
+    @property
+    def client(self):
+        """Cliente síncrono do backend do critério em análise"""
+        return self._backend().client
+
+    @property
+    def async_client(self):
+        """Cliente assíncrono do backend do critério em análise"""
+        return self._backend().async_client
+
+    @property
+    def cancelado(self):
+        """Indica se cancelar() foi chamado"""
+        return self._cancelamento.is_set()
+
+    def cancelar(self):
+        """Cancela as análises assíncronas em andamento (seguro para chamar de outra thread)"""
+        self._cancelamento.set()
+
+    def impor_prazo(self, prazo):
+        """Aplica um prazo (segundos a partir de agora) à análise em andamento (seguro para chamar de outra thread)"""
+        self._prazo_imposto = (prazo, time.monotonic() + prazo)
+
+    async def _requisitar(self, tipo, sistema, prompt, max_tokens, temperature, trecho=None, parar_em=None, parcial=False):
+        """Monta a requisição para o backend do critério atual e a envia pelo pipeline
+
+        parar_em encerra a resposta cuja primeira linha for ele; parcial=True mostra o texto ao ser escrito (streaming).
+        """
+        backend = self._backend()
+        messages = [{"role": "system", "content": sistema}]
+        if trecho is not None:
+            # Trecho em mensagem própria: o mesmo objeto serve a todos os critérios e
+            # o prefixo (sistema + trecho) se repete, aproveitando o cache de prompt da API
+            messages.append({"role": "user", "content": trecho})
+        messages.append({"role": "user", "content": prompt})
+        modelo = self._modelo_criterio()
+        nome_modelo = backend.nome_modelo(modelo)
+        max_tokens = capacidades_modelo(nome_modelo, self.capacidades_modelos).limitar_saida(max_tokens)
+        requisicao = Requisicao(
+            tipo, backend, nome_modelo, messages,
+            max_tokens, temperature, prompt=prompt, limite=_limite_prazo.get(),
+            classe=self.prioridade, usuario=self.usuario, modelo_pedido=modelo,
+            ao_receber=_ao_parcial.get() if parcial else None, parar_em=parar_em,
+            ao_despachar=self.ao_despachar
+        )
+        with fase(f"requisicao:{tipo}"):
+            resposta = await self.pipeline.executar_async(requisicao)
+        return resposta['conteudo']
+
     def ler_criterios(self, arquivo_criterios='criterios.txt'):
         """Lê os critérios do arquivo TXT no formato: Título\nDescrição\n"""
         try:
-            with open(arquivo_criterios, 'r', encoding='utf-8') as f:
-                linhas = [linha.strip() for linha in f.readlines()]
-            
-            criterios = []
-            i = 0
-            while i < len(linhas):
-                if linhas[i]:  # Linha não vazia (título)
-                    titulo = linhas[i]
-                    descricao = ""
-                    i += 1
-                    
-                    # Ler descrição (próximas linhas até linha vazia ou fim)
-                    while i < len(linhas) and linhas[i]:
-                        descricao += linhas[i] + " "
-                        i += 1
-                    
-                    criterios.append({
-                        'titulo': titulo,
-                        'descricao': descricao.strip()
-                    })
-                else:
-                    i += 1
-            
-            return criterios
+            with fase("ler_criterios", self.perfil):
+                return ler_arquivo_criterios(arquivo_criterios)
         except FileNotFoundError:
             print(f"Arquivo {arquivo_criterios} não encontrado!")
             return []
@@ -65,318 +251,283 @@ class AnalisadorRoteiro:
     def ler_roteiro(self, arquivo_roteiro):
         """Lê o roteiro do arquivo"""
         try:
-            with open(arquivo_roteiro, 'r', encoding='utf-8') as f:
+            with fase("ler_roteiro", self.perfil), open(arquivo_roteiro, 'r', encoding='utf-8') as f:
                 return f.read()
         except FileNotFoundError:
             print(f"Arquivo {arquivo_roteiro} não encontrado!")
             return None
     
-    def _dividir_roteiro(self, roteiro, max_chars=8000):
-        """Divide roteiro em partes menores se necessário"""
-        if len(roteiro) <= max_chars:
-            return [roteiro]
-        
-        partes = []
-        palavras = roteiro.split()
-        parte_atual = ""
-        
-        for palavra in palavras:
-            if len(parte_atual + " " + palavra) > max_chars:
-                if parte_atual:
-                    partes.append(parte_atual.strip())
-                parte_atual = palavra
-            else:
-                parte_atual += " " + palavra if parte_atual else palavra
-        
-        if parte_atual:
-            partes.append(parte_atual.strip())
-        
-        return partes
+    def _ler_trechos_roteiro(self, arquivo_roteiro):
+        """Leitor dos trechos do arquivo de roteiro (None se o arquivo não existir ou estiver vazio)"""
+        if not os.path.exists(arquivo_roteiro):
+            print(f"Arquivo {arquivo_roteiro} não encontrado!")
+            return None
+        if os.path.getsize(arquivo_roteiro) == 0:
+            return None
+        # Função do tamanho do trecho: critérios com tamanhos diferentes leem o arquivo cada um à sua maneira
+        return lambda max_chars=TAMANHO_TRECHO: ler_trechos(arquivo_roteiro, max_chars)
+    
+    def _dividir_roteiro(self, roteiro, max_chars=None):
+        """Divide roteiro em partes menores se necessário (por padrão, no que cabe no contexto do modelo)"""
+        max_chars = max_chars or self._tamanho_trecho(None)
+        return list(dividir_texto(roteiro, max_chars)) or [roteiro]
+
+    def _tamanho_trecho(self, criterio):
+        """Caracteres por trecho do critério: a opção @trecho ou o que cabe na janela de contexto do modelo"""
+        opcoes = opcoes_criterio(criterio)
+        if 'trecho' in opcoes:
+            return opcoes['trecho']
+        backend = self.roteador.backend_para(id_criterio(criterio) if criterio else None)
+        modelo = backend.nome_modelo(opcoes.get('modelo', self.modelo))
+        # Modelo fora do registro: trechos do tamanho padrão
+        return capacidades_modelo(modelo, self.capacidades_modelos).tamanho_trecho(opcoes.get('max_tokens', 500))
+
+    def _fonte_trechos(self, roteiro, consumidores, max_chars=TAMANHO_TRECHO):
+        """Fonte compartilhada dos trechos: aceita o texto, uma função max_chars -> trechos ou um gerador de trechos"""
+        if isinstance(roteiro, str):
+            trechos = dividir_texto(roteiro, max_chars)
+        elif callable(roteiro):
+            trechos = roteiro(max_chars)
+        else:
+            trechos = roteiro  # Gerador já dividido: o tamanho do trecho não pode mudar
+        return FonteTrechos(trechos, consumidores)
 
-    async def analisar_criterio_async(self, roteiro, criterio):
+    async def analisar_criterio_async(self, roteiro, criterio, prazo=None):
         """Analisa o roteiro com base em um critério específico usando ChatGPT (assíncrono)"""
-        descricao = criterio['descricao'] if isinstance(criterio, dict) else criterio
-        
-        # Dividir roteiro se for muito grande
-        partes_roteiro = self._dividir_roteiro(roteiro)
+        if prazo is not None:
+            # Executar com prazo e cancelamento, como nas análises com vários critérios
+            resultados = await self._executar_criterios_async(roteiro, [criterio], prazo)
+            return resultados[0]['resultado']
         
-        if len(partes_roteiro) == 1:
-            # Roteiro pequeno - análise normal
-            return await self._analisar_parte_async(partes_roteiro[0], descricao)
-        else:
-            # Roteiro grande - analisar partes e consolidar
-            print(f"  📝 Roteiro dividido em {len(partes_roteiro)} partes...")
-            
-            # Analisar todas as partes em paralelo
-            tasks = []
-            for i, parte in enumerate(partes_roteiro, 1):
-                task = self._analisar_parte_async(parte, descricao, parte_num=i)
-                tasks.append(task)
-            
-            print(f"    Analisando {len(tasks)} partes em paralelo...")
-            analises_partes = await asyncio.gather(*tasks)
-            
-            # Consolidar análises
+        tamanho = self._tamanho_trecho(criterio)
+        return await self._analisar_criterio_fonte_async(self._fonte_trechos(roteiro, 1, tamanho), criterio, 0)
+
+    async def _analisar_criterio_fonte_async(self, fonte, criterio, consumidor):
+        """Analisa os trechos da fonte com um critério (consumidor é o número do critério na fonte)"""
+        # Sub-requisições deste critério usam o backend roteado e as opções dele
+        token = _criterio_atual.set(id_criterio(criterio))
+        token_opcoes = _opcoes_criterio.set(opcoes_criterio(criterio))
+        try:
+            descricao = criterio['descricao'] if isinstance(criterio, dict) else criterio
+            with fase(f"criterio:{_criterio_atual.get()}", self.perfil):
+                return await self._analisar_descricao_async(fonte, descricao, consumidor)
+        finally:
+            _opcoes_criterio.reset(token_opcoes)
+            _criterio_atual.reset(token)
+
+    async def _analisar_descricao_async(self, fonte, descricao, consumidor=0):
+        """Analisa cada trecho assim que é lido, consolidando no fim se o roteiro tiver várias partes"""
+        tarefas = []
+        try:
+            while True:
+                with fase("trechos"):  # Leitura e divisão (ou espera pelos critérios mais lentos)
+                    parte = await fonte.obter(len(tarefas))
+                if parte is None:
+                    break
+                tarefas.append(asyncio.create_task(
+                    self._analisar_trecho_fonte_async(fonte, len(tarefas), parte, descricao, consumidor)
+                ))
+            
+            if not tarefas:
+                # Roteiro vazio (ou só espaços): nada foi analisado, então não pode sair aprovado
+                return "Erro na análise: o roteiro está vazio, não há texto para analisar"
+            
+            if len(tarefas) == 1:
+                # Roteiro pequeno - análise normal
+                return await tarefas[0]
+            
+            # Roteiro grande - partes analisadas em paralelo desde a leitura, depois consolidadas
+            print(f"  📝 Roteiro dividido em {len(tarefas)} partes...")
+            analises_partes = await asyncio.gather(*tarefas)
             return await self._consolidar_analises_async(analises_partes, descricao)
+        finally:
+            # Critério cancelado ou com prazo esgotado: interromper as partes e soltar os trechos
+            pendentes = [tarefa for tarefa in tarefas if not tarefa.done()]
+            for tarefa in pendentes:
+                tarefa.cancel()
+            if pendentes:
+                await asyncio.gather(*pendentes, return_exceptions=True)
+            await fonte.encerrar(consumidor)
+
+    async def _analisar_trecho_fonte_async(self, fonte, indice, parte, descricao, consumidor):
+        """Analisa um trecho e o libera na fonte ao terminar"""
+        try:
+            return await self._analisar_parte_async(parte, descricao, parte_num=indice + 1)
+        finally:
+            await fonte.liberar(indice, consumidor)
 
     def analisar_criterio(self, roteiro, criterio):
         """Analisa o roteiro com base em um critério específico usando ChatGPT"""
-        descricao = criterio['descricao'] if isinstance(criterio, dict) else criterio
-        
-        # Dividir roteiro se for muito grande
-        partes_roteiro = self._dividir_roteiro(roteiro)
-        
-        if len(partes_roteiro) == 1:
-            # Roteiro pequeno - análise normal
-            return self._analisar_parte(partes_roteiro[0], descricao)
-        else:
-            # Roteiro grande - analisar partes e consolidar
-            print(f"  📝 Roteiro dividido em {len(partes_roteiro)} partes...")
-            
-            analises_partes = []
-            for i, parte in enumerate(partes_roteiro, 1):
-                print(f"    Analisando parte {i}/{len(partes_roteiro)}...")
-                analise = self._analisar_parte(parte, descricao, parte_num=i)
-                analises_partes.append(analise)
-            
-            # Consolidar análises
-            return self._consolidar_analises(analises_partes, descricao)
+        # Fachada síncrona: a análise roda no event loop compartilhado do pipeline
+        return executar_sincrono(self.analisar_criterio_async(roteiro, criterio))
     
-    async def _analisar_parte_async(self, roteiro_parte, descricao, parte_num=None):
-        """Analisa uma parte específica do roteiro (assíncrono)"""
-        parte_info = f" (Parte {parte_num})" if parte_num else ""
-        
-        prompt = f"""
-        Analise o seguinte roteiro com base no critério específico abaixo.
-        
-        CRITÉRIO A ANALISAR: {descricao}
-        
-        ROTEIRO:
-        {roteiro_parte}
-        
-        INSTRUÇÕES IMPORTANTES:
+    def _montar_prompt_analise(self, descricao, veredito=None):
+        """Monta o prompt de análise do trecho enviado na mensagem anterior (com o veredito já definido no modo duas fases)"""
+        if veredito:
+            instrucoes = f"""
+        - O critério já foi avaliado como "{VEREDITOS[veredito]}"
+        - Comece a resposta exatamente com "{VEREDITOS[veredito]}"
+        - Em seguida, forneça:
+          1. Explicação do problema
+          2. Sugestões de melhoria"""
+        else:
+            instrucoes = """
         - Se o critério for TOTALMENTE ATENDIDO, responda APENAS: "✅ APROVADO"
         - NUNCA adicione explicações quando aprovado
         - Se houver problemas, forneça:
           1. "❌ NÃO ATENDE" ou "⚠️ ATENDE PARCIALMENTE"
           2. Explicação do problema
-          3. Sugestões de melhoria
-        
+          3. Sugestões de melhoria"""
+
+        return f"""
+        Analise o roteiro da mensagem anterior com base no critério específico abaixo.
+
+        CRITÉRIO A ANALISAR: {descricao}
+
+        INSTRUÇÕES IMPORTANTES:{instrucoes}
+
         Seja rigorosamente objetivo.
         """
-        
+
+    def _montar_prompt_veredito(self, descricao):
+        """Monta o prompt da primeira fase do modo duas fases (somente o veredito)"""
+        return f"""
+        Avalie o roteiro da mensagem anterior com base no critério específico abaixo.
+
+        CRITÉRIO A ANALISAR: {descricao}
+
+        Responda com UMA ÚNICA palavra, sem pontuação nem explicações:
+        - APROVADO se o critério for totalmente atendido
+        - PARCIAL se o critério for atendido parcialmente
+        - NAO_ATENDE se o critério não for atendido
+        """
+
+    def _interpretar_veredito(self, resposta):
+        """Converte a resposta da primeira fase em uma chave de VEREDITOS (None se não reconhecida)
+
+        Só a primeira palavra conta, e tem que ser exatamente um dos vereditos: "NÃO APROVADO" não é
+        APROVADO; qualquer outra resposta leva à análise completa.
+        """
+        texto = unicodedata.normalize('NFKD', resposta or "").encode('ascii', 'ignore').decode().upper().strip()
+        texto = re.sub(r'^NAO[\s_-]+ATENDE\b', 'NAO_ATENDE', texto)
+        palavras = texto.split()
+        primeira = palavras[0].strip('.,;:!?*"\'`') if palavras else ""
+        return primeira if primeira in ("APROVADO", "PARCIAL", "NAO_ATENDE") else None
+
+    async def _obter_veredito_async(self, roteiro_parte, descricao):
+        """Primeira fase: pede apenas o veredito, com max_tokens mínimo"""
         try:
-            # Preparar dados da requisição
-            messages = [
-                {"role": "system", "content": "Você é um especialista em análise de roteiros de vídeo. Seja preciso e conciso."},
-                {"role": "user", "content": prompt}
-            ]
-            
-            # Fazer requisição assíncrona
-            response = await self.async_client.chat.completions.create(
-                model=self.modelo,
-                messages=messages,
-                max_tokens=500,
-                temperature=0.1
+            resposta = await self._requisitar(
+                "Veredito",
+                "Você é um especialista em análise de roteiros de vídeo. Responda apenas com o veredito.",
+                self._montar_prompt_veredito(descricao),
+                max_tokens=5,
+                temperature=0,
+                trecho=roteiro_parte
             )
-            
-            # Extrair dados da resposta
-            resposta_content = response.choices[0].message.content
-            
-            # Log da requisição
-            log_entry = {
-                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "modelo": self.modelo,
-                "tipo": "Análise de Critério (Async)",
-                "prompt_chars": len(prompt),
-                "resposta_chars": len(resposta_content),
-                "tokens_input": response.usage.prompt_tokens if hasattr(response, 'usage') else 0,
-                "tokens_output": response.usage.completion_tokens if hasattr(response, 'usage') else 0,
-                "tokens_total": response.usage.total_tokens if hasattr(response, 'usage') else 0,
-                "prompt": prompt[:200] + "..." if len(prompt) > 200 else prompt,
-                "resposta": resposta_content
-            }
-            
-            self.log_requisicoes.append(log_entry)
-            
-            return resposta_content
+        except Exception:
+            # Sem veredito, a segunda fase faz a análise completa
+            return None
+
+        return self._interpretar_veredito(resposta)
+
+    async def _registrar_trecho(self, roteiro_parte, descricao, resultado):
+        """Guarda no índice de similaridade os trechos aprovados (fora do event loop: MinHash e SQLite bloqueiam)"""
+        if self.indice_similaridade and classificar_resultado(resultado) == "aprovado":
+            try:
+                await asyncio.to_thread(
+                    self.indice_similaridade.registrar, roteiro_parte, descricao, self._modelo_criterio(), resultado
+                )
+            except Exception as e:
+                print(f"⚠️ Erro ao registrar trecho no índice: {e}")
+
+    async def _buscar_trecho_similar(self, roteiro_parte, descricao):
+        """Procura um trecho aprovado quase idêntico e registra o reaproveitamento no log"""
+        try:
+            with fase("similaridade"):
+                # Em uma thread: os outros critérios seguem enquanto a assinatura é calculada
+                similar = await asyncio.to_thread(
+                    self.indice_similaridade.buscar, roteiro_parte, descricao, self._modelo_criterio()
+                )
         except Exception as e:
-            # Log do erro
-            log_entry = {
+            print(f"⚠️ Erro ao consultar índice de trechos: {e}")
+            return None
+        
+        if similar:
+            self.log_requisicoes.append({
                 "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "modelo": self.modelo,
-                "tipo": "ERRO (Async)",
-                "erro": str(e),
-                "prompt_chars": len(prompt),
-                "resposta_chars": 0,
+                "modelo": self._modelo_criterio(),
+                "tipo": f"Trecho Reaproveitado ({similar['similaridade']:.0%} similar)",
+                "reaproveitado": True,
+                "prompt_chars": 0,
+                "resposta_chars": len(similar['resultado']),
                 "tokens_input": 0,
                 "tokens_output": 0,
                 "tokens_total": 0,
-                "prompt": prompt[:200] + "..." if len(prompt) > 200 else prompt,
-                "resposta": f"Erro: {str(e)}"
-            }
-            
-            self.log_requisicoes.append(log_entry)
-            
-            return f"Erro na análise da parte: {str(e)}"
+                "prompt": "",
+                "resposta": similar['resultado']
+            })
+        return similar
 
-    def _analisar_parte(self, roteiro_parte, descricao, parte_num=None):
-        """Analisa uma parte específica do roteiro"""
-        parte_info = f" (Parte {parte_num})" if parte_num else ""
-        
-        prompt = f"""
-        Analise o seguinte roteiro com base no critério específico abaixo.
-        
-        CRITÉRIO A ANALISAR: {descricao}
-        
-        ROTEIRO:
-        {roteiro_parte}
-        
-        INSTRUÇÕES IMPORTANTES:
-        - Se o critério for TOTALMENTE ATENDIDO, responda APENAS: "✅ APROVADO"
-        - NUNCA adicione explicações quando aprovado
-        - Se houver problemas, forneça:
-          1. "❌ NÃO ATENDE" ou "⚠️ ATENDE PARCIALMENTE"
-          2. Explicação do problema
-          3. Sugestões de melhoria
+    async def _reaproveitar_trecho_async(self, roteiro_parte, descricao):
+        """Reaproveita o veredito de um trecho quase idêntico já aprovado (None se não houver)"""
+        similar = await self._buscar_trecho_similar(roteiro_parte, descricao)
+        if not similar:
+            return None
         
-        Seja rigorosamente objetivo.
-        """
+        from similaridade import trechos_alterados
+        trechos = await asyncio.to_thread(trechos_alterados, similar['texto'], roteiro_parte) if self.reverificar_trechos else []
+        if not trechos:
+            return similar['resultado']
         
+        # Reanalisar apenas as regiões que mudaram
+        resultado = await self._analisar_parte_async("\n\n".join(trechos), descricao, usar_indice=False)
+        await self._registrar_trecho(roteiro_parte, descricao, resultado)
+        return resultado
+
+    async def _analisar_parte_async(self, roteiro_parte, descricao, parte_num=None, usar_indice=True):
+        """Analisa uma parte específica do roteiro"""
+        if usar_indice and self.indice_similaridade:
+            reaproveitado = await self._reaproveitar_trecho_async(roteiro_parte, descricao)
+            if reaproveitado is not None:
+                return reaproveitado
+        
+        veredito = None
+        if self.duas_fases:
+            # Primeira fase: apenas o veredito, com poucos tokens de saída
+            veredito = await self._obter_veredito_async(roteiro_parte, descricao)
+            if veredito == "APROVADO":
+                if usar_indice:
+                    await self._registrar_trecho(roteiro_parte, descricao, VEREDITOS["APROVADO"])
+                return VEREDITOS["APROVADO"]
+        
+        opcoes = _opcoes_criterio.get()
         try:
-            # Preparar dados da requisição
-            messages = [
-                {"role": "system", "content": "Você é um especialista em análise de roteiros de vídeo. Seja preciso e conciso."},
-                {"role": "user", "content": prompt}
-            ]
-            
-            # Fazer requisição
-            response = self.client.chat.completions.create(
-                model=self.modelo,
-                messages=messages,
-                max_tokens=500,
-                temperature=0.1
+            resposta = await self._requisitar(
+                "Análise de Critério",
+                "Você é um especialista em análise de roteiros de vídeo. Seja preciso e conciso.",
+                self._montar_prompt_analise(descricao, veredito),
+                max_tokens=opcoes.get('max_tokens', 500),
+                temperature=opcoes.get('temperatura', 0.1),
+                trecho=roteiro_parte,
+                # Sem veredito prévio, "✅ APROVADO" é a resposta inteira: o resto nem é esperado
+                parar_em=None if veredito else VEREDITOS["APROVADO"],
+                parcial=True
             )
-            
-            # Extrair dados da resposta
-            resposta_content = response.choices[0].message.content
-            
-            # Log da requisição
-            log_entry = {
-                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "modelo": self.modelo,
-                "tipo": "Análise de Critério",
-                "prompt_chars": len(prompt),
-                "resposta_chars": len(resposta_content),
-                "tokens_input": response.usage.prompt_tokens if hasattr(response, 'usage') else 0,
-                "tokens_output": response.usage.completion_tokens if hasattr(response, 'usage') else 0,
-                "tokens_total": response.usage.total_tokens if hasattr(response, 'usage') else 0,
-                "prompt": prompt[:200] + "..." if len(prompt) > 200 else prompt,
-                "resposta": resposta_content
-            }
-            
-            self.log_requisicoes.append(log_entry)
-            
-            return resposta_content
         except Exception as e:
-            # Log do erro
-            log_entry = {
-                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "modelo": self.modelo,
-                "tipo": "ERRO",
-                "erro": str(e),
-                "prompt_chars": len(prompt),
-                "resposta_chars": 0,
-                "tokens_input": 0,
-                "tokens_output": 0,
-                "tokens_total": 0,
-                "prompt": prompt[:200] + "..." if len(prompt) > 200 else prompt,
-                "resposta": f"Erro: {str(e)}"
-            }
-            
-            self.log_requisicoes.append(log_entry)
-            
             return f"Erro na análise da parte: {str(e)}"
-    
-    async def _consolidar_analises_async(self, analises_partes, descricao):
-        """Consolida múltiplas análises em uma resposta final (assíncrono)"""
-        analises_text = "\n\n".join([f"Parte {i+1}: {analise}" for i, analise in enumerate(analises_partes)])
-        
-        prompt = f"""
-        Com base nas análises das partes do roteiro abaixo, forneça uma avaliação final:
-        
-        CRITÉRIO: {descricao}
-        
-        ANÁLISES DAS PARTES:
-        {analises_text}
-        
-        INSTRUÇÕES:
-        - Se TODAS as partes foram aprovadas, responda: "✅ APROVADO"
-        - Se houver problemas em qualquer parte, forneça:
-          1. Uma avaliação final (Não Atende/Parcialmente Atende)
-          2. Resumo dos principais problemas encontrados
-          3. Sugestões específicas de melhoria
         
-        Seja objetivo e construtivo.
-        """
+        if usar_indice:
+            await self._registrar_trecho(roteiro_parte, descricao, resposta)
         
-        try:
-            # Preparar dados da requisição
-            messages = [
-                {"role": "system", "content": "Você é um especialista em análise de roteiros de vídeo."},
-                {"role": "user", "content": prompt}
-            ]
-            
-            # Fazer requisição assíncrona
-            response = await self.async_client.chat.completions.create(
-                model=self.modelo,
-                messages=messages,
-                max_tokens=600,
-                temperature=0.3
-            )
-            
-            # Extrair dados da resposta
-            resposta_content = response.choices[0].message.content
-            
-            # Log da requisição
-            log_entry = {
-                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "modelo": self.modelo,
-                "tipo": "Consolidação (Async)",
-                "prompt_chars": len(prompt),
-                "resposta_chars": len(resposta_content),
-                "tokens_input": response.usage.prompt_tokens if hasattr(response, 'usage') else 0,
-                "tokens_output": response.usage.completion_tokens if hasattr(response, 'usage') else 0,
-                "tokens_total": response.usage.total_tokens if hasattr(response, 'usage') else 0,
-                "prompt": prompt[:200] + "..." if len(prompt) > 200 else prompt,
-                "resposta": resposta_content
-            }
-            
-            self.log_requisicoes.append(log_entry)
-            
-            return resposta_content
-        except Exception as e:
-            # Log do erro
-            log_entry = {
-                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "modelo": self.modelo,
-                "tipo": "ERRO - Consolidação (Async)",
-                "erro": str(e),
-                "prompt_chars": len(prompt),
-                "resposta_chars": 0,
-                "tokens_input": 0,
-                "tokens_output": 0,
-                "tokens_total": 0,
-                "prompt": prompt[:200] + "..." if len(prompt) > 200 else prompt,
-                "resposta": f"Erro: {str(e)}"
-            }
-            
-            self.log_requisicoes.append(log_entry)
-            
-            return f"Erro na consolidação: {str(e)}"
+        return resposta
 
-    def _consolidar_analises(self, analises_partes, descricao):
+    async def _consolidar_analises_async(self, analises_partes, descricao):
         """Consolida múltiplas análises em uma resposta final"""
+        # Todas as partes aprovadas: o veredito final não depende de outra requisição
+        if all(analise.strip() == VEREDITOS["APROVADO"] for analise in analises_partes):
+            return VEREDITOS["APROVADO"]
+        
         analises_text = "\n\n".join([f"Parte {i+1}: {analise}" for i, analise in enumerate(analises_partes)])
         
         prompt = f"""
@@ -397,177 +548,158 @@ class AnalisadorRoteiro:
         Seja objetivo e construtivo.
         """
         
+        opcoes = _opcoes_criterio.get()
         try:
-            # Preparar dados da requisição
-            messages = [
-                {"role": "system", "content": "Você é um especialista em análise de roteiros de vídeo."},
-                {"role": "user", "content": prompt}
-            ]
-            
-            # Fazer requisição
-            response = self.client.chat.completions.create(
-                model=self.modelo,
-                messages=messages,
-                max_tokens=600,
-                temperature=0.3
+            return await self._requisitar(
+                "Consolidação",
+                "Você é um especialista em análise de roteiros de vídeo.",
+                prompt,
+                max_tokens=opcoes.get('max_tokens', 600),
+                temperature=opcoes.get('temperatura', 0.3),
+                parar_em=VEREDITOS["APROVADO"],
+                parcial=True
             )
-            
-            # Extrair dados da resposta
-            resposta_content = response.choices[0].message.content
-            
-            # Log da requisição
-            log_entry = {
-                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "modelo": self.modelo,
-                "tipo": "Consolidação",
-                "prompt_chars": len(prompt),
-                "resposta_chars": len(resposta_content),
-                "tokens_input": response.usage.prompt_tokens if hasattr(response, 'usage') else 0,
-                "tokens_output": response.usage.completion_tokens if hasattr(response, 'usage') else 0,
-                "tokens_total": response.usage.total_tokens if hasattr(response, 'usage') else 0,
-                "prompt": prompt[:200] + "..." if len(prompt) > 200 else prompt,
-                "resposta": resposta_content
-            }
-            
-            self.log_requisicoes.append(log_entry)
-            
-            return resposta_content
         except Exception as e:
-            # Log do erro
-            log_entry = {
-                "timestamp": datetime.now().strftime("%H:%M:%S"),
-                "modelo": self.modelo,
-                "tipo": "ERRO - Consolidação",
-                "erro": str(e),
-                "prompt_chars": len(prompt),
-                "resposta_chars": 0,
-                "tokens_input": 0,
-                "tokens_output": 0,
-                "tokens_total": 0,
-                "prompt": prompt[:200] + "..." if len(prompt) > 200 else prompt,
-                "resposta": f"Erro: {str(e)}"
-            }
-            
-            self.log_requisicoes.append(log_entry)
-            
             return f"Erro na consolidação: {str(e)}"
     
-    async def analisar_roteiro_completo_async(self, arquivo_roteiro, arquivo_criterios='criterios.txt'):
-        """Analisa o roteiro completo com todos os critérios (assíncrono - paralelo)"""
-        roteiro = self.ler_roteiro(arquivo_roteiro)
-        if not roteiro:
-            return None
-            
-        criterios = self.ler_criterios(arquivo_criterios)
-        if not criterios:
-            return None
-        
-        print(f"🚀 Iniciando análise paralela do roteiro com {len(criterios)} critérios...")
-        
-        # Criar tasks para análise paralela
-        tasks = []
-        for i, criterio in enumerate(criterios, 1):
-            titulo = criterio['titulo'] if isinstance(criterio, dict) else criterio[:50]
-            print(f"📋 Preparando análise do critério {i}/{len(criterios)}: {titulo}...")
-            task = self.analisar_criterio_async(roteiro, criterio)
-            tasks.append((criterio, task))
-        
-        # Executar todas as análises em paralelo
-        print(f"⚡ Executando {len(tasks)} análises em paralelo...")
-        resultados = []
-        
-        for criterio, task in tasks:
-            resultado = await task
-            resultados.append({
-                'criterio': criterio,
-                'resultado': resultado
-            })
-        
-        print("✅ Análise paralela concluída!")
+    def _resultado_tarefa(self, criterio, tarefa, motivo=None):
+        """Monta o resultado de um critério a partir da tarefa (motivo se não terminou)"""
+        if motivo is not None and (tarefa.cancelled() or not tarefa.done()):
+            return {'criterio': criterio, 'resultado': MENSAGENS_STATUS[motivo], 'status': motivo}
+        if tarefa.exception() is not None:
+            return {'criterio': criterio, 'resultado': f"Erro na análise: {tarefa.exception()}", 'status': 'concluido'}
+        return {'criterio': criterio, 'resultado': tarefa.result(), 'status': 'concluido'}
+
+    async def _com_parcial(self, ao_parcial, corrotina):
+        """Executa a corrotina com o callback de texto parcial do critério (no contexto da própria tarefa)"""
+        _ao_parcial.set(ao_parcial)
+        return await corrotina
+
+    async def _executar_criterios_async(self, roteiro, criterios, prazo=None, ao_concluir=None, ao_parcial=None):
+        """Executa os critérios em paralelo com prazo (segundos) e cancelamento, avisando ao_concluir(indice, resultado)
+
+        ao_parcial(indice, texto) recebe o texto de cada critério enquanto o modelo o escreve.
+        """
+        # O limite fica no contexto para as tarefas e sub-requisições herdarem
+        limite = time.monotonic() + prazo if prazo is not None else None
+        token = _limite_prazo.set(limite)
+        try:
+            # Uma fonte de trechos por tamanho de trecho: cada trecho é lido uma vez e compartilhado
+            # pelos critérios com o mesmo tamanho (um gerador já dividido serve a todos)
+            if isinstance(roteiro, str) or callable(roteiro):
+                tamanhos = [self._tamanho_trecho(criterio) for criterio in criterios]
+            else:
+                tamanhos = [TAMANHO_TRECHO] * len(criterios)
+            fontes = {
+                tamanho: self._fonte_trechos(roteiro, tamanhos.count(tamanho), tamanho)
+                for tamanho in dict.fromkeys(tamanhos)
+            }
+            tarefas = []
+            for i, (criterio, tamanho) in enumerate(zip(criterios, tamanhos)):
+                corrotina = self._analisar_criterio_fonte_async(fontes[tamanho], criterio, tamanhos[:i].count(tamanho))
+                if ao_parcial:
+                    corrotina = self._com_parcial(functools.partial(ao_parcial, i), corrotina)
+                tarefas.append(asyncio.create_task(corrotina))
+        finally:
+            _limite_prazo.reset(token)
+
+        indices = {tarefa: i for i, tarefa in enumerate(tarefas)}
+        resultados = [None] * len(tarefas)
+        pendentes = set(tarefas)
+        motivo = "cancelado"
+        try:
+            while pendentes:
+                if self._cancelamento.is_set():
+                    print("🛑 Análise cancelada!")
+                    break
+
+                # Acordar periodicamente para verificar o cancelamento
+                espera = 0.1
+                if self._prazo_imposto and (limite is None or self._prazo_imposto[1] < limite):
+                    prazo, limite = self._prazo_imposto
+                if limite is not None:
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        motivo = "tempo_esgotado"
+                        print(f"⏱️ Prazo de {prazo}s esgotado com {len(pendentes)} critério(s) pendente(s)!")
+                        break
+                    espera = min(espera, restante)
+
+                feitas, pendentes = await asyncio.wait(pendentes, timeout=espera)
+                for tarefa in feitas:
+                    i = indices[tarefa]
+                    resultados[i] = self._resultado_tarefa(criterios[i], tarefa)
+                    if ao_concluir:
+                        ao_concluir(i, resultados[i])
+        finally:
+            # Liberar imediatamente as requisições que não vão ser aproveitadas
+            for tarefa in pendentes:
+                tarefa.cancel()
+            if pendentes:
+                await asyncio.gather(*pendentes, return_exceptions=True)
+
+        for tarefa in pendentes:
+            i = indices[tarefa]
+            resultados[i] = self._resultado_tarefa(criterios[i], tarefa, motivo)
+            if ao_concluir:
+                ao_concluir(i, resultados[i])
+
         return resultados
 
-    async def analisar_criterios_selecionados_async(self, arquivo_roteiro, criterios_selecionados):
-        """Analisa o roteiro apenas com critérios selecionados (assíncrono - paralelo)"""
-        roteiro = self.ler_roteiro(arquivo_roteiro)
-        if not roteiro:
+    async def analisar_texto_async(self, roteiro, criterios, prazo=None, ao_concluir=None, ao_parcial=None):
+        """Analisa um roteiro já em memória com os critérios informados (assíncrono - paralelo)"""
+        if not roteiro or not criterios:
             return None
-        
-        if not criterios_selecionados:
-            return None
-        
-        print(f"🚀 Iniciando análise paralela do roteiro com {len(criterios_selecionados)} critérios selecionados...")
-        
-        # Criar tasks para análise paralela
-        tasks = []
-        for i, criterio in enumerate(criterios_selecionados, 1):
-            titulo = criterio['titulo'] if isinstance(criterio, dict) else criterio[:50]
-            print(f"📋 Preparando análise do critério {i}/{len(criterios_selecionados)}: {titulo}...")
-            task = self.analisar_criterio_async(roteiro, criterio)
-            tasks.append((criterio, task))
-        
-        # Executar todas as análises em paralelo
-        print(f"⚡ Executando {len(tasks)} análises em paralelo...")
-        resultados = []
-        
-        for criterio, task in tasks:
-            resultado = await task
-            resultados.append({
-                'criterio': criterio,
-                'resultado': resultado
-            })
-        
+
+        print(f"🚀 Iniciando análise paralela do roteiro com {len(criterios)} critérios...")
+        with fase("analise", self.perfil):
+            resultados = await self._executar_criterios_async(roteiro, criterios, prazo, ao_concluir, ao_parcial)
         print("✅ Análise paralela concluída!")
         return resultados
 
-    def analisar_roteiro_completo(self, arquivo_roteiro, arquivo_criterios='criterios.txt'):
-        """Analisa o roteiro completo com todos os critérios"""
-        roteiro = self.ler_roteiro(arquivo_roteiro)
-        if not roteiro:
+    async def analisar_roteiro_completo_async(self, arquivo_roteiro, arquivo_criterios='criterios.txt', prazo=None, ao_concluir=None, ao_parcial=None):
+        """Analisa o roteiro completo com todos os critérios (assíncrono - paralelo)"""
+        # Arquivo lido aos poucos: os trechos são analisados conforme chegam
+        roteiro = self._ler_trechos_roteiro(arquivo_roteiro)
+        if roteiro is None:
             return None
-            
+
         criterios = self.ler_criterios(arquivo_criterios)
         if not criterios:
             return None
-        
-        resultados = []
-        
-        print(f"Iniciando análise do roteiro com {len(criterios)} critérios...")
-        
-        for i, criterio in enumerate(criterios, 1):
-            titulo = criterio['titulo'] if isinstance(criterio, dict) else criterio[:50]
-            print(f"Analisando critério {i}/{len(criterios)}: {titulo}...")
-            resultado = self.analisar_criterio(roteiro, criterio)
-            resultados.append({
-                'criterio': criterio,
-                'resultado': resultado
-            })
-        
+
+        print(f"🚀 Iniciando análise paralela do roteiro com {len(criterios)} critérios...")
+
+        # Executar todas as análises em paralelo
+        with fase("analise", self.perfil):
+            resultados = await self._executar_criterios_async(roteiro, criterios, prazo, ao_concluir, ao_parcial)
+
+        print("✅ Análise paralela concluída!")
         return resultados
+
+    def analisar_roteiro_completo(self, arquivo_roteiro, arquivo_criterios='criterios.txt', prazo=None, ao_concluir=None):
+        """Analisa o roteiro completo com todos os critérios, avisando ao_concluir(indice, resultado) a cada um"""
+        # Fachada síncrona: critérios em paralelo no event loop compartilhado, com o arquivo lido aos poucos
+        return executar_sincrono(self.analisar_roteiro_completo_async(arquivo_roteiro, arquivo_criterios, prazo, ao_concluir))
     
-    def gerar_relatorio(self, resultados, arquivo_roteiro):
-        """Gera um relatório final com todos os resultados"""
+    def gerar_relatorio(self, resultados, arquivo_roteiro, nome_arquivo=None, formato="texto", diario=None):
+        """Gera o relatório a partir do diário da análise (relatorios.py), gravando-o agora se não houver
+
+        nome_arquivo reescreve sempre o mesmo relatório; o diário (.jsonl) fica ao lado, com o mesmo nome.
+        """
+        from relatorios import EXTENSOES, DiarioRelatorio, renderizar
         if not resultados:
             return None
-            
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        nome_arquivo = f"relatorio_analise_{timestamp}.txt"
-        
-        with open(nome_arquivo, 'w', encoding='utf-8') as f:
-            f.write("="*80 + "\n")
-            f.write("RELATÓRIO DE ANÁLISE DE ROTEIRO\n")
-            f.write("="*80 + "\n\n")
-            f.write(f"Arquivo analisado: {arquivo_roteiro}\n")
-            f.write(f"Data da análise: {datetime.now().strftime('%d/%m/%Y %H:%M:%S')}\n")
-            f.write(f"Número de critérios analisados: {len(resultados)}\n\n")
-            
-            for i, resultado in enumerate(resultados, 1):
-                criterio = resultado['criterio']
-                titulo = criterio['titulo'] if isinstance(criterio, dict) else criterio
-                
-                f.write(f"CRITÉRIO {i}: {titulo}\n")
-                f.write("-" * 40 + "\n")
-                f.write("Análise:\n")
-                f.write(resultado['resultado'])
-                f.write("\n\n" + "="*80 + "\n\n")
         
-        return nome_arquivo
\ No newline at end of file
+        if nome_arquivo is None:
+            base = os.path.splitext(diario)[0] if diario else f"relatorio_analise_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            nome_arquivo = base + EXTENSOES[formato]
+        
+        with fase("relatorio", self.perfil):
+            if diario is None:
+                # Resultados já em memória (histórico, observação): o diário é gravado de uma vez
+                diario = os.path.splitext(nome_arquivo)[0] + ".jsonl"
+                with DiarioRelatorio(diario, arquivo_roteiro, self.modelo) as gravacao:
+                    for i, resultado in enumerate(resultados):
+                        gravacao.registrar(i, resultado)
+            return renderizar(diario, formato, nome_arquivo)
\ No newline at end of file
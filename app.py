@@ -1,102 +1,194 @@
 import streamlit as st
 import os
-import asyncio
-from analisador import AnalisadorRoteiro
+import time
+import uuid
+from analisador import ler_arquivo_criterios, classificar_resultado, descrever_opcoes_criterio
+from backends import carregar_backends
+from historico import HistoricoAnalises
+from tarefas import GerenciadorTarefas
+from pipeline import ESCALONADOR
+from modelos import COTACAO_DOLAR, capacidades_modelo, custo_requisicoes
+from perfil import fase, formatar_pilhas
+from ambiente import carregar_env
 
-def carregar_env():
-    """Carrega variáveis do arquivo .env"""
-    try:
-        with open('.env', 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
-    except FileNotFoundError:
-        pass
+@st.cache_data(show_spinner=False)
+def _ler_criterios_em_cache(arquivo, modificado_em):
+    """Lê e interpreta o arquivo de critérios (refeito apenas quando o arquivo muda)"""
+    return ler_arquivo_criterios(arquivo)
 
-def carregar_criterios():
+def carregar_criterios(arquivo='criterios.txt'):
     """Carrega critérios do arquivo criterios.txt"""
     try:
-        with open('criterios.txt', 'r', encoding='utf-8') as f:
-            linhas = [linha.strip() for linha in f.readlines()]
-        
-        criterios = []
-        i = 0
-        while i < len(linhas):
-            if linhas[i]:  # Linha não vazia (título)
-                titulo = linhas[i]
-                descricao = ""
-                i += 1
-                
-                # Ler descrição (próximas linhas até linha vazia ou fim)
-                while i < len(linhas) and linhas[i]:
-                    descricao += linhas[i] + " "
-                    i += 1
-                
-                criterios.append({
-                    'titulo': titulo,
-                    'descricao': descricao.strip()
-                })
-            else:
-                i += 1
-        
-        return criterios
+        return _ler_criterios_em_cache(arquivo, os.path.getmtime(arquivo))
     except FileNotFoundError:
         return []
 
+@st.cache_data(show_spinner=False, max_entries=32)
+def estatisticas_texto(texto):
+    """Conta caracteres, palavras e linhas do roteiro"""
+    return len(texto), len(texto.split()), len(texto.splitlines())
 
-def executar_analise_paralela(roteiro_content, modelo_gpt, criterios_selecionados, criterios_disponiveis):
-    """Executa análise paralela do roteiro apenas com critérios selecionados"""
-    # Inicializar analisador
-    try:
-        analisador = AnalisadorRoteiro(modelo=modelo_gpt.strip())
-    except Exception as e:
-        st.error(f"❌ Erro ao inicializar analisador: {e}")
-        st.stop()
-    
-    # Filtrar apenas critérios selecionados
-    criterios_para_analise = []
-    for i, criterio in enumerate(criterios_disponiveis):
-        if criterios_selecionados.get(i, False):
-            criterios_para_analise.append(criterio)
+@st.cache_resource
+def obter_historico():
+    """Histórico de análises compartilhado entre as sessões"""
+    return HistoricoAnalises()
+
+@st.cache_resource
+def obter_gerenciador():
+    """Tarefas de análise em segundo plano, pertencentes ao processo do servidor"""
+    return GerenciadorTarefas()
+
+def abrir_analise_salva(analise_id):
+    """Carrega uma análise do histórico na tela (callback dos botões de abrir)"""
+    analise = obter_historico().carregar(analise_id)
+    if not analise:
+        return
+    
+    st.session_state.ultimos_resultados = analise['resultados']
+    st.session_state.ultimo_log = analise['log_requisicoes']
+    st.session_state.ultimo_modelo = analise['modelo']
+    st.session_state.pop('ultimo_perfil', None)
+    st.session_state.roteiro_content = analise['roteiro']
+    # Remover estado do widget para a caixa de texto assumir o roteiro salvo
+    st.session_state.pop('roteiro_input', None)
+    st.session_state.pop('proxima_analise_criterios', None)
+    st.session_state.ja_analisou = True
+
+def filtrar_criterios(criterios_selecionados, criterios_disponiveis):
+    """Critérios marcados, na ordem do arquivo"""
+    return [criterio for i, criterio in enumerate(criterios_disponiveis) if criterios_selecionados.get(i, False)]
+
+def obter_sessao_id():
+    """Identificador da sessão (uma análise ativa e uma pré-análise por sessão)"""
+    if 'sessao_id' not in st.session_state:
+        st.session_state.sessao_id = uuid.uuid4().hex
+    return st.session_state.sessao_id
+
+def executar_analise_paralela(roteiro_content, modelo_gpt, criterios_selecionados, criterios_disponiveis, prazo=None, **opcoes_analisador):
+    """Submete a análise do roteiro (apenas critérios selecionados) como tarefa em segundo plano"""
+    criterios_para_analise = filtrar_criterios(criterios_selecionados, criterios_disponiveis)
     
     if not criterios_para_analise:
         st.error("❌ Nenhum critério selecionado!")
         st.stop()
     
-    # Executar análise paralela
-    with st.spinner(f"Analisando roteiro com {len(criterios_para_analise)} critérios..."):
-        # Criar um arquivo temporário para o roteiro
-        import tempfile
-        with tempfile.NamedTemporaryFile(mode='w', suffix='.txt', delete=False, encoding='utf-8') as f:
-            f.write(roteiro_content)
-            arquivo_temp = f.name
-        
-        try:
-            # Executar análise assíncrona apenas com critérios selecionados
-            resultados = asyncio.run(analisador.analisar_criterios_selecionados_async(arquivo_temp, criterios_para_analise))
-        finally:
-            # Limpar arquivo temporário
-            os.unlink(arquivo_temp)
+    try:
+        # Uma pré-análise do mesmo texto e critérios é aproveitada (o resultado pode já estar pronto)
+        tarefa = obter_gerenciador().submeter(
+            obter_sessao_id(),
+            roteiro_content,
+            criterios_para_analise,
+            modelo_gpt.strip(),
+            prazo=prazo,
+            historico=obter_historico(),
+            **opcoes_analisador
+        )
+    except Exception as e:
+        st.error(f"❌ Erro ao iniciar análise: {e}")
+        st.stop()
     
-    # Salvar resultados no session_state para persistir na interface
-    st.session_state.ultimos_resultados = resultados
-    st.session_state.ultimo_analisador = analisador
-    st.session_state.ultimo_modelo = modelo_gpt
+    # Apenas o identificador fica na sessão; o resultado é recolhido nos próximos reruns
+    st.session_state.tarefa_id = tarefa.id
+
+@st.fragment(run_every=1)
+def pre_analisar(roteiro, criterios, modelo, espera, orcamento, opcoes_analisador):
+    """Pré-analisa o roteiro depois de uma pausa na edição e mostra a situação (atualizado a cada segundo)"""
+    pausa = time.time() - st.session_state.get('ultima_edicao', 0)
+    if pausa < espera:
+        st.caption(f"🔮 A pré-análise começa após {espera} s sem edição")
+        return
+    
+    gerenciador = obter_gerenciador()
+    sessao = obter_sessao_id()
+    tarefa = gerenciador.especular(sessao, roteiro, criterios, modelo.strip(), orcamento, **opcoes_analisador)
+    if tarefa is None:
+        st.caption(f"🔮 Orçamento de pré-análise esgotado ({gerenciador.gasto_especulativo(sessao)} tokens em pré-análises descartadas)")
+    elif tarefa.estado == "concluida":
+        st.caption("🔮 Pré-análise pronta: o relatório aparece assim que você clicar em Analisar")
+    elif tarefa.estado == "cancelada":
+        st.caption("🔮 Pré-análise interrompida pelo orçamento de tokens")
+    elif tarefa.estado == "erro":
+        st.caption(f"🔮 Pré-análise falhou: {tarefa.erro}")
+    else:
+        concluidos, total = tarefa.progresso()
+        st.caption(f"🔮 Pré-analisando em segundo plano: {concluidos}/{total} critérios")
+
+def recolher_analise(tarefa):
+    """Copia o resultado de uma tarefa finalizada para o session_state"""
+    st.session_state.pop('tarefa_id', None)
+    
+    if tarefa.estado == "erro":
+        st.session_state.erro_analise = tarefa.erro
+        return
     
-    # Mostrar resultados
-    mostrar_resultados(resultados, analisador, modelo_gpt, criterios_disponiveis)
+    # Salvar resultados no session_state para persistir na interface
+    st.session_state.ultimos_resultados = tarefa.resultados
+    st.session_state.ultimo_log = tarefa.analisador.log_requisicoes
+    st.session_state.ultimo_modelo = tarefa.modelo
+    st.session_state.ultimo_perfil = tarefa.analisador.perfil  # None sem o modo de depuração
+    st.session_state.pop('proxima_analise_criterios', None)
+
+@st.fragment(run_every=1)
+def acompanhar_analise():
+    """Mostra o progresso da análise em segundo plano (atualizado a cada segundo, sem rerun do app)"""
+    tarefa = obter_gerenciador().obter(st.session_state.get('tarefa_id'))
+    if tarefa is None:
+        st.session_state.pop('tarefa_id', None)
+        st.warning("⚠️ A análise em segundo plano não está mais disponível. Analise novamente.")
+        return
+    
+    if not tarefa.ativa:
+        recolher_analise(tarefa)
+        st.rerun()
+    
+    concluidos, total = tarefa.progresso()
+    st.progress(concluidos / total, text=f"🔍 Analisando roteiro: {concluidos}/{total} critérios concluídos")
+    
+    # Situação de cada critério
+    icones = {"aprovado": "✅", "parcial": "⚠️", "nao_atende": "❌", "erro": "❗", "interrompido": "⏱️"}
+    linhas = []
+    escrevendo = []  # Critérios com a explicação chegando em streaming
+    for criterio, parcial, texto in zip(tarefa.criterios, tarefa.parciais, list(tarefa.textos_parciais)):
+        if parcial:
+            icone = icones[classificar_resultado(parcial['resultado'])]
+        elif texto:
+            icone = "✍️"
+            escrevendo.append((criterio['titulo'], texto))
+        else:
+            icone = "⏳"
+        linhas.append(f"{icone} {criterio['titulo']}")
+    st.caption("  \n".join(linhas))
+    
+    # Texto parcial de cada critério em andamento, até ele concluir
+    for titulo, texto in escrevendo:
+        st.markdown(f"**✍️ {titulo}**")
+        st.caption(texto)
+    
+    # Fila do escalonador, compartilhada por todas as sessões (e análises em lote) do servidor
+    fila = [
+        f"{classe}: {dados['na_fila']} na fila, {dados['em_execucao']} em execução, espera média {dados['espera_media']:.1f}s"
+        for classe, dados in ESCALONADOR.estatisticas().items()
+        if dados['na_fila'] or dados['em_execucao']
+    ]
+    if fila:
+        st.caption("⏳ Requisições ao modelo — " + " · ".join(fila))
+    
+    if tarefa.analisador.cancelado:
+        st.caption("🛑 Cancelando...")
+    elif st.button("🛑 Cancelar análise", key="cancelar_analise"):
+        tarefa.cancelar()
 
-def mostrar_resultados(resultados, analisador, modelo_gpt, criterios_disponiveis):
+def mostrar_resultados(resultados, log_requisicoes, modelo_gpt, criterios_disponiveis):
     """Mostra os resultados da análise"""
     st.success("✅ Análise concluída!")
     st.header("📊 Relatório de Análise")
     st.caption(f"Modelo usado: **{modelo_gpt}**")
     
-    # Contadores
-    aprovados = 0
+    # Dados derivados calculados uma única vez por execução
     total = len(resultados)
+    indice_por_titulo = {criterio['titulo']: idx for idx, criterio in enumerate(criterios_disponiveis)}
+    vereditos = [classificar_resultado(resultado['resultado']) for resultado in resultados]
+    aprovados = vereditos.count("aprovado")
     
     # Inicializar estado para próxima análise se não existir
     if 'proxima_analise_criterios' not in st.session_state:
@@ -105,74 +197,15 @@ def mostrar_resultados(resultados, analisador, modelo_gpt, criterios_disponiveis
     st.markdown("**📋 Resultados por critério:**")
     st.markdown("*Desmarque critérios aprovados ou marque os que precisam de nova análise*")
     
-    for i, resultado in enumerate(resultados, 1):
+    for i, (resultado, veredito) in enumerate(zip(resultados, vereditos), 1):
         criterio = resultado['criterio']
         titulo = criterio['titulo'] if isinstance(criterio, dict) else criterio
-        analise = resultado['resultado']
         
-        # Verificar se foi aprovado
-        foi_aprovado = "✅ APROVADO" in analise
-        if foi_aprovado:
-            aprovados += 1
-        
-        # Encontrar índice do critério na lista original
-        criterio_index = None
-        for idx, crit_original in enumerate(criterios_disponiveis):
-            if crit_original['titulo'] == titulo:
-                criterio_index = idx
-                break
-        
-        # Definir valor padrão para próxima análise
-        # Aprovados: desmarcados por padrão
-        # Reprovados: marcados por padrão
-        default_value = not foi_aprovado
-        
-        # Usar valor salvo se existir
-        if criterio_index is not None:
-            saved_value = st.session_state.proxima_analise_criterios.get(criterio_index, default_value)
-        else:
-            saved_value = default_value
-        
-        # Mostrar resultado com checkbox
-        col1, col2 = st.columns([0.1, 0.9])
+        # Critérios fora da lista original usam um ID especial baseado no título
+        criterio_index = indice_por_titulo.get(titulo, f"unknown_{abs(hash(titulo))}")
         
-        with col1:
-            # Sempre criar um checkbox com key única
-            if criterio_index is not None:
-                checkbox_key = f"prox_analise_{criterio_index}_{i}"
-                incluir_proxima = st.checkbox(
-                    "",
-                    value=saved_value,
-                    key=checkbox_key,
-                    help="Incluir na próxima análise"
-                )
-                st.session_state.proxima_analise_criterios[criterio_index] = incluir_proxima
-            else:
-                # Se não encontrou o critério, usar um ID único baseado no título
-                checkbox_key = f"prox_analise_unknown_{abs(hash(titulo))}_{i}"
-                incluir_proxima = st.checkbox(
-                    "",
-                    value=saved_value,
-                    key=checkbox_key,
-                    help="Incluir na próxima análise"
-                )
-                # Salvar usando um índice especial para critérios não encontrados
-                special_index = f"unknown_{abs(hash(titulo))}"
-                st.session_state.proxima_analise_criterios[special_index] = incluir_proxima
-        
-        with col2:
-            if foi_aprovado:
-                st.success(f"**{i}. {titulo}**")
-                st.write("✅ APROVADO")
-            else:
-                if "❌ NÃO ATENDE" in analise:
-                    st.error(f"**{i}. {titulo}**")
-                else:
-                    st.warning(f"**{i}. {titulo}**")
-                
-                st.write(analise)
-        
-        st.markdown("---")
+        mostrar_resultado_criterio(i, titulo, resultado['resultado'], veredito, criterio_index,
+                                   descrever_opcoes_criterio(criterio))
     
     # Resumo final
     st.header("📈 Resumo Final")
@@ -204,9 +237,7 @@ def mostrar_resultados(resultados, analisador, modelo_gpt, criterios_disponiveis
     
     # Indicar se há critérios para próxima análise
     if 'proxima_analise_criterios' in st.session_state:
-        criterios_marcados_prox = sum(1 for selecionado in st.session_state.proxima_analise_criterios.values() if selecionado)
-        total_criterios_prox = len(st.session_state.proxima_analise_criterios)
-        st.caption(f"📊 {criterios_marcados_prox}/{total_criterios_prox} critérios marcados para próxima análise")
+        contar_marcados_proxima_analise()
         
         # Flag para indicar que deve reanalizar
         if st.button("🔄 Analisar Novamente", type="secondary", use_container_width=True, key="reanalise_resultados"):
@@ -215,36 +246,163 @@ def mostrar_resultados(resultados, analisador, modelo_gpt, criterios_disponiveis
     else:
         st.info("ℹ️ Use os checkboxes acima para selecionar critérios e depois clique aqui para analisar novamente.")
     
+    mostrar_log_requisicoes(log_requisicoes, modelo_gpt)
+
+def contar_marcados_proxima_analise():
+    """Mostra quantos critérios estão marcados para a próxima análise"""
+    marcados = sum(1 for selecionado in st.session_state.proxima_analise_criterios.values() if selecionado)
+    total = len(st.session_state.proxima_analise_criterios)
+    st.caption(f"📊 {marcados}/{total} critérios marcados para próxima análise")
+
+@st.fragment
+def mostrar_resultado_criterio(i, titulo, analise, veredito, criterio_index, opcoes=""):
+    """Mostra o resultado de um critério; o checkbox reexecuta apenas este fragmento"""
+    # Definir valor padrão para próxima análise
+    # Aprovados: desmarcados por padrão
+    # Reprovados: marcados por padrão
+    foi_aprovado = veredito == "aprovado"
+    saved_value = st.session_state.proxima_analise_criterios.get(criterio_index, not foi_aprovado)
+    
+    # Mostrar resultado com checkbox
+    col1, col2 = st.columns([0.1, 0.9])
+    
+    with col1:
+        incluir_proxima = st.checkbox(
+            "Incluir na próxima análise",
+            value=saved_value,
+            key=f"prox_analise_{criterio_index}_{i}",
+            help="Incluir na próxima análise",
+            label_visibility="collapsed"
+        )
+        st.session_state.proxima_analise_criterios[criterio_index] = incluir_proxima
+        
+        # O resumo da seção de reanálise só é refeito no próximo rerun completo
+        if incluir_proxima != saved_value:
+            marcados = sum(1 for selecionado in st.session_state.proxima_analise_criterios.values() if selecionado)
+            st.toast(f"📊 {marcados}/{len(st.session_state.proxima_analise_criterios)} critérios marcados para próxima análise")
+    
+    with col2:
+        if foi_aprovado:
+            st.success(f"**{i}. {titulo}**")
+            st.write("✅ APROVADO")
+        elif veredito == "interrompido":
+            st.info(f"**{i}. {titulo}**")
+            st.write(analise)
+        else:
+            if veredito == "nao_atende":
+                st.error(f"**{i}. {titulo}**")
+            else:
+                st.warning(f"**{i}. {titulo}**")
+            
+            st.write(analise)
+        
+        # Opções próprias do critério (modelo, tokens, temperatura, trecho) definidas no criterios.txt
+        if opcoes:
+            st.caption(f"⚙️ {opcoes}")
+    
+    st.markdown("---")
+
+def mostrar_perfil(perfil):
+    """Mostra a divisão do tempo da análise por fase e o arquivo para flame graph"""
+    with st.expander("🐞 Perfil da análise", expanded=False):
+        st.caption(f"{perfil.duracao_total():.2f}s do início ao fim · fases em paralelo (critérios, trechos) "
+                   "se sobrepõem, então o tempo somado pode passar do total · 'exibicao' soma todos os reruns")
+        st.dataframe([
+            {'Fase': nome, 'Chamadas': dados['chamadas'], 'Somado (s)': round(dados['total'], 3),
+             'Média (s)': round(dados['media'], 3), 'Máximo (s)': round(dados['maxima'], 3)}
+            for nome, dados in perfil.resumo().items()
+        ], hide_index=True)
+        st.download_button("🔥 Baixar pilhas (flame graph)", formatar_pilhas(perfil.pilhas()), file_name="perfil_analise.folded",
+                           help="Formato de pilhas colapsadas: abra em speedscope.app ou use flamegraph.pl")
+
+def mostrar_capacidades_personalizado(modelo):
+    """Mostra as capacidades do modelo digitado e permite informá-las se ele não estiver no registro
+
+    Os valores informados ficam na sessão (capacidades_modelos) e não mudam o registro do processo.
+    """
+    if 'capacidades_modelos' not in st.session_state:
+        st.session_state.capacidades_modelos = {}
+    capacidades = capacidades_modelo(modelo)
+    resumo = st.empty()  # Preenchido depois dos campos, com os valores informados
+    with st.expander("⚙️ Capacidades do modelo", expanded=not capacidades.conhecido):
+        st.caption("Usadas para o tamanho dos trechos, o limite de saída e o custo estimado")
+        janela = st.number_input("Janela de contexto (tokens)", min_value=0, step=1024,
+                                 value=capacidades.janela_contexto or 0, key=f"janela_{modelo}",
+                                 help="0 = desconhecida (trechos de tamanho padrão)")
+        max_saida = st.number_input("Saída máxima (tokens)", min_value=0, step=256,
+                                    value=capacidades.max_saida or 0, key=f"saida_{modelo}")
+        col1, col2, col3 = st.columns(3)
+        with col1:
+            preco_entrada = st.number_input("US$/1M entrada", min_value=0.0, format="%.3f",
+                                            value=float(capacidades.preco_entrada or 0), key=f"entrada_{modelo}")
+        with col2:
+            preco_cache = st.number_input("US$/1M cache", min_value=0.0, format="%.3f",
+                                          value=float(capacidades.preco_cache or 0), key=f"cache_{modelo}")
+        with col3:
+            preco_saida = st.number_input("US$/1M saída", min_value=0.0, format="%.3f",
+                                          value=float(capacidades.preco_saida or 0), key=f"saida_preco_{modelo}")
+
+    informadas = {
+        'janela_contexto': janela or None,
+        'max_saida': max_saida or None,
+        'preco_entrada': preco_entrada or None,
+        'preco_cache': preco_cache or None,
+        'preco_saida': preco_saida or None,
+        'requisicoes_por_minuto': capacidades.requisicoes_por_minuto,
+        'suporta_json': capacidades.suporta_json
+    }
+    atuais = {campo: getattr(capacidades, campo) for campo in informadas}
+    if informadas != atuais:
+        st.session_state.capacidades_modelos[modelo] = informadas
+    else:
+        st.session_state.capacidades_modelos.pop(modelo, None)
+    resumo.caption(capacidades_modelo(modelo, st.session_state.capacidades_modelos).resumo())
+
+def mostrar_log_requisicoes(log_requisicoes, modelo_gpt):
+    """Mostra o log de requisições, métricas de uso e recomendações"""
     # Seção de logs das requisições
     st.markdown("---")
     st.header("📊 Log de Requisições à API")
     
     # Calcular estatísticas totais
-    total_tokens = sum(log.get('tokens_total', 0) for log in analisador.log_requisicoes)
-    total_requisicoes = len(analisador.log_requisicoes)
+    total_tokens = sum(log.get('tokens_total', 0) for log in log_requisicoes)
+    total_requisicoes = sum(1 for log in log_requisicoes if not log.get('reaproveitado'))
+    # Requisições duplicadas (hedging) custaram uma chamada a mais
+    total_duplicadas = sum(1 for log in log_requisicoes if log.get('duplicada'))
+    total_requisicoes += total_duplicadas
     
     # Métricas de uso
     col1, col2, col3 = st.columns(3)
     with col1:
-        st.metric("Total de Requisições", total_requisicoes)
+        st.metric("Total de Requisições", total_requisicoes,
+                  help=f"Inclui {total_duplicadas} duplicata(s) de requisições lentas" if total_duplicadas else None)
     with col2:
         st.metric("Total de Tokens", total_tokens)
     with col3:
-        # Estimativa de custo (aproximada)
-        if "gpt-4o" in modelo_gpt and "mini" not in modelo_gpt:
-            custo_usd = (total_tokens / 1000) * 0.015  # $0.015 por 1K tokens
-        elif "gpt-4o-mini" in modelo_gpt:
-            custo_usd = (total_tokens / 1000) * 0.0015  # $0.0015 por 1K tokens
-        elif "gpt-4" in modelo_gpt:
-            custo_usd = (total_tokens / 1000) * 0.03  # $0.03 por 1K tokens
-        elif "gpt-3.5-turbo" in modelo_gpt:
-            custo_usd = (total_tokens / 1000) * 0.002  # $0.002 por 1K tokens
-        else:
-            custo_usd = (total_tokens / 1000) * 0.01  # Estimativa genérica
-        
-        # Converter para reais (USD * 6)
-        custo_brl = custo_usd * 6
-        st.metric("Custo Estimado", f"R$ {custo_brl:.3f}")
+        # Estimativa de custo pelos preços do registro de modelos (entrada, cache de prompt e saída)
+        custo_usd, sem_preco = custo_requisicoes(log_requisicoes, st.session_state.get('capacidades_modelos'))
+        custo_brl = custo_usd * COTACAO_DOLAR
+        st.metric("Custo Estimado", f"R$ {custo_brl:.3f}",
+                  help=f"Sem preço conhecido (fora da soma): {', '.join(sem_preco)}" if sem_preco else None)
+    
+    # Divisão entre as chaves do pool (só aparece com mais de uma chave)
+    por_chave = {}
+    for log in log_requisicoes:
+        if log.get('chave'):
+            requisicoes, tokens = por_chave.get(log['chave'], (0, 0))
+            por_chave[log['chave']] = (requisicoes + 1, tokens + log.get('tokens_total', 0))
+    if por_chave:
+        st.caption("🔑 " + " · ".join(
+            f"{chave}: {requisicoes} requisição(ões), {tokens} tokens"
+            for chave, (requisicoes, tokens) in sorted(por_chave.items())
+        ))
+    
+    # Streaming: tempo até o primeiro token e respostas encerradas assim que vieram aprovadas
+    ttfts = [log['ttft'] for log in log_requisicoes if 'ttft' in log]
+    if ttfts:
+        interrompidas = sum(1 for log in log_requisicoes if log.get('interrompida'))
+        st.caption(f"⚡ Primeiro token em {sum(ttfts) / len(ttfts):.2f}s em média · "
+                   f"{interrompidas} resposta(s) encerrada(s) no \"✅ APROVADO\"")
     
     # Recomendações de otimização
     st.subheader("💡 Recomendações de Otimização")
@@ -285,9 +443,6 @@ def main():
             help="Sua chave da API OpenAI"
         )
         
-        if api_key:
-            os.environ['OPENAI_API_KEY'] = api_key
-        
         st.markdown("---")
         
         # Seletor de modelo GPT
@@ -318,6 +473,7 @@ def main():
                 st.info("🚀 **GPT-4-turbo**: Versão anterior do GPT-4")
             else:
                 st.info("💰 **GPT-3.5-turbo**: Mais econômico")
+            st.caption(capacidades_modelo(modelo_gpt).resumo())
         else:
             modelo_gpt = st.text_input(
                 "Digite o modelo:",
@@ -328,6 +484,7 @@ def main():
             
             if modelo_gpt:
                 st.info(f"🛠️ **Modelo Personalizado**: {modelo_gpt}")
+                mostrar_capacidades_personalizado(modelo_gpt.strip())
             else:
                 st.warning("⚠️ Digite um modelo válido")
             
@@ -348,6 +505,116 @@ def main():
                 st.markdown("- `gpt-4-32k` - Contexto muito grande")
                 st.markdown("- `gpt-3.5-turbo-instruct` - Versão instruct")
         
+        # Modo de avaliação em duas fases
+        duas_fases = st.checkbox(
+            "⚡ Veredito primeiro",
+            value=False,
+            help="Pede primeiro apenas o veredito (resposta curtíssima) e só solicita explicação e sugestões para critérios não aprovados"
+        )
+        
+        reaproveitar_similares = st.checkbox(
+            "♻️ Reaproveitar trechos quase idênticos",
+            value=False,
+            help="Trechos muito parecidos com trechos já aprovados (ex: correção de vírgula, chamadas padrão) reaproveitam o veredito sem nova requisição"
+        )
+        
+        duplicar_lentas = st.checkbox(
+            "🐇 Duplicar requisições lentas",
+            value=False,
+            help="Quando uma requisição demora mais que 95% das anteriores, envia uma cópia e usa a primeira resposta (no máximo 10% de requisições extras)"
+        )
+        
+        perfilar = st.checkbox(
+            "🐞 Perfil da análise (depuração)",
+            value=False,
+            help="Mede o tempo de cada fase (leitura, trechos, fila, modelo, exibição) e mostra a divisão abaixo do relatório"
+        )
+        
+        opcoes_analisador = {'duas_fases': duas_fases, 'duplicar_lentas': duplicar_lentas}
+        if api_key:
+            # Só desta sessão (o ambiente é do processo todo) e vale mesmo com um pool em OPENAI_API_KEYS
+            opcoes_analisador['api_key'] = api_key
+        if perfilar:
+            opcoes_analisador['perfilar'] = True
+        if st.session_state.get('capacidades_modelos'):
+            # Capacidades informadas para o modelo personalizado (só desta sessão)
+            opcoes_analisador['capacidades_modelos'] = dict(st.session_state.capacidades_modelos)
+        if reaproveitar_similares:
+            opcoes_analisador['limiar_similaridade'] = st.slider(
+                "Similaridade mínima",
+                min_value=0.80,
+                max_value=1.0,
+                value=0.90,
+                step=0.01,
+                help="Quanto maior, mais parecido o trecho precisa ser para reaproveitar o veredito"
+            )
+            opcoes_analisador['reverificar_trechos'] = st.checkbox(
+                "Reverificar só o que mudou",
+                value=False,
+                help="Envia ao modelo apenas as regiões alteradas (com um pouco de contexto) em vez de reaproveitar direto"
+            )
+        
+        prazo_analise = st.number_input(
+            "⏱️ Prazo máximo da análise (segundos)",
+            min_value=0,
+            value=120,
+            step=10,
+            help="Critérios que não terminarem no prazo aparecem como tempo esgotado (0 = sem prazo)"
+        )
+        
+        pre_analise = st.checkbox(
+            "🔮 Pré-analisar enquanto edito",
+            value=False,
+            help="Após uma pausa na edição, analisa os critérios selecionados em segundo plano; o clique em Analisar aproveita o que já estiver pronto"
+        )
+        if pre_analise:
+            espera_pre_analise = st.number_input(
+                "Pausa na edição (segundos)",
+                min_value=1,
+                value=5,
+                step=1
+            )
+            orcamento_pre_analise = st.number_input(
+                "Orçamento da pré-análise (tokens)",
+                min_value=0,
+                value=50000,
+                step=5000,
+                help="Máximo de tokens que pré-análises descartadas (o texto mudou depois) podem gastar nesta sessão"
+            )
+        
+        st.markdown("---")
+        
+        # Histórico de análises anteriores
+        with st.expander("📚 Histórico de Análises", expanded=False):
+            termo_busca = st.text_input(
+                "Buscar no histórico:",
+                placeholder="Título do roteiro ou problema apontado",
+                key="busca_historico"
+            )
+            
+            try:
+                historico = obter_historico()
+                analises_salvas = historico.pesquisar(termo_busca) if termo_busca else historico.listar(limite=10)
+            except Exception as e:
+                st.error(f"❌ Erro ao ler histórico: {e}")
+                analises_salvas = []
+            
+            if not analises_salvas:
+                st.caption("Nenhuma análise encontrada.")
+            
+            for analise in analises_salvas:
+                st.markdown(f"**{analise['titulo']}**")
+                st.caption(
+                    f"{analise['criado_em'].replace('T', ' ')} · {analise['modelo']} · "
+                    f"{analise['aprovados']}/{analise['num_criterios']} aprovados"
+                )
+                st.button(
+                    "📂 Abrir",
+                    key=f"abrir_historico_{analise['id']}",
+                    on_click=abrir_analise_salva,
+                    args=(analise['id'],)
+                )
+        
         st.markdown("---")
         st.markdown("### 📊 Como usar:")
         st.markdown("1. Insira sua chave OpenAI")
@@ -357,8 +624,8 @@ def main():
         st.markdown("5. Veja o relatório e edite o texto")
         st.markdown("6. Analise novamente para refinar")
     
-    # Verificar se API key está configurada
-    if not os.getenv('OPENAI_API_KEY'):
+    # Verificar se há chave para os backends usados (barra lateral, .env, pool ou backends.json)
+    if carregar_backends(api_key=api_key or None).backends_sem_chave():
         st.error("❌ Configure sua chave OpenAI API na barra lateral!")
         st.stop()
     
@@ -399,18 +666,43 @@ E aí, gostaram? Deixem um like e se inscrevam!"""
     # Atualizar session state
     st.session_state.roteiro_content = roteiro_content
     
+    # Momento da última edição (a pré-análise espera uma pausa)
+    if roteiro_content != st.session_state.get('roteiro_editado'):
+        st.session_state.roteiro_editado = roteiro_content
+        st.session_state.ultima_edicao = time.time()
+        # A pré-análise do texto anterior para já, sem esperar a pausa
+        obter_gerenciador().descartar_especulativa(obter_sessao_id(), roteiro_content)
+    
     # Mostrar estatísticas do roteiro
     if roteiro_content:
+        caracteres, palavras, linhas = estatisticas_texto(roteiro_content)
         col1, col2, col3 = st.columns(3)
         with col1:
-            st.metric("Caracteres", len(roteiro_content))
+            st.metric("Caracteres", caracteres)
         with col2:
-            palavras = len(roteiro_content.split())
             st.metric("Palavras", palavras)
         with col3:
-            linhas = len(roteiro_content.splitlines())
             st.metric("Linhas", linhas)
         
+        # Avisar se este roteiro já foi analisado com o mesmo modelo
+        if not st.session_state.get('ja_analisou', False):
+            try:
+                analise_salva = obter_historico().buscar_por_roteiro(roteiro_content, modelo_gpt.strip())
+            except Exception:
+                analise_salva = None
+            
+            if analise_salva:
+                st.info(
+                    f"📚 Este roteiro já foi analisado com **{analise_salva['modelo']}** em "
+                    f"{analise_salva['criado_em'].replace('T', ' ')}."
+                )
+                st.button(
+                    "📂 Abrir análise salva",
+                    key="abrir_analise_roteiro",
+                    on_click=abrir_analise_salva,
+                    args=(analise_salva['id'],)
+                )
+        
         # Mostrar seleção de critérios apenas se nunca foi analisado antes
         ja_analisou = st.session_state.get('ja_analisou', False)
         mostrar_criterios = not ja_analisou
@@ -451,8 +743,10 @@ E aí, gostaram? Deixem um like e se inscrevam!"""
                 key = f"criterio_{i}"
                 default_value = st.session_state.criterios_selecionados.get(i, True)
                 
+                # Opções próprias do critério aparecem ao lado do título
+                opcoes = descrever_opcoes_criterio(criterio)
                 selecionado = st.checkbox(
-                    titulo,
+                    f"{titulo} — `{opcoes}`" if opcoes else titulo,
                     value=default_value,
                     key=key,
                     help=descricao if descricao else None
@@ -469,6 +763,18 @@ E aí, gostaram? Deixem um like e se inscrevam!"""
             
             st.caption(f"📊 {criterios_marcados}/{total_criterios} critérios selecionados")
             
+            # Pré-análise em segundo plano enquanto não há análise pedida
+            em_analise = st.session_state.get('analisando', False) or bool(st.session_state.get('tarefa_id'))
+            if pre_analise and criterios_marcados and not em_analise:
+                pre_analisar(
+                    roteiro_content,
+                    filtrar_criterios(criterios_selecionados, criterios_disponiveis),
+                    modelo_gpt,
+                    espera_pre_analise,
+                    orcamento_pre_analise,
+                    opcoes_analisador
+                )
+            
             # Verificar se deve reanalizar (flag setado pelos resultados)
             deve_reanalizar = st.session_state.get('reanalizar', False)
             if deve_reanalizar:
@@ -488,14 +794,14 @@ E aí, gostaram? Deixem um like e se inscrevam!"""
                     criterios_marcados = sum(1 for selecionado in criterios_selecionados.values() if selecionado)
                 
                 if criterios_marcados > 0:
-                    executar_analise_paralela(roteiro_content, modelo_gpt, criterios_selecionados, criterios_disponiveis)
+                    executar_analise_paralela(roteiro_content, modelo_gpt, criterios_selecionados, criterios_disponiveis, prazo_analise or None, **opcoes_analisador)
             
             # Botões para analisar
             col1, col2 = st.columns(2)
             
             with col1:
                 # Verificar se está analisando para desabilitar botão
-                analisando = st.session_state.get('analisando', False)
+                analisando = st.session_state.get('analisando', False) or bool(st.session_state.get('tarefa_id'))
                 botao_text = "⏳ Analisando..." if analisando else "🔍 Analisar Roteiro"
                 
                 if st.button(botao_text, type="primary", use_container_width=True, disabled=analisando):
@@ -516,7 +822,10 @@ E aí, gostaram? Deixem um like e se inscrevam!"""
             st.markdown("---")
             if st.button("🔄 Nova Análise com Critérios Diferentes", type="secondary", use_container_width=True):
                 # Limpar TODOS os flags para voltar ao estado inicial
-                keys_to_delete = ['ultimos_resultados', 'analisando', 'ja_analisou', 'proxima_analise_criterios']
+                tarefa = obter_gerenciador().obter(st.session_state.get('tarefa_id'))
+                if tarefa and tarefa.ativa:
+                    tarefa.cancelar()
+                keys_to_delete = ['ultimos_resultados', 'analisando', 'ja_analisou', 'proxima_analise_criterios', 'tarefa_id']
                 for key in keys_to_delete:
                     if key in st.session_state:
                         del st.session_state[key]
@@ -537,7 +846,7 @@ E aí, gostaram? Deixem um like e se inscrevam!"""
                 if criterios_marcados > 0:
                     # Limpar flag de análise antes de executar
                     st.session_state.analisando = False
-                    executar_analise_paralela(roteiro_content, modelo_gpt, criterios_selecionados, criterios_disponiveis)
+                    executar_analise_paralela(roteiro_content, modelo_gpt, criterios_selecionados, criterios_disponiveis, prazo_analise or None, **opcoes_analisador)
                 else:
                     # Se não há critérios selecionados, limpar flag
                     st.session_state.analisando = False
@@ -549,6 +858,15 @@ E aí, gostaram? Deixem um like e se inscrevam!"""
     else:
         st.warning("⚠️ Digite ou cole seu roteiro para começar a análise!")
     
+    # Acompanhar análise em segundo plano (os resultados anteriores ficam ocultos)
+    if st.session_state.get('tarefa_id'):
+        st.markdown("---")
+        acompanhar_analise()
+        return
+    
+    if 'erro_analise' in st.session_state:
+        st.error(f"❌ Erro na análise: {st.session_state.pop('erro_analise')}")
+    
     # Mostrar resultados salvos se existirem
     if 'ultimos_resultados' in st.session_state and st.session_state.ultimos_resultados:
         st.markdown("---")
@@ -558,12 +876,16 @@ E aí, gostaram? Deixem um like e se inscrevam!"""
         else:
             try:
                 criterios_para_resultados = carregar_criterios()
-                mostrar_resultados(
-                    st.session_state.ultimos_resultados, 
-                    st.session_state.ultimo_analisador, 
-                    st.session_state.ultimo_modelo, 
-                    criterios_para_resultados
-                )
+                perfil = st.session_state.get('ultimo_perfil')
+                with fase("exibicao", perfil):
+                    mostrar_resultados(
+                        st.session_state.ultimos_resultados, 
+                        st.session_state.get('ultimo_log', []), 
+                        st.session_state.ultimo_modelo, 
+                        criterios_para_resultados
+                    )
+                if perfil:
+                    mostrar_perfil(perfil)
             except Exception as e:
                 st.error(f"❌ Erro ao mostrar resultados: {e}")
 
@@ -0,0 +1,286 @@
+import os
+import json
+import time
+import asyncio
+import weakref
+import threading
+from urllib.parse import urlparse
+
+ARQUIVO_BACKENDS = 'backends.json'
+VARIAVEL_CHAVES = 'OPENAI_API_KEYS'  # Várias chaves da OpenAI separadas por vírgula (pool)
+
+# Erros que são culpa da chave, não da requisição (comparados pelo nome, sem importar o pacote openai)
+ERROS_AUTENTICACAO = {"AuthenticationError", "PermissionDeniedError"}
+
+class SemChavesDisponiveis(Exception):
+    """Todas as chaves do backend foram descartadas (ex: revogadas ou sem permissão)"""
+
+class ChaveAPI:
+    """Uma credencial do pool de um backend, com limites, saúde e uso próprios
+
+    Após um 429 a chave fica em espera (Retry-After ou espera exponencial); após um erro de
+    autenticação ou permissão ela é descartada. Limites não informados herdam os do backend.
+    """
+
+    def __init__(self, api_key=None, api_key_env=None, organizacao=None, nome=None,
+                 max_conexoes=None, requisicoes_por_minuto=None):
+        self.api_key = api_key
+        self.api_key_env = api_key_env  # Variável de ambiente com a chave (alternativa a api_key)
+        self.organizacao = organizacao
+        self.nome = nome  # Exibido no log e no uso (nunca a chave em si)
+        self.max_conexoes = max_conexoes
+        self.requisicoes_por_minuto = requisicoes_por_minuto
+        self.em_uso = 0
+        self.bloqueada_ate = 0.0  # time.monotonic até quando a chave está em espera
+        self.limites_seguidos = 0  # 429 consecutivos (aumenta a espera)
+        self.descartada = None  # Motivo do descarte
+        self.uso = {'requisicoes': 0, 'erros': 0, 'limites_taxa': 0,
+                    'tokens_input': 0, 'tokens_output': 0, 'tokens_total': 0}
+        self._proximo_horario = 0.0  # Espaçamento de requisicoes_por_minuto
+
+    @classmethod
+    def de_config(cls, config):
+        """Aceita a chave como texto, dicionário (ex: entrada de backends.json) ou ChaveAPI"""
+        if isinstance(config, cls):
+            return config
+        if isinstance(config, str):
+            return cls(api_key=config)
+        return cls(**config)
+
+    def disponivel(self, agora, limite):
+        return not self.descartada and self.bloqueada_ate <= agora and self.em_uso < limite
+
+    def resumo(self):
+        """Estado e uso da chave, para exibição"""
+        restante = self.bloqueada_ate - time.monotonic()
+        if self.descartada:
+            estado = f"descartada ({self.descartada})"
+        elif restante > 0:
+            estado = f"em espera ({restante:.0f}s)"
+        else:
+            estado = "ativa"
+        return {'nome': self.nome, 'estado': estado, 'em_uso': self.em_uso, **self.uso}
+
+class BackendLLM:
+    """Servidor compatível com a API da OpenAI (a própria OpenAI, llama.cpp, vLLM...)"""
+
+    def __init__(self, nome='openai', base_url=None, api_key=None, api_key_env='OPENAI_API_KEY',
+                 max_conexoes=20, timeout=60, max_tentativas=2, requisicoes_por_minuto=None,
+                 mapa_modelos=None, suporta_json=True, suporta_streaming=True, chaves=None):
+        self.nome = nome
+        self.base_url = base_url  # None = endpoint público da OpenAI
+        self.api_key = api_key
+        self.api_key_env = api_key_env  # Variável de ambiente usada se api_key não for informada
+        self.max_conexoes = max_conexoes  # Requisições simultâneas por chave
+        self.timeout = timeout
+        self.max_tentativas = max_tentativas  # Novas tentativas em erros transitórios (feitas pelo pipeline)
+        self.requisicoes_por_minuto = requisicoes_por_minuto  # None = sem limite de taxa
+        self.mapa_modelos = mapa_modelos or {}  # Modelo pedido -> nome do modelo neste servidor
+        self.suporta_json = suporta_json
+        self.suporta_streaming = suporta_streaming
+        # Pool de credenciais; sem chaves, uma só (api_key ou a variável de ambiente)
+        self.chaves = [ChaveAPI.de_config(chave) for chave in chaves or [{}]]
+        for i, chave in enumerate(self.chaves):
+            chave.nome = chave.nome or (f"{nome}-{i + 1}" if len(self.chaves) > 1 else nome)
+        self._client = None
+        self._lock = threading.Lock()
+        self._por_loop = weakref.WeakKeyDictionary()  # Event loop -> {chave: cliente assíncrono}
+
+    @classmethod
+    def de_config(cls, nome, config):
+        """Cria o backend a partir de um dicionário (ex: uma entrada de backends.json)"""
+        return cls(nome=nome, **config)
+
+    def nome_modelo(self, modelo):
+        """Traduz o nome do modelo para o nome usado por este servidor"""
+        return self.mapa_modelos.get(modelo, modelo)
+
+    def _opcoes_cliente(self, chave=None):
+        """Parâmetros comuns aos clientes síncrono e assíncrono (da chave informada ou da primeira)"""
+        chave = chave or self.chaves[0]
+        api_key = chave.api_key or (chave.api_key_env and os.getenv(chave.api_key_env))
+        opcoes = {
+            'api_key': api_key or self.api_key or os.getenv(self.api_key_env) or 'sem-chave',
+            'timeout': self.timeout,
+            'max_retries': 0  # As retentativas ficam no pipeline, que respeita o prazo da análise
+        }
+        if chave.organizacao:
+            opcoes['organization'] = chave.organizacao
+        if self.base_url:
+            opcoes['base_url'] = self.base_url
+        return opcoes
+
+    @property
+    def client(self):
+        """Cliente síncrono (o pacote openai só é importado aqui)"""
+        with self._lock:
+            if self._client is None:
+                import openai
+                self._client = openai.OpenAI(**self._opcoes_cliente())
+            return self._client
+
+    def cliente_async(self, chave=None):
+        """Cliente assíncrono da chave no event loop atual (não podem ser compartilhados entre loops)"""
+        chave = chave or self.chaves[0]
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            clientes = self._por_loop.setdefault(loop, {})
+            if chave not in clientes:
+                import openai
+                clientes[chave] = openai.AsyncOpenAI(**self._opcoes_cliente(chave))
+            return clientes[chave]
+
+    @property
+    def async_client(self):
+        """Cliente assíncrono do event loop atual"""
+        return self.cliente_async()
+
+    @property
+    def tem_credenciais(self):
+        """Há alguma chave configurada (servidores locais, com base_url, podem não precisar de chave)"""
+        if self.base_url:
+            return True
+        return bool(self.api_key or os.getenv(self.api_key_env) or any(
+            chave.api_key or (chave.api_key_env and os.getenv(chave.api_key_env)) for chave in self.chaves
+        ))
+
+    @property
+    def local(self):
+        """Servidor nesta máquina (ex: llama.cpp em 127.0.0.1): as requisições não são cobradas"""
+        if not self.base_url:
+            return False
+        host = urlparse(self.base_url).hostname or ""
+        return host in ("localhost", "::1") or host.startswith("127.")
+
+    @property
+    def capacidade(self):
+        """Requisições simultâneas somando as chaves não descartadas"""
+        return sum(chave.max_conexoes or self.max_conexoes for chave in self.chaves if not chave.descartada) or 1
+
+    async def reservar_chave(self):
+        """Escolhe a chave menos ocupada entre as disponíveis, esperando se todas estiverem cheias ou em espera"""
+        while True:
+            with self._lock:
+                agora = time.monotonic()
+                candidatas = [
+                    chave for chave in self.chaves
+                    if chave.disponivel(agora, chave.max_conexoes or self.max_conexoes)
+                ]
+                if candidatas:
+                    # A que fica livre antes (limite de taxa); no empate, a menos ocupada e a menos usada
+                    chave = min(candidatas, key=lambda c: (
+                        max(c._proximo_horario, agora), c.em_uso / (c.max_conexoes or self.max_conexoes),
+                        c.uso['requisicoes'] + c.uso['erros']
+                    ))
+                    chave.em_uso += 1
+                    espera = 0.0
+                    por_minuto = chave.requisicoes_por_minuto
+                    if por_minuto:
+                        horario = max(agora, chave._proximo_horario)
+                        chave._proximo_horario = horario + 60 / por_minuto
+                        espera = horario - agora
+                    break
+                validas = [chave for chave in self.chaves if not chave.descartada]
+                if not validas:
+                    raise SemChavesDisponiveis(f"Nenhuma chave válida no backend {self.nome}: " + "; ".join(
+                        f"{chave.nome} {chave.descartada}" for chave in self.chaves))
+                # Espera a primeira chave sair da espera (ou uma vaga abrir)
+                proxima = min(chave.bloqueada_ate for chave in validas) - agora
+            await asyncio.sleep(min(max(proxima, 0.05), 1.0))
+
+        if espera > 0:
+            try:
+                await asyncio.sleep(espera)
+            except asyncio.CancelledError:
+                self.liberar_chave(chave)
+                raise
+        return chave
+
+    def liberar_chave(self, chave, uso=None):
+        """Devolve a vaga da chave e contabiliza os tokens da resposta"""
+        with self._lock:
+            chave.em_uso -= 1
+            if uso is not None:
+                chave.limites_seguidos = 0
+                chave.uso['requisicoes'] += 1
+                for campo in ('tokens_input', 'tokens_output', 'tokens_total'):
+                    chave.uso[campo] += uso[campo]
+
+    def registrar_erro(self, chave, erro):
+        """Atualiza a saúde da chave; devolve True se o erro foi da chave e outra pode ser tentada"""
+        status = getattr(erro, 'status_code', None)
+        nome_erro = type(erro).__name__
+        with self._lock:
+            chave.uso['erros'] += 1
+            if nome_erro in ERROS_AUTENTICACAO or status in (401, 403):
+                chave.descartada = f"{status or nome_erro}"
+            elif nome_erro == "RateLimitError" or status == 429:
+                chave.uso['limites_taxa'] += 1
+                agora = time.monotonic()
+                try:
+                    retry_after = float(erro.response.headers.get('retry-after'))
+                except (AttributeError, TypeError, ValueError):
+                    retry_after = None
+                if chave.bloqueada_ate > agora:
+                    # Requisições enviadas antes da espera começar: a mesma rajada, a espera não cresce
+                    if retry_after is not None:
+                        chave.bloqueada_ate = max(chave.bloqueada_ate, agora + retry_after)
+                else:
+                    chave.limites_seguidos += 1
+                    espera = retry_after if retry_after is not None else min(2 ** chave.limites_seguidos, 60)
+                    chave.bloqueada_ate = agora + espera
+            else:
+                return False
+            agora = time.monotonic()
+            return any(not outra.descartada and outra.bloqueada_ate <= agora for outra in self.chaves)
+
+    def uso_chaves(self):
+        """Estado e uso acumulado de cada chave do pool"""
+        with self._lock:
+            return [chave.resumo() for chave in self.chaves]
+
+class RoteadorBackends:
+    """Escolhe o backend de cada critério (pelo ID do critério) com um backend padrão"""
+
+    def __init__(self, backends=None, roteamento=None, padrao='openai'):
+        self.backends = backends or {'openai': BackendLLM()}
+        self.roteamento = roteamento or {}  # ID do critério -> nome do backend
+        self.padrao = padrao if padrao in self.backends else next(iter(self.backends))
+
+    def backend_para(self, criterio_id=None):
+        """Devolve o backend configurado para o critério (ou o padrão)"""
+        nome = self.roteamento.get(criterio_id, self.padrao)
+        return self.backends.get(nome, self.backends[self.padrao])
+
+    def backends_sem_chave(self):
+        """Nomes dos backends usados (o padrão e os do roteamento) que não têm nenhuma chave configurada"""
+        usados = {self.padrao, *(nome for nome in self.roteamento.values() if nome in self.backends)}
+        return sorted(nome for nome in usados if not self.backends[nome].tem_credenciais)
+
+def _chaves_do_ambiente():
+    """Pool de chaves da OpenAI em OPENAI_API_KEYS (separadas por vírgula), se houver"""
+    return [chave.strip() for chave in os.getenv(VARIAVEL_CHAVES, '').split(',') if chave.strip()] or None
+
+def carregar_backends(arquivo=ARQUIVO_BACKENDS, api_key=None, chaves=None):
+    """Lê backends.json; sem o arquivo, usa apenas a OpenAI (com a chave ou o pool de chaves informado, se houver)"""
+    # Pool da OpenAI: chaves informadas > chave informada > chaves do backends.json > OPENAI_API_KEYS > OPENAI_API_KEY
+    try:
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+
+    backends = {
+        nome: BackendLLM.de_config(nome, opcoes)
+        for nome, opcoes in config.get('backends', {}).items()
+    }
+    config_openai = config.get('backends', {}).get('openai', {})
+    if not chaves and api_key:
+        # A chave informada substitui o pool inteiro (senão as chaves do pool teriam precedência sobre ela)
+        chaves = [api_key]
+    if not chaves and 'chaves' not in config_openai:
+        chaves = _chaves_do_ambiente()
+    if 'openai' not in backends or chaves:
+        backends['openai'] = BackendLLM.de_config('openai', dict(config_openai, chaves=chaves))
+
+    return RoteadorBackends(backends, config.get('roteamento'), config.get('padrao', 'openai'))
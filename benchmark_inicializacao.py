@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+"""
+Benchmark de inicialização a frio
+Mede processos novos nos caminhos de linha de comando e falha se passarem do orçamento
+"""
+
+import os
+import sys
+import time
+import argparse
+import statistics
+import subprocess
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+
+# Orçamento padrão em segundos (mediana, já descontado o custo do interpretador vazio)
+ORCAMENTO_PADRAO = 0.15
+
+# Cenários medidos: nome -> argumentos do processo
+CENARIOS = {
+    "import analisador": ["-c", "import analisador"],
+    "criar analisador + ler critérios": [
+        "-c",
+        "import sys; from analisador import AnalisadorRoteiro; "
+        "AnalisadorRoteiro(api_key='sk-benchmark').ler_criterios(); "
+        # Os clientes só podem ser criados na primeira requisição
+        "sys.exit(3 if 'openai' in sys.modules else 0)"
+    ],
+    "main.py --help": ["main.py", "--help"],
+    "main.py arquivo inexistente": ["main.py", "arquivo-inexistente.txt"],
+}
+
+def medir(argumentos, repeticoes):
+    """Executa o processo várias vezes e devolve (tempos, código de saída da última execução)"""
+    tempos = []
+    codigo = 0
+    for _ in range(repeticoes):
+        inicio = time.perf_counter()
+        processo = subprocess.run(
+            [sys.executable, *argumentos],
+            cwd=DIRETORIO,
+            stdin=subprocess.DEVNULL,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.DEVNULL
+        )
+        tempos.append(time.perf_counter() - inicio)
+        codigo = processo.returncode
+    return tempos, codigo
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de inicialização a frio")
+    parser.add_argument('--repeticoes', type=int, default=10, help="Execuções por cenário (padrão: 10)")
+    parser.add_argument('--orcamento', type=float, default=ORCAMENTO_PADRAO,
+                        help=f"Tempo máximo por cenário em segundos (padrão: {ORCAMENTO_PADRAO})")
+    args = parser.parse_args()
+
+    # Custo do interpretador sem nada importado
+    tempos_base, _ = medir(["-c", "pass"], args.repeticoes)
+    base = statistics.median(tempos_base)
+    print(f"Interpretador vazio: {base * 1000:.1f} ms (descontado)\n")
+    print(f"{'Cenário':<36} {'mediana':>10} {'máximo':>10}  status")
+
+    falhas = 0
+    for nome, argumentos in CENARIOS.items():
+        tempos, codigo = medir(argumentos, args.repeticoes)
+        mediana = statistics.median(tempos) - base
+        maximo = max(tempos) - base
+
+        if codigo == 3:
+            status = "❌ openai importado na inicialização"
+            falhas += 1
+        elif mediana > args.orcamento:
+            status = f"❌ acima do orçamento ({args.orcamento * 1000:.0f} ms)"
+            falhas += 1
+        else:
+            status = "✅"
+        print(f"{nome:<36} {mediana * 1000:>8.1f}ms {maximo * 1000:>8.1f}ms  {status}")
+
+    if falhas:
+        print(f"\n❌ {falhas} cenário(s) regrediram")
+        sys.exit(1)
+    print("\n✅ Inicialização dentro do orçamento")
+
+if __name__ == "__main__":
+    main()
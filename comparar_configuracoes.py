@@ -0,0 +1,176 @@
+#!/usr/bin/env python3
+"""
+Comparação de configurações do analisador
+Roda um corpus de roteiros rotulados com duas configurações (modelo, duas fases, critérios...) e mostra,
+lado a lado, a concordância dos vereditos (com os rótulos e entre si), os tokens e a latência.
+Com --gravar as respostas do modelo são gravadas; sem ele, as gravações são reproduzidas sem rede nem custo.
+"""
+
+import os
+import sys
+import json
+import glob
+import time
+import asyncio
+import argparse
+import statistics
+
+from analisador import AnalisadorRoteiro, classificar_resultado, ler_arquivo_criterios
+
+# Arquivo opcional do corpus com o veredito esperado: {"roteiro.txt": {"Título do critério": "aprovado"}}
+ARQUIVO_ROTULOS = "rotulos.json"
+
+# Vereditos aceitos nos rótulos (os de classificar_resultado)
+VEREDITOS_ROTULO = ("aprovado", "parcial", "nao_atende")
+
+def carregar_configuracao(arquivo):
+    """Lê a configuração: nome, gravacao (arquivo .jsonl.gz), criterios e opções do AnalisadorRoteiro"""
+    with open(arquivo, 'r', encoding='utf-8') as f:
+        configuracao = json.load(f)
+    if 'gravacao' not in configuracao:
+        raise ValueError(f"{arquivo}: informe 'gravacao' (arquivo das respostas gravadas)")
+    configuracao.setdefault('nome', os.path.splitext(os.path.basename(arquivo))[0])
+    configuracao.setdefault('criterios', 'criterios.txt')
+    configuracao.setdefault('analisador', {})
+    return configuracao
+
+def carregar_corpus(diretorio):
+    """Roteiros (*.txt) do corpus e os rótulos, se houver"""
+    roteiros = sorted(glob.glob(os.path.join(diretorio, "*.txt")))
+    rotulos = {}
+    arquivo_rotulos = os.path.join(diretorio, ARQUIVO_ROTULOS)
+    if os.path.exists(arquivo_rotulos):
+        with open(arquivo_rotulos, 'r', encoding='utf-8') as f:
+            rotulos = json.load(f)
+        for arquivo, vereditos in rotulos.items():
+            for titulo, veredito in vereditos.items():
+                if veredito not in VEREDITOS_ROTULO:
+                    print(f"⚠️ Rótulo ignorado ({arquivo}, {titulo}): '{veredito}' não é {', '.join(VEREDITOS_ROTULO)}")
+    return roteiros, rotulos
+
+async def executar_configuracao(configuracao, roteiros, gravar, simular_latencia):
+    """Analisa cada roteiro do corpus com a configuração; devolve vereditos, tokens e tempos por roteiro"""
+    gravacao = configuracao['gravacao']
+    if gravar:
+        os.makedirs(os.path.dirname(gravacao) or ".", exist_ok=True)
+        if os.path.exists(gravacao):
+            os.remove(gravacao)  # Uma gravação nova por rodada, sem respostas de prompts antigos
+    elif not os.path.exists(gravacao):
+        raise FileNotFoundError(f"Gravação não encontrada: {gravacao} (rode antes com --gravar)")
+
+    criterios = ler_arquivo_criterios(configuracao['criterios'])
+    reproducao = None
+    if not gravar:
+        from gravacao import ReproducaoRequisicoes
+        # Uma reprodução para o corpus inteiro (o arquivo é lido uma vez)
+        reproducao = ReproducaoRequisicoes(gravacao, simular_latencia=simular_latencia)
+
+    execucao = {'vereditos': {}, 'tokens': 0, 'requisicoes': 0, 'tempos': [], 'faltantes': 0}
+    roteador = None  # Backends (e seus clientes HTTP) compartilhados pelos roteiros da configuração
+    for arquivo in roteiros:
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            roteiro = f.read()
+        analisador = AnalisadorRoteiro(
+            **configuracao['analisador'], backends=roteador, gravar_em=gravacao if gravar else None
+        )
+        roteador = analisador.roteador
+        if reproducao:
+            analisador.pipeline.transporte = reproducao
+
+        inicio = time.perf_counter()
+        resultados = await analisador.analisar_texto_async(roteiro, criterios) or []
+        execucao['tempos'].append(time.perf_counter() - inicio)
+
+        nome = os.path.basename(arquivo)
+        execucao['vereditos'][nome] = {
+            resultado['criterio']['titulo']: classificar_resultado(resultado['resultado']) for resultado in resultados
+        }
+        for dados in analisador.metricas.resumo().values():
+            execucao['tokens'] += dados['tokens_total']
+            execucao['requisicoes'] += dados['requisicoes'] - dados['cache']
+
+    if reproducao:
+        execucao['faltantes'] = reproducao.faltantes
+    return execucao
+
+def concordancia(vereditos, referencia):
+    """(iguais, comparados) entre dois conjuntos {roteiro: {critério: veredito}}, só nos pares presentes em ambos"""
+    iguais = comparados = 0
+    for arquivo, esperados in referencia.items():
+        for titulo, esperado in esperados.items():
+            obtido = vereditos.get(arquivo, {}).get(titulo)
+            if obtido is None:
+                continue
+            comparados += 1
+            iguais += obtido == esperado
+    return iguais, comparados
+
+def formatar_concordancia(iguais, comparados):
+    if not comparados:
+        return "-"
+    return f"{iguais}/{comparados} ({iguais / comparados:.0%})"
+
+def main():
+    parser = argparse.ArgumentParser(description="Compara duas configurações do analisador em um corpus rotulado")
+    parser.add_argument('corpus', help=f"Diretório com os roteiros (*.txt) e, opcionalmente, {ARQUIVO_ROTULOS}")
+    parser.add_argument('config_a', help="Configuração A (JSON: nome, gravacao, criterios, analisador)")
+    parser.add_argument('config_b', help="Configuração B")
+    parser.add_argument('--gravar', action='store_true',
+                        help="Chama o modelo de verdade e regrava as respostas das duas configurações")
+    parser.add_argument('--simular-latencia', action='store_true',
+                        help="Na reprodução, espera a latência gravada de cada requisição")
+    parser.add_argument('--concordancia-minima', type=float,
+                        help="Sai com código 1 se os vereditos de A e B concordarem menos que isso (0 a 1)")
+    args = parser.parse_args()
+
+    roteiros, rotulos = carregar_corpus(args.corpus)
+    if not roteiros:
+        print(f"❌ Nenhum roteiro (*.txt) em {args.corpus}")
+        sys.exit(1)
+
+    configuracoes = [carregar_configuracao(args.config_a), carregar_configuracao(args.config_b)]
+    modo = "🔴 gravando (chamadas reais)" if args.gravar else "▶️ reproduzindo gravações"
+    print(f"📚 {len(roteiros)} roteiro(s), {sum(len(v) for v in rotulos.values())} rótulo(s) — {modo}\n")
+
+    execucoes = []
+    for configuracao in configuracoes:
+        print(f"⚙️ {configuracao['nome']}: {json.dumps(configuracao['analisador'], ensure_ascii=False)}")
+        execucoes.append(asyncio.run(
+            executar_configuracao(configuracao, roteiros, args.gravar, args.simular_latencia)
+        ))
+
+    nomes = [configuracao['nome'] for configuracao in configuracoes]
+    largura = max(14, *(len(nome) for nome in nomes))
+    linhas = [
+        ("Rótulos", [formatar_concordancia(*concordancia(e['vereditos'], rotulos)) for e in execucoes]),
+        ("Tokens", [f"{e['tokens']:,}" for e in execucoes]),
+        ("Requisições", [str(e['requisicoes']) for e in execucoes]),
+        ("Tempo mediano", [f"{statistics.median(e['tempos']):.2f}s" for e in execucoes]),
+        ("Tempo total", [f"{sum(e['tempos']):.2f}s" for e in execucoes]),
+    ]
+    print(f"\n{'':<16} {nomes[0]:>{largura}} {nomes[1]:>{largura}}")
+    for rotulo, valores in linhas:
+        print(f"{rotulo:<16} {valores[0]:>{largura}} {valores[1]:>{largura}}")
+    if not args.gravar and not args.simular_latencia:
+        print("(tempos sem a latência do modelo; use --simular-latencia)")
+
+    for nome, execucao in zip(nomes, execucoes):
+        if execucao['faltantes']:
+            print(f"⚠️ {nome}: {execucao['faltantes']} requisição(ões) sem gravação (os prompts mudaram? rode com --gravar)")
+
+    iguais, comparados = concordancia(execucoes[1]['vereditos'], execucoes[0]['vereditos'])
+    print(f"\n🤝 Concordância {nomes[0]} x {nomes[1]}: {formatar_concordancia(iguais, comparados)}")
+    for arquivo, vereditos_a in execucoes[0]['vereditos'].items():
+        for titulo, veredito_a in vereditos_a.items():
+            veredito_b = execucoes[1]['vereditos'].get(arquivo, {}).get(titulo)
+            if veredito_b is not None and veredito_b != veredito_a:
+                esperado = rotulos.get(arquivo, {}).get(titulo)
+                rotulo = f" (rótulo: {esperado})" if esperado else ""
+                print(f"   ≠ {arquivo} / {titulo}: {veredito_a} x {veredito_b}{rotulo}")
+
+    if args.concordancia_minima is not None and comparados and iguais / comparados < args.concordancia_minima:
+        print(f"\n❌ Concordância abaixo do mínimo ({args.concordancia_minima:.0%})")
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
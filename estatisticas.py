@@ -0,0 +1,226 @@
+import re
+import glob
+import itertools
+import sqlite3
+from datetime import datetime
+import numpy as np
+from historico import HistoricoAnalises
+
+# Ordem das categorias de veredito nas tabelas (ver classificar_resultado)
+VEREDITOS_ESTATISTICA = ("aprovado", "parcial", "nao_atende", "erro", "interrompido")
+
+# Faixas de tamanho do roteiro (caracteres) para a tendência de tokens
+FAIXAS_TAMANHO = (2000, 4000, 8000, 16000, 32000, 64000)
+
+def _matriz(con, consulta, num_colunas):
+    """Executa uma consulta só de inteiros e devolve uma matriz NumPy (sem criar listas de tuplas)"""
+    valores = np.fromiter(itertools.chain.from_iterable(con.execute(consulta)), dtype=np.int64)
+    return valores.reshape(-1, num_colunas)
+
+def _categorizar(con, tabela, coluna):
+    """Cria a tabela temporária valor -> código para a coluna de texto e devolve os valores na ordem dos códigos"""
+    temporaria = f"cat_{tabela}_{coluna}"
+    con.execute(f"""CREATE TEMP TABLE {temporaria} AS
+                    SELECT valor, ROW_NUMBER() OVER (ORDER BY valor) - 1 AS codigo
+                    FROM (SELECT DISTINCT {coluna} AS valor FROM {tabela})""")
+    return np.asarray([valor for (valor,) in con.execute(f"SELECT valor FROM {temporaria} ORDER BY codigo")], dtype=str)
+
+class DadosAnalises:
+    """Histórico em colunas NumPy: uma linha por análise, por resultado de critério e por requisição
+
+    Os textos repetidos (modelo, critério, tipo...) viram códigos inteiros dentro do próprio SQLite,
+    então só números atravessam para o Python.
+    """
+
+    def __init__(self, historico=None):
+        historico = historico or HistoricoAnalises()  # Abrir o histórico aplica as migrações pendentes
+        casos_veredito = " ".join(f"WHEN '{veredito}' THEN {i}" for i, veredito in enumerate(VEREDITOS_ESTATISTICA))
+        con = sqlite3.connect(historico.arquivo, timeout=30)
+        try:
+            self.modelos = _categorizar(con, "analises", "modelo")
+            self.criterios = _categorizar(con, "resultados_criterio", "criterio_id")
+            self.tipos = _categorizar(con, "requisicoes_analise", "tipo")
+            self.backends = _categorizar(con, "requisicoes_analise", "backend")
+
+            analises = _matriz(con, """
+                SELECT a.id, m.codigo, CAST(julianday(a.data) - 2440587.5 AS INTEGER),
+                       a.tokens_total, a.roteiro_chars, a.num_criterios, a.aprovados
+                FROM analises a JOIN cat_analises_modelo m ON m.valor = a.modelo
+                ORDER BY a.id""", 7)
+            resultados = _matriz(con, f"""
+                SELECT r.analise_id, c.codigo, CASE r.veredito {casos_veredito} ELSE 1 END
+                FROM resultados_criterio r JOIN cat_resultados_criterio_criterio_id c ON c.valor = r.criterio_id""", 3)
+            requisicoes = _matriz(con, """
+                SELECT r.analise_id, t.codigo, b.codigo, r.requisicoes, r.reaproveitadas, r.erros,
+                       r.tokens_input, r.tokens_output
+                FROM requisicoes_analise r
+                JOIN cat_requisicoes_analise_tipo t ON t.valor = r.tipo
+                JOIN cat_requisicoes_analise_backend b ON b.valor = r.backend""", 8)
+            titulos = dict(con.execute("""
+                SELECT valor, (SELECT criterio_titulo FROM resultados_criterio WHERE criterio_id = valor LIMIT 1)
+                FROM cat_resultados_criterio_criterio_id""").fetchall())
+        finally:
+            con.close()
+
+        # Análises
+        self.ids = analises[:, 0]
+        self.modelo = analises[:, 1]
+        self.data = analises[:, 2].astype('datetime64[D]')
+        self.tokens = analises[:, 3]
+        self.roteiro_chars = analises[:, 4]
+        self.num_criterios = analises[:, 5]
+        self.aprovados = analises[:, 6]
+
+        # Resultados por critério (resultado_analise: posição da análise nos arrays acima)
+        self.resultado_analise = np.searchsorted(self.ids, resultados[:, 0])
+        self.criterio = resultados[:, 1]
+        self.veredito = resultados[:, 2]
+        self.titulos_criterios = np.asarray([titulos[criterio] for criterio in self.criterios], dtype=str)
+
+        # Requisições, totalizadas por análise, tipo e backend
+        self.requisicao_analise = np.searchsorted(self.ids, requisicoes[:, 0])
+        self.tipo = requisicoes[:, 1]
+        self.backend = requisicoes[:, 2]
+        self.requisicoes = requisicoes[:, 3]
+        self.reaproveitadas = requisicoes[:, 4]
+        self.erros = requisicoes[:, 5]
+        self.tokens_input = requisicoes[:, 6]
+        self.tokens_output = requisicoes[:, 7]
+
+    def __len__(self):
+        return len(self.ids)
+
+def vereditos_por_criterio(dados):
+    """Contagem de cada veredito por critério, ordenada pela taxa de reprovação (maior primeiro)"""
+    num_vereditos = len(VEREDITOS_ESTATISTICA)
+    contagem = np.bincount(
+        dados.criterio * num_vereditos + dados.veredito,
+        minlength=len(dados.criterios) * num_vereditos
+    ).reshape(len(dados.criterios), num_vereditos)
+    total = contagem.sum(axis=1)
+    reprovados = contagem[:, VEREDITOS_ESTATISTICA.index("nao_atende")] + contagem[:, VEREDITOS_ESTATISTICA.index("parcial")]
+    taxa_reprovacao = np.divide(reprovados, total, out=np.zeros(len(total)), where=total > 0)
+    ordem = np.argsort(-taxa_reprovacao, kind='stable')
+    return {
+        'criterio': dados.titulos_criterios[ordem],
+        'total': total[ordem],
+        'taxa_reprovacao': taxa_reprovacao[ordem],
+        **{veredito: contagem[ordem, i] for i, veredito in enumerate(VEREDITOS_ESTATISTICA)}
+    }
+
+def _percentis_por_grupo(valores, grupos, num_grupos, percentis):
+    """Percentis de valores por grupo (uma ordenação só; grupos vazios ficam com 0)"""
+    ordem = np.lexsort((valores, grupos))
+    valores_ordenados = valores[ordem]
+    limites = np.searchsorted(grupos[ordem], np.arange(num_grupos + 1))
+    resultado = np.zeros((num_grupos, len(percentis)))
+    for grupo in range(num_grupos):
+        fatia = valores_ordenados[limites[grupo]:limites[grupo + 1]]
+        if len(fatia):
+            resultado[grupo] = np.percentile(fatia, percentis)
+    return resultado
+
+def resumo_por_modelo(dados, percentis=(50, 90, 99)):
+    """Análises, taxa de aprovação dos critérios e percentis de tokens por modelo"""
+    num_modelos = len(dados.modelos)
+    analises = np.bincount(dados.modelo, minlength=num_modelos)
+    criterios = np.bincount(dados.modelo, weights=dados.num_criterios, minlength=num_modelos)
+    aprovados = np.bincount(dados.modelo, weights=dados.aprovados, minlength=num_modelos)
+    tokens = _percentis_por_grupo(dados.tokens, dados.modelo, num_modelos, percentis)
+    return {
+        'modelo': dados.modelos,
+        'analises': analises,
+        'taxa_aprovacao': np.divide(aprovados, criterios, out=np.zeros(num_modelos), where=criterios > 0),
+        'tokens_medio': np.divide(
+            np.bincount(dados.modelo, weights=dados.tokens, minlength=num_modelos), analises,
+            out=np.zeros(num_modelos), where=analises > 0
+        ),
+        **{f'tokens_p{p}': tokens[:, i] for i, p in enumerate(percentis)}
+    }
+
+def tokens_por_tamanho(dados, faixas=FAIXAS_TAMANHO):
+    """Tokens médios por faixa de tamanho do roteiro e a reta tokens ~ caracteres (análises com tamanho conhecido)"""
+    conhecidos = dados.roteiro_chars > 0
+    chars = dados.roteiro_chars[conhecidos]
+    tokens = dados.tokens[conhecidos]
+    faixa = np.digitize(chars, faixas)
+    num_faixas = len(faixas) + 1
+    quantidade = np.bincount(faixa, minlength=num_faixas)
+    soma = np.bincount(faixa, weights=tokens, minlength=num_faixas)
+    rotulos = [f"até {faixas[0]}"] + [f"{a}-{b}" for a, b in zip(faixas, faixas[1:])] + [f"acima de {faixas[-1]}"]
+
+    # Reta de mínimos quadrados (precisa de pelo menos dois tamanhos diferentes)
+    inclinacao, intercepto = 0.0, float(tokens.mean()) if len(tokens) else 0.0
+    if len(np.unique(chars)) > 1:
+        inclinacao, intercepto = np.polyfit(chars, tokens, 1)
+    return {
+        'faixa': np.asarray(rotulos),
+        'analises': quantidade,
+        'tokens_medio': np.divide(soma, quantidade, out=np.zeros(num_faixas), where=quantidade > 0),
+        'tokens_por_mil_chars': inclinacao * 1000,
+        'tokens_fixos': intercepto
+    }
+
+def serie_diaria(dados):
+    """Análises, taxa de aprovação e tokens por dia"""
+    if not len(dados):
+        return {'data': np.array([], dtype='datetime64[D]'), 'analises': np.array([], dtype=np.int64),
+                'taxa_aprovacao': np.array([]), 'tokens': np.array([], dtype=np.int64)}
+    dias, dia = np.unique(dados.data, return_inverse=True)
+    criterios = np.bincount(dia, weights=dados.num_criterios)
+    return {
+        'data': dias,
+        'analises': np.bincount(dia),
+        'taxa_aprovacao': np.divide(np.bincount(dia, weights=dados.aprovados), criterios,
+                                    out=np.zeros(len(dias)), where=criterios > 0),
+        'tokens': np.bincount(dia, weights=dados.tokens).astype(np.int64)
+    }
+
+def resumo_requisicoes(dados):
+    """Requisições, reaproveitamentos, erros e tokens por tipo de requisição"""
+    num_tipos = len(dados.tipos)
+    return {
+        'tipo': dados.tipos,
+        'requisicoes': np.bincount(dados.tipo, weights=dados.requisicoes, minlength=num_tipos).astype(np.int64),
+        'reaproveitadas': np.bincount(dados.tipo, weights=dados.reaproveitadas, minlength=num_tipos).astype(np.int64),
+        'erros': np.bincount(dados.tipo, weights=dados.erros, minlength=num_tipos).astype(np.int64),
+        'tokens_input': np.bincount(dados.tipo, weights=dados.tokens_input, minlength=num_tipos).astype(np.int64),
+        'tokens_output': np.bincount(dados.tipo, weights=dados.tokens_output, minlength=num_tipos).astype(np.int64)
+    }
+
+def _ler_relatorio(arquivo):
+    """Lê um relatorio_analise_*.txt gerado por gerar_relatorio: (título, data, resultados) ou None"""
+    with open(arquivo, 'r', encoding='utf-8') as f:
+        texto = f.read()
+
+    arquivo_analisado = re.search(r'^Arquivo analisado: (.*)$', texto, re.MULTILINE)
+    data = re.search(r'^Data da análise: (\d{2}/\d{2}/\d{4} \d{2}:\d{2}:\d{2})$', texto, re.MULTILINE)
+    if not arquivo_analisado or not data:
+        return None
+
+    resultados = []
+    blocos = re.split(r'^CRITÉRIO \d+: ', texto, flags=re.MULTILINE)[1:]
+    for bloco in blocos:
+        titulo, _, resto = bloco.partition("\n")
+        analise = resto.split("Análise:\n", 1)[-1]
+        analise = analise.rsplit("\n\n" + "=" * 80, 1)[0]
+        resultados.append({'criterio': {'titulo': titulo.strip(), 'descricao': ''}, 'resultado': analise.strip()})
+
+    return arquivo_analisado.group(1).strip(), datetime.strptime(data.group(1), '%d/%m/%Y %H:%M:%S'), resultados
+
+def importar_relatorios(padrao='relatorio_analise_*.txt', historico=None):
+    """Importa relatórios em texto antigos para o histórico (sem repetir os já importados); devolve quantos"""
+    historico = historico or HistoricoAnalises()
+    importados = 0
+    for arquivo in sorted(glob.glob(padrao)):
+        lido = _ler_relatorio(arquivo)
+        if not lido:
+            print(f"⚠️ {arquivo} não parece um relatório de análise, ignorado.")
+            continue
+        titulo, criado_em, resultados = lido
+        if not resultados or historico.contem(titulo, criado_em):
+            continue
+        # O relatório não guarda o roteiro, o modelo nem o consumo de tokens
+        historico.salvar("", resultados, "desconhecido", titulo=titulo, criado_em=criado_em)
+        importados += 1
+    return importados
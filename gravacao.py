@@ -0,0 +1,123 @@
+import gzip
+import json
+import time
+import zlib
+import asyncio
+import threading
+
+class RequisicaoNaoGravada(Exception):
+    """A reprodução não tem resposta gravada para a requisição (prompt, modelo ou parâmetros mudaram)"""
+
+def _dados_requisicao(requisicao):
+    """O que identifica e descreve a requisição no arquivo de gravação"""
+    return {
+        "chave": requisicao.chave(),
+        "tipo": requisicao.tipo,
+        "backend": requisicao.backend.nome,
+        "modelo": requisicao.modelo,
+        "max_tokens": requisicao.max_tokens,
+        "temperature": requisicao.temperature,
+        "messages": requisicao.messages
+    }
+
+class GravadorRequisicoes:
+    """Estágio que grava cada requisição enviada ao modelo e sua resposta em JSONL compactado (gzip)
+
+    Fica no fim do pipeline: a latência gravada é a do modelo, sem fila nem retentativas.
+    Cada gravação é acrescentada ao arquivo na hora, então uma execução interrompida não perde o que já foi gravado.
+    """
+
+    def __init__(self, arquivo):
+        self.arquivo = arquivo
+        self.gravadas = 0
+        self._lock = threading.Lock()
+
+    async def processar(self, requisicao, proximo):
+        inicio = time.perf_counter()
+        resposta = await proximo(requisicao)
+        registro = {
+            **_dados_requisicao(requisicao),
+            "resposta": {
+                campo: resposta[campo]
+                for campo in ('conteudo', 'tokens_input', 'tokens_output', 'tokens_total', 'tokens_cache')
+                if campo in resposta
+            },
+            "latencia": round(time.perf_counter() - inicio, 4)
+        }
+        linha = json.dumps(registro, ensure_ascii=False) + "\n"
+        with self._lock:
+            with gzip.open(self.arquivo, 'at', encoding='utf-8') as f:
+                f.write(linha)
+            self.gravadas += 1
+        return resposta
+
+def _membros_completos(dados):
+    """Descompacta os membros gzip completos (um por gravação); para no primeiro cortado ou corrompido"""
+    texto = bytearray()
+    while dados:
+        descompactador = zlib.decompressobj(16 + zlib.MAX_WBITS)
+        try:
+            parte = descompactador.decompress(dados)
+        except zlib.error:
+            return bytes(texto), False
+        if not descompactador.eof:
+            return bytes(texto), False
+        texto += parte
+        dados = descompactador.unused_data
+    return bytes(texto), True
+
+def ler_gravacao(arquivo):
+    """Lê os registros de um arquivo de gravação, na ordem em que foram gravados
+
+    Um processo morto no meio de uma gravação deixa o último membro gzip cortado: os registros completos
+    antes dele são mantidos.
+    """
+    with open(arquivo, 'rb') as f:
+        texto, completo = _membros_completos(f.read())
+    registros = []
+    for linha in texto.decode('utf-8', errors='replace').splitlines():
+        if not linha.strip():
+            continue
+        try:
+            registros.append(json.loads(linha))
+        except json.JSONDecodeError:
+            completo = False
+    if not completo:
+        print(f"⚠️ Gravação {arquivo} termina cortada; usando os {len(registros)} registros completos")
+    return registros
+
+class ReproducaoRequisicoes:
+    """Transporte que responde com as respostas gravadas, sem rede nem custo
+
+    A mesma requisição recebe as respostas gravadas para ela na ordem da gravação (a última se repete),
+    então a reprodução é determinística. Requisições sem gravação falham com RequisicaoNaoGravada.
+    """
+
+    def __init__(self, arquivo, simular_latencia=False):
+        self.arquivo = arquivo
+        self.simular_latencia = simular_latencia  # Espera a latência gravada antes de responder
+        self.respostas = {}  # Chave da requisição -> registros gravados
+        for registro in ler_gravacao(arquivo):
+            self.respostas.setdefault(registro['chave'], []).append(registro)
+        self.reproduzidas = 0
+        self.faltantes = 0
+        self._usos = {}  # Chave -> respostas já entregues
+        self._lock = threading.Lock()
+
+    async def __call__(self, requisicao):
+        chave = requisicao.chave()
+        with self._lock:
+            gravadas = self.respostas.get(chave)
+            if not gravadas:
+                self.faltantes += 1
+                raise RequisicaoNaoGravada(
+                    f"Sem resposta gravada em {self.arquivo} para {requisicao.tipo} ({requisicao.modelo})"
+                )
+            uso = self._usos.get(chave, 0)
+            self._usos[chave] = uso + 1
+            self.reproduzidas += 1
+        registro = gravadas[min(uso, len(gravadas) - 1)]
+
+        if self.simular_latencia:
+            await asyncio.sleep(registro['latencia'])
+        return {**registro['resposta'], 'backend': requisicao.backend.nome, 'cache': False}
@@ -0,0 +1,327 @@
+import re
+import json
+import zlib
+import sqlite3
+import hashlib
+from datetime import datetime
+from analisador import id_criterio, classificar_resultado
+
+ARQUIVO_HISTORICO = 'historico_analises.db'
+
+# Vereditos que deixam a análise parcial (não reaproveitada)
+VEREDITOS_INCOMPLETOS = ('interrompido', 'erro')
+
+# Colunas das listagens (sem o payload, que só é lido ao abrir uma análise)
+COLUNAS_RESUMO = "id, roteiro_hash, titulo, modelo, criado_em, num_criterios, aprovados, tokens_total"
+
+def hash_roteiro(roteiro):
+    """Calcula o hash do conteúdo do roteiro (ignorando espaços nas pontas)"""
+    return hashlib.sha256(roteiro.strip().encode('utf-8')).hexdigest()
+
+# Opções do AnalisadorRoteiro que mudam o resultado e seus valores padrão (as demais, como prioridade,
+# usuário, chave, perfil e duplicar_lentas, só mudam o caminho até ele)
+OPCOES_RESULTADO = {'duas_fases': False, 'limiar_similaridade': None, 'reverificar_trechos': False}
+
+def assinatura_analise(roteiro, criterios, modelo, opcoes_analisador):
+    """Identifica o que uma análise cobre (texto, critérios, modelo e as opções que mudam o resultado)
+
+    As opções são normalizadas: as ausentes valem o padrão e os padrões ficam de fora, então a linha de
+    comando e o app chegam à mesma assinatura com os mesmos critérios e opções.
+    """
+    opcoes = {nome: opcoes_analisador.get(nome, padrao) for nome, padrao in OPCOES_RESULTADO.items()}
+    if not opcoes['limiar_similaridade']:
+        opcoes['reverificar_trechos'] = False  # Sem reaproveitamento não há o que reverificar
+    opcoes = sorted((nome, valor) for nome, valor in opcoes.items() if valor != OPCOES_RESULTADO[nome])
+    dados = [roteiro, criterios, modelo, opcoes]
+    return hashlib.sha256(json.dumps(dados, ensure_ascii=False, default=str).encode('utf-8')).hexdigest()
+
+def titulo_roteiro(roteiro, max_chars=80):
+    """Usa a primeira linha de texto do roteiro como título (pulando marcações como [ABERTURA])"""
+    linhas = [linha.strip() for linha in roteiro.splitlines() if linha.strip()]
+    for linha in linhas:
+        if not (linha.startswith('[') and linha.endswith(']')):
+            return linha[:max_chars]
+    return linhas[0][:max_chars] if linhas else "(roteiro vazio)"
+
+def _linhas_requisicoes(analise_id, log_requisicoes):
+    """Totais do log de requisições por tipo e backend (linhas da tabela requisicoes_analise)"""
+    totais = {}
+    for log in log_requisicoes:
+        # Tipo sem sufixos variáveis como "(Async)", "(cache)" ou "(93% similar)"
+        tipo = re.sub(r'^ERRO - |\s*\(.*\)$', '', log.get('tipo', ''))
+        linha = totais.setdefault((tipo, log.get('backend', 'openai')), [0, 0, 0, 0, 0, 0])
+        linha[0] += 1
+        linha[1] += bool(log.get('reaproveitado'))
+        linha[2] += 'erro' in log
+        linha[3] += log.get('tokens_input', 0)
+        linha[4] += log.get('tokens_output', 0)
+        linha[5] += log.get('prompt_chars', 0)
+    return [(analise_id, tipo, backend, *valores) for (tipo, backend), valores in totais.items()]
+
+class HistoricoAnalises:
+    """Histórico local de análises em SQLite, com resultados comprimidos e busca textual"""
+
+    def __init__(self, arquivo=ARQUIVO_HISTORICO):
+        self.arquivo = arquivo
+        self.busca_fts = True  # Desativado se o SQLite não tiver FTS5
+        self._criar_tabelas()
+
+    def _conectar(self):
+        """Abre uma conexão nova (seguro para as threads do Streamlit)"""
+        con = sqlite3.connect(self.arquivo, timeout=30)
+        con.row_factory = sqlite3.Row
+        return con
+
+    def _criar_tabelas(self):
+        """Cria tabelas e índices se ainda não existirem"""
+        con = self._conectar()
+        try:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS analises (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    roteiro_hash TEXT NOT NULL,
+                    titulo TEXT NOT NULL,
+                    modelo TEXT NOT NULL,
+                    criado_em TEXT NOT NULL,
+                    data TEXT NOT NULL,
+                    num_criterios INTEGER NOT NULL,
+                    aprovados INTEGER NOT NULL,
+                    tokens_total INTEGER NOT NULL,
+                    payload BLOB NOT NULL,
+                    roteiro_chars INTEGER NOT NULL DEFAULT 0,
+                    assinatura TEXT NOT NULL DEFAULT '',
+                    completa INTEGER NOT NULL DEFAULT 1
+                );
+                CREATE INDEX IF NOT EXISTS idx_analises_roteiro ON analises (roteiro_hash, modelo, criado_em);
+                CREATE INDEX IF NOT EXISTS idx_analises_modelo ON analises (modelo, data);
+                CREATE INDEX IF NOT EXISTS idx_analises_data ON analises (data);
+
+                CREATE TABLE IF NOT EXISTS resultados_criterio (
+                    analise_id INTEGER NOT NULL REFERENCES analises (id) ON DELETE CASCADE,
+                    criterio_id TEXT NOT NULL,
+                    criterio_titulo TEXT NOT NULL,
+                    veredito TEXT NOT NULL,
+                    PRIMARY KEY (analise_id, criterio_id)
+                );
+                CREATE INDEX IF NOT EXISTS idx_resultados_criterio ON resultados_criterio (criterio_id, veredito);
+
+                CREATE TABLE IF NOT EXISTS requisicoes_analise (
+                    analise_id INTEGER NOT NULL REFERENCES analises (id) ON DELETE CASCADE,
+                    tipo TEXT NOT NULL,
+                    backend TEXT NOT NULL,
+                    requisicoes INTEGER NOT NULL,
+                    reaproveitadas INTEGER NOT NULL,
+                    erros INTEGER NOT NULL,
+                    tokens_input INTEGER NOT NULL,
+                    tokens_output INTEGER NOT NULL,
+                    prompt_chars INTEGER NOT NULL,
+                    PRIMARY KEY (analise_id, tipo, backend)
+                );
+            """)
+            self._migrar(con)
+            try:
+                con.execute("""
+                    CREATE VIRTUAL TABLE IF NOT EXISTS busca_analises
+                    USING fts5 (titulo, achados, tokenize = 'unicode61 remove_diacritics 2')
+                """)
+            except sqlite3.OperationalError:
+                # SQLite sem FTS5: busca cai para LIKE
+                self.busca_fts = False
+            con.commit()
+        finally:
+            con.close()
+
+    def _migrar(self, con):
+        """Atualiza históricos criados antes das colunas de estatísticas (preenche a partir do payload), da assinatura e de completa"""
+        colunas = [linha['name'] for linha in con.execute("PRAGMA table_info(analises)")]
+        if 'assinatura' not in colunas:
+            # Análises antigas ficam sem assinatura: não são reaproveitadas por buscas com assinatura
+            con.execute("ALTER TABLE analises ADD COLUMN assinatura TEXT NOT NULL DEFAULT ''")
+        if 'completa' not in colunas:
+            con.execute("ALTER TABLE analises ADD COLUMN completa INTEGER NOT NULL DEFAULT 1")
+            con.execute(f"""UPDATE analises SET completa = 0 WHERE id IN (
+                SELECT analise_id FROM resultados_criterio WHERE veredito IN {VEREDITOS_INCOMPLETOS})""")
+        if 'roteiro_chars' in colunas:
+            return
+        con.execute("ALTER TABLE analises ADD COLUMN roteiro_chars INTEGER NOT NULL DEFAULT 0")
+        for linha in con.execute("SELECT id, payload FROM analises").fetchall():
+            dados = json.loads(zlib.decompress(linha['payload']).decode('utf-8'))
+            con.execute("UPDATE analises SET roteiro_chars = ? WHERE id = ?", (len(dados['roteiro']), linha['id']))
+            con.executemany(
+                "INSERT INTO requisicoes_analise VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _linhas_requisicoes(linha['id'], dados.get('log_requisicoes') or [])
+            )
+
+    def salvar(self, roteiro, resultados, modelo, log_requisicoes=None, titulo=None, criado_em=None, assinatura=''):
+        """Salva uma análise e devolve seu ID (criado_em: datetime, para importar análises antigas)
+
+        assinatura: de assinatura_analise (critérios e opções), para só reaproveitar análises equivalentes.
+        Critérios interrompidos (prazo, cancelamento) ou com erro marcam a análise como parcial, que fica no
+        histórico mas não é reaproveitada.
+        """
+        agora = criado_em or datetime.now()
+        titulo = titulo or titulo_roteiro(roteiro)
+        log_requisicoes = log_requisicoes or []
+
+        payload = zlib.compress(json.dumps({
+            'roteiro': roteiro,
+            'resultados': resultados,
+            'log_requisicoes': log_requisicoes
+        }, ensure_ascii=False).encode('utf-8'))
+
+        vereditos = []
+        for resultado in resultados:
+            criterio = resultado['criterio']
+            criterio_titulo = criterio['titulo'] if isinstance(criterio, dict) else criterio
+            vereditos.append((id_criterio(criterio), criterio_titulo, classificar_resultado(resultado['resultado'])))
+
+        con = self._conectar()
+        try:
+            cursor = con.execute(
+                """INSERT INTO analises (roteiro_hash, titulo, modelo, criado_em, data, num_criterios,
+                                         aprovados, tokens_total, payload, roteiro_chars, assinatura, completa)
+                   VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
+                (
+                    hash_roteiro(roteiro), titulo, modelo, agora.isoformat(timespec='seconds'),
+                    agora.strftime('%Y-%m-%d'), len(resultados),
+                    sum(1 for _, _, veredito in vereditos if veredito == 'aprovado'),
+                    sum(log.get('tokens_total', 0) for log in log_requisicoes), payload, len(roteiro), assinatura,
+                    int(not any(veredito in VEREDITOS_INCOMPLETOS for _, _, veredito in vereditos))
+                )
+            )
+            analise_id = cursor.lastrowid
+            con.executemany(
+                "INSERT OR REPLACE INTO resultados_criterio VALUES (?, ?, ?, ?)",
+                [(analise_id, *veredito) for veredito in vereditos]
+            )
+            con.executemany(
+                "INSERT INTO requisicoes_analise VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                _linhas_requisicoes(analise_id, log_requisicoes)
+            )
+            if self.busca_fts:
+                # Achados: apenas o texto dos critérios que não foram aprovados
+                achados = "\n".join(
+                    resultado['resultado'] for resultado in resultados
+                    if classificar_resultado(resultado['resultado']) != 'aprovado'
+                )
+                con.execute(
+                    "INSERT INTO busca_analises (rowid, titulo, achados) VALUES (?, ?, ?)",
+                    (analise_id, titulo, achados)
+                )
+            con.commit()
+            return analise_id
+        finally:
+            con.close()
+
+    def carregar(self, analise_id):
+        """Carrega uma análise salva (com roteiro, resultados e log) ou None"""
+        con = self._conectar()
+        try:
+            linha = con.execute("SELECT * FROM analises WHERE id = ?", (analise_id,)).fetchone()
+        finally:
+            con.close()
+
+        if not linha:
+            return None
+
+        analise = self._resumo(linha)
+        analise.update(json.loads(zlib.decompress(linha['payload']).decode('utf-8')))
+        return analise
+
+    def buscar_por_roteiro(self, roteiro, modelo=None, assinatura=None):
+        """Devolve a análise completa mais recente do mesmo roteiro (e modelo e assinatura, se informados) ou None"""
+        consulta = "SELECT id FROM analises WHERE roteiro_hash = ? AND completa = 1"
+        parametros = [hash_roteiro(roteiro)]
+        if modelo:
+            consulta += " AND modelo = ?"
+            parametros.append(modelo)
+        if assinatura:
+            # Mesmos critérios e opções: a análise salva vale para a configuração atual
+            consulta += " AND assinatura = ?"
+            parametros.append(assinatura)
+        consulta += " ORDER BY criado_em DESC, id DESC LIMIT 1"
+
+        con = self._conectar()
+        try:
+            linha = con.execute(consulta, parametros).fetchone()
+        finally:
+            con.close()
+
+        return self.carregar(linha['id']) if linha else None
+
+    def contem(self, titulo, criado_em):
+        """Indica se já existe uma análise com o título e a data (ex: relatório já importado)"""
+        con = self._conectar()
+        try:
+            return con.execute(
+                "SELECT 1 FROM analises WHERE titulo = ? AND criado_em = ?",
+                (titulo, criado_em.isoformat(timespec='seconds'))
+            ).fetchone() is not None
+        finally:
+            con.close()
+
+    def listar(self, limite=20, modelo=None, data=None, criterio_id=None, veredito=None):
+        """Lista resumos das análises mais recentes, com filtros opcionais"""
+        consulta = f"SELECT {COLUNAS_RESUMO} FROM analises"
+        condicoes = []
+        parametros = []
+        if modelo:
+            condicoes.append("modelo = ?")
+            parametros.append(modelo)
+        if data:
+            condicoes.append("data = ?")
+            parametros.append(data)
+        if criterio_id:
+            filtro = "SELECT analise_id FROM resultados_criterio WHERE criterio_id = ?"
+            parametros.append(criterio_id)
+            if veredito:
+                filtro += " AND veredito = ?"
+                parametros.append(veredito)
+            condicoes.append(f"id IN ({filtro})")
+        if condicoes:
+            consulta += " WHERE " + " AND ".join(condicoes)
+        consulta += " ORDER BY criado_em DESC, id DESC LIMIT ?"
+        parametros.append(limite)
+
+        con = self._conectar()
+        try:
+            return [self._resumo(linha) for linha in con.execute(consulta, parametros)]
+        finally:
+            con.close()
+
+    def pesquisar(self, texto, limite=20):
+        """Busca textual nos títulos dos roteiros e nos problemas apontados"""
+        con = self._conectar()
+        try:
+            if self.busca_fts:
+                # Cada palavra vira um termo entre aspas (evita erro de sintaxe do FTS5)
+                termos = " ".join('"' + palavra.replace('"', '') + '"' for palavra in texto.split())
+                if not termos:
+                    return []
+                linhas = con.execute(
+                    f"""SELECT {COLUNAS_RESUMO} FROM analises WHERE id IN (
+                           SELECT rowid FROM busca_analises WHERE busca_analises MATCH ?
+                       ) ORDER BY criado_em DESC, id DESC LIMIT ?""",
+                    (termos, limite)
+                )
+            else:
+                linhas = con.execute(
+                    f"SELECT {COLUNAS_RESUMO} FROM analises WHERE titulo LIKE ? ORDER BY criado_em DESC LIMIT ?",
+                    (f"%{texto}%", limite)
+                )
+            return [self._resumo(linha) for linha in linhas]
+        finally:
+            con.close()
+
+    def _resumo(self, linha):
+        """Converte uma linha da tabela em dicionário (sem descomprimir o payload)"""
+        return {
+            'id': linha['id'],
+            'roteiro_hash': linha['roteiro_hash'],
+            'titulo': linha['titulo'],
+            'modelo': linha['modelo'],
+            'criado_em': linha['criado_em'],
+            'num_criterios': linha['num_criterios'],
+            'aprovados': linha['aprovados'],
+            'tokens_total': linha['tokens_total']
+        }
@@ -0,0 +1,158 @@
+import re
+import asyncio
+import hashlib
+
+TAMANHO_TRECHO = 8000  # Caracteres por trecho enviado ao modelo
+TAMANHO_BLOCO = 64 * 1024  # Caracteres lidos do arquivo por vez
+TAMANHO_MEDIO_PARAGRAFOS = 2000  # Caracteres por trecho, em média, na divisão por parágrafos
+
+SEPARADOR_PARAGRAFOS = re.compile(r'\n[ \t]*\n')
+
+def _dividir_blocos(blocos, max_chars=TAMANHO_TRECHO):
+    """Gera os trechos a partir de blocos de texto; um texto curto sai intacto, um longo é dividido por palavras"""
+    blocos = iter(blocos)
+
+    # Texto que cabe em um trecho é enviado como está (preserva quebras de linha)
+    inicio = ""
+    for bloco in blocos:
+        inicio += bloco
+        if len(inicio) > max_chars:
+            break
+    else:
+        if inicio.strip():  # Só espaços: nenhum trecho
+            yield inicio
+        return
+
+    palavras = []  # Palavras do trecho atual
+    tamanho = 0  # Tamanho do trecho atual com os espaços entre palavras
+    resto = ""  # Palavra cortada no fim do bloco anterior
+
+    def pedacos():
+        yield inicio
+        yield from blocos
+
+    for bloco in pedacos():
+        texto = resto + bloco
+        partes = texto.split()
+        # Se o bloco não termina em espaço, a última palavra pode continuar no próximo
+        resto = partes.pop() if partes and not texto[-1].isspace() else ""
+        for palavra in partes:
+            if tamanho + 1 + len(palavra) > max_chars and palavras:
+                yield " ".join(palavras)
+                palavras, tamanho = [palavra], len(palavra)
+            elif palavras:
+                palavras.append(palavra)
+                tamanho += 1 + len(palavra)
+            else:
+                palavras, tamanho = [palavra], len(palavra)
+
+    if resto:
+        if palavras and tamanho + 1 + len(resto) > max_chars:
+            yield " ".join(palavras)
+            palavras = []
+        palavras.append(resto)
+    if palavras:
+        yield " ".join(palavras)
+
+def dividir_texto(texto, max_chars=TAMANHO_TRECHO):
+    """Gera os trechos de um texto já em memória"""
+    return _dividir_blocos([texto], max_chars)
+
+def _fim_de_trecho(paragrafo, tamanho_medio):
+    """Decide pelo conteúdo se o trecho termina depois do parágrafo (chance proporcional ao tamanho dele)"""
+    resumo = hashlib.blake2b(paragrafo.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(resumo, 'big') / 2 ** 64 < len(paragrafo) / tamanho_medio
+
+def dividir_paragrafos(texto, max_chars=TAMANHO_TRECHO, tamanho_medio=TAMANHO_MEDIO_PARAGRAFOS):
+    """Gera trechos pequenos de parágrafos inteiros, com os cortes escolhidos pelo conteúdo de cada parágrafo
+
+    O corte depois de um parágrafo não depende do resto do texto: editar um parágrafo muda só o trecho
+    dele (e o seguinte, se o corte aparecer ou sumir), e os demais trechos continuam idênticos.
+    """
+    tamanho_medio = min(tamanho_medio, max_chars)
+    atual = []
+    tamanho = 0
+
+    for paragrafo in SEPARADOR_PARAGRAFOS.split(texto):
+        paragrafo = paragrafo.strip()
+        if not paragrafo:
+            continue
+        if atual and tamanho + 2 + len(paragrafo) > max_chars:
+            yield "\n\n".join(atual)
+            atual, tamanho = [], 0
+        if len(paragrafo) > max_chars:
+            # Parágrafo maior que um trecho: sai sozinho, dividido por palavras
+            yield from dividir_texto(paragrafo, max_chars)
+            continue
+        tamanho += len(paragrafo) + (2 if atual else 0)
+        atual.append(paragrafo)
+        if _fim_de_trecho(paragrafo, tamanho_medio):
+            yield "\n\n".join(atual)
+            atual, tamanho = [], 0
+
+    if atual:
+        yield "\n\n".join(atual)
+
+def ler_trechos(arquivo, max_chars=TAMANHO_TRECHO, tamanho_bloco=TAMANHO_BLOCO):
+    """Gera os trechos de um arquivo lendo-o aos poucos (a memória não cresce com o tamanho do arquivo)"""
+    with open(arquivo, 'r', encoding='utf-8') as f:
+        yield from _dividir_blocos(iter(lambda: f.read(tamanho_bloco), ""), max_chars)
+
+class FonteTrechos:
+    """Distribui os trechos de um gerador a vários consumidores (um por critério), lendo sob demanda
+
+    Cada trecho é lido uma única vez e compartilhado; só fica em memória até todos os
+    consumidores o liberarem. Com max_em_memoria trechos retidos, a leitura espera (contrapressão).
+    """
+
+    def __init__(self, trechos, consumidores=1, max_em_memoria=4):
+        self._trechos = iter(trechos)
+        self._ativos = set(range(consumidores))
+        self.max_em_memoria = max_em_memoria
+        self._retidos = {}  # Índice -> [texto, consumidores que já liberaram]
+        self._lidos = 0
+        self._fim = False
+        self._condicao = None  # Criada no event loop em que a fonte é usada
+
+    def _obter_condicao(self):
+        if self._condicao is None:
+            self._condicao = asyncio.Condition()
+        return self._condicao
+
+    async def obter(self, indice):
+        """Devolve o trecho de número indice (None no fim), esperando se a memória estiver cheia"""
+        condicao = self._obter_condicao()
+        async with condicao:
+            while indice >= self._lidos and not self._fim:
+                if len(self._retidos) >= self.max_em_memoria:
+                    await condicao.wait()
+                    continue
+                trecho = next(self._trechos, None)
+                if trecho is None:
+                    self._fim = True
+                else:
+                    self._retidos[self._lidos] = [trecho, set()]
+                    self._lidos += 1
+            if indice >= self._lidos:
+                return None
+            return self._retidos[indice][0]
+
+    async def liberar(self, indice, consumidor):
+        """Avisa que o consumidor terminou o trecho; descarta-o quando todos terminarem"""
+        async with self._obter_condicao():
+            if indice in self._retidos:
+                self._retidos[indice][1].add(consumidor)
+            self._descartar()
+
+    async def encerrar(self, consumidor):
+        """Retira o consumidor (ex: critério cancelado), para não segurar trechos em memória"""
+        async with self._obter_condicao():
+            self._ativos.discard(consumidor)
+            self._descartar()
+
+    def _descartar(self):
+        """Remove os trechos já liberados por todos os consumidores ativos (chamado com a condição)"""
+        for indice, (_, liberados) in list(self._retidos.items()):
+            if self._ativos <= liberados:
+                del self._retidos[indice]
+        self._condicao.notify_all()
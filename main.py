@@ -6,38 +6,147 @@ Script principal para executar análise completa de roteiros
 
 import sys
 import os
+import argparse
+from datetime import datetime
 from analisador import AnalisadorRoteiro
+from backends import carregar_backends
+from pipeline import ESCALONADOR
+from modelos import custo_requisicoes
+from perfil import AmostradorPilhas, salvar_pilhas
+from historico import HistoricoAnalises, assinatura_analise
+from relatorios import RENDERIZADORES, DiarioRelatorio
+from ambiente import carregar_env
 
-def load_env():
-    """Carrega variáveis do arquivo .env"""
-    try:
-        with open('.env', 'r', encoding='utf-8') as f:
-            for line in f:
-                line = line.strip()
-                if line and not line.startswith('#') and '=' in line:
-                    key, value = line.split('=', 1)
-                    os.environ[key.strip()] = value.strip()
-                    print(f"✅ Carregado: {key.strip()}")
-    except Exception as e:
-        print(f"❌ Erro ao carregar .env: {e}")
+def listar_historico(termo=None):
+    """Lista as análises salvas (ou as que correspondem à busca)"""
+    historico = HistoricoAnalises()
+    analises = historico.pesquisar(termo) if termo else historico.listar()
+    
+    if not analises:
+        print("📚 Nenhuma análise encontrada no histórico.")
+        return
+    
+    print(f"📚 {len(analises)} análise(s) no histórico:\n")
+    for analise in analises:
+        print(f"  [{analise['id']}] {analise['titulo']}")
+        print(f"      {analise['criado_em'].replace('T', ' ')} · {analise['modelo']} · "
+              f"{analise['aprovados']}/{analise['num_criterios']} aprovados · {analise['tokens_total']} tokens")
+
+def mostrar_estatisticas(padrao_relatorios=None):
+    """Mostra as estatísticas do histórico (importando antes os relatórios em texto, se pedido)"""
+    # NumPy só é carregado neste comando
+    from estatisticas import (DadosAnalises, importar_relatorios, vereditos_por_criterio,
+                              resumo_por_modelo, tokens_por_tamanho, resumo_requisicoes)
+    
+    if padrao_relatorios:
+        print(f"📥 {importar_relatorios(padrao_relatorios)} relatório(s) importado(s) para o histórico.")
+    
+    dados = DadosAnalises()
+    if not len(dados):
+        print("📚 Nenhuma análise no histórico.")
+        return
+    
+    print(f"📈 Estatísticas de {len(dados)} análise(s)\n")
+    
+    print("Critérios que mais reprovam:")
+    por_criterio = vereditos_por_criterio(dados)
+    for i in range(min(10, len(por_criterio['criterio']))):
+        print(f"  {por_criterio['taxa_reprovacao'][i]:6.1%}  {por_criterio['criterio'][i]} "
+              f"({por_criterio['nao_atende'][i]} não atende, {por_criterio['parcial'][i]} parcial, "
+              f"{por_criterio['total'][i]} no total)")
+    
+    print("\nPor modelo:")
+    por_modelo = resumo_por_modelo(dados)
+    for i, modelo in enumerate(por_modelo['modelo']):
+        print(f"  {modelo}: {por_modelo['analises'][i]} análise(s), {por_modelo['taxa_aprovacao'][i]:.1%} de aprovação, "
+              f"tokens p50/p90/p99 = {por_modelo['tokens_p50'][i]:.0f}/{por_modelo['tokens_p90'][i]:.0f}/{por_modelo['tokens_p99'][i]:.0f}")
+    
+    print("\nTokens por tamanho do roteiro:")
+    por_tamanho = tokens_por_tamanho(dados)
+    for i, faixa in enumerate(por_tamanho['faixa']):
+        if por_tamanho['analises'][i]:
+            print(f"  {faixa:>15} caracteres: {por_tamanho['tokens_medio'][i]:8.0f} tokens em média "
+                  f"({por_tamanho['analises'][i]} análise(s))")
+    print(f"  Tendência: {round(por_tamanho['tokens_fixos'])} tokens fixos + "
+          f"{round(por_tamanho['tokens_por_mil_chars'])} a cada 1.000 caracteres")
+    
+    print("\nRequisições por tipo:")
+    por_tipo = resumo_requisicoes(dados)
+    for i, tipo in enumerate(por_tipo['tipo']):
+        print(f"  {tipo}: {por_tipo['requisicoes'][i]} ({por_tipo['reaproveitadas'][i]} reaproveitada(s), "
+              f"{por_tipo['erros'][i]} erro(s)), {por_tipo['tokens_input'][i]} tokens de entrada, "
+              f"{por_tipo['tokens_output'][i]} de saída")
 
 def main():
+    parser = argparse.ArgumentParser(description="Analisador de Roteiros de Vídeo")
+    parser.add_argument('roteiro', nargs='?', help="Arquivo do roteiro (pergunta se omitido)")
+    parser.add_argument('--historico', nargs='?', const='', metavar='BUSCA',
+                        help="Lista as análises salvas ou busca por título/problema apontado")
+    parser.add_argument('--abrir', type=int, metavar='ID',
+                        help="Gera o relatório de uma análise salva sem chamar a API")
+    parser.add_argument('--refazer', action='store_true',
+                        help="Analisa novamente mesmo se o roteiro já estiver no histórico")
+    parser.add_argument('--reaproveitar-similares', nargs='?', const=0.9, type=float, metavar='LIMIAR',
+                        help="Reaproveita o veredito de trechos quase idênticos a trechos já aprovados (padrão: 0.9)")
+    parser.add_argument('--reverificar-trechos', action='store_true',
+                        help="Com --reaproveitar-similares, reanalisa apenas as regiões alteradas")
+    parser.add_argument('--duas-fases', action='store_true',
+                        help="Pede primeiro só o veredito (poucos tokens) e a explicação apenas se não for aprovado")
+    parser.add_argument('--duplicar-lentas', action='store_true',
+                        help="Reenvia requisições mais lentas que o p95 e fica com a primeira resposta")
+    parser.add_argument('--gravar', metavar='ARQUIVO',
+                        help="Grava as requisições e respostas do modelo (ex: gravacoes/base.jsonl.gz)")
+    parser.add_argument('--reproduzir', metavar='ARQUIVO',
+                        help="Responde com uma gravação, sem chamar a API (não salva no histórico)")
+    parser.add_argument('--perfil', '--profile', nargs='?', const='perfil_analise', metavar='PREFIXO',
+                        help="Mostra o tempo de cada fase e grava PREFIXO.folded (pilhas para flame graph)")
+    parser.add_argument('--amostrar', action='store_true',
+                        help="Com --perfil, amostra também as pilhas Python de todas as threads (PREFIXO.amostras.folded)")
+    parser.add_argument('--formato', choices=list(RENDERIZADORES), default="texto",
+                        help="Formato do relatório (o diário .jsonl ao lado é sempre gravado)")
+    parser.add_argument('--observar', '--watch', action='store_true',
+                        help="Fica observando o roteiro (ou a pasta de roteiros) e reanalisa a cada gravação")
+    parser.add_argument('--intervalo', type=float, default=0.5, metavar='SEGUNDOS',
+                        help="Com --observar, intervalo entre as consultas aos arquivos (padrão: 0.5)")
+    parser.add_argument('--espera', type=float, default=1.0, metavar='SEGUNDOS',
+                        help="Com --observar, pausa sem gravações antes de reanalisar (padrão: 1.0)")
+    parser.add_argument('--lote', action='store_true',
+                        help="Prioridade de lote: cede a vez às análises interativas deste processo (ex: catálogo inteiro)")
+    parser.add_argument('--estatisticas', action='store_true',
+                        help="Mostra estatísticas do histórico (reprovação por critério, modelos, tokens)")
+    parser.add_argument('--importar-relatorios', nargs='?', const='relatorio_analise_*.txt', metavar='PADRAO',
+                        help="Com --estatisticas, importa antes os relatórios em texto antigos (padrão: relatorio_analise_*.txt)")
+    args = parser.parse_args()
+    
+    if args.historico is not None:
+        listar_historico(args.historico)
+        return
+    
+    if args.estatisticas:
+        mostrar_estatisticas(args.importar_relatorios)
+        return
+    
     print("="*60)
     print("ANALISADOR DE ROTEIROS DE VÍDEO")
     print("="*60)
     
     # Carregar arquivo .env
-    load_env()
+    carregar_env()
     
-    # Verificar se a API key está configurada
-    if not os.getenv('OPENAI_API_KEY'):
-        print("\n❌ ERRO: Variável de ambiente OPENAI_API_KEY não encontrada!")
-        print("Por favor, crie um arquivo .env com sua chave da OpenAI:")
-        print("OPENAI_API_KEY=sua_chave_aqui")
+    if args.abrir is not None:
+        analise = HistoricoAnalises().carregar(args.abrir)
+        if not analise:
+            print(f"❌ Análise {args.abrir} não encontrada no histórico!")
+            return
+        
+        arquivo_relatorio = AnalisadorRoteiro(modelo=analise['modelo']).gerar_relatorio(
+            analise['resultados'], analise['titulo'], formato=args.formato
+        )
+        print(f"\n📄 Relatório da análise {args.abrir} salvo em: {arquivo_relatorio}")
         return
     
     # Solicitar arquivo do roteiro
-    arquivo_roteiro = input("\nDigite o caminho para o arquivo do roteiro: ").strip()
+    arquivo_roteiro = args.roteiro or input("\nDigite o caminho para o arquivo do roteiro: ").strip()
     
     if not os.path.exists(arquivo_roteiro):
         print(f"❌ Arquivo '{arquivo_roteiro}' não encontrado!")
@@ -50,23 +159,108 @@ def main():
         print("Certifique-se de que o arquivo criterios.txt está no mesmo diretório.")
         return
     
+    # Verificar se os backends usados têm chave: OPENAI_API_KEY, pool em OPENAI_API_KEYS, chaves do
+    # backends.json ou servidor local (a reprodução não chama a API)
+    sem_chave = [] if args.reproduzir else carregar_backends().backends_sem_chave()
+    if sem_chave:
+        print(f"\n❌ ERRO: Nenhuma chave de API para o(s) backend(s): {', '.join(sem_chave)}!")
+        print("Por favor, crie um arquivo .env com sua chave da OpenAI (ou várias, separadas por vírgula):")
+        print("OPENAI_API_KEY=sua_chave_aqui")
+        print("OPENAI_API_KEYS=chave1,chave2")
+        return
+    
+    # Amostragem das pilhas durante toda a análise (inclui a thread do event loop)
+    amostrador = AmostradorPilhas().iniciar() if args.perfil and args.amostrar else None
+    
     # Inicializar analisador
-    analisador = AnalisadorRoteiro()
+    analisador = AnalisadorRoteiro(
+        duas_fases=args.duas_fases,
+        limiar_similaridade=args.reaproveitar_similares,
+        reverificar_trechos=args.reverificar_trechos,
+        duplicar_lentas=args.duplicar_lentas,
+        prioridade="lote" if args.lote else "interativa",
+        gravar_em=args.gravar,
+        reproduzir_de=args.reproduzir,
+        perfilar=bool(args.perfil),
+        # Observando, o cache guarda as respostas de todos os trechos e critérios entre as gravações
+        tamanho_cache=4096 if args.observar else None
+    )
+    
+    if args.observar:
+        from observador import observar
+        observar(analisador, arquivo_roteiro, arquivo_criterios, args.intervalo, args.espera)
+        return
     
     print(f"\n📋 Arquivo do roteiro: {arquivo_roteiro}")
     print(f"📋 Arquivo de critérios: {arquivo_criterios}")
     
-    # Executar análise
-    print("\n🔄 Iniciando análise...")
-    resultados = analisador.analisar_roteiro_completo(arquivo_roteiro, arquivo_criterios)
+    # Reaproveitar análise do histórico se o roteiro não mudou
+    historico = HistoricoAnalises()
+    roteiro = analisador.ler_roteiro(arquivo_roteiro)
+    analise_salva = None
+    diario = None
+    # Critérios e opções que mudam o resultado: a análise salva só vale se forem os mesmos
+    assinatura = roteiro and assinatura_analise(roteiro, analisador.ler_criterios(arquivo_criterios), analisador.modelo, {
+        'duas_fases': args.duas_fases,
+        'limiar_similaridade': args.reaproveitar_similares,
+        'reverificar_trechos': args.reverificar_trechos
+    })
+    # Gravação e reprodução sempre passam pelo modelo (ou pela gravação), nunca pelo histórico
+    if roteiro and not (args.refazer or args.gravar or args.reproduzir):
+        analise_salva = historico.buscar_por_roteiro(roteiro, analisador.modelo, assinatura)
     
-    if not resultados:
-        print("❌ Erro na análise. Verifique os arquivos e tente novamente.")
-        return
+    if analise_salva:
+        print(f"\n📚 Roteiro já analisado em {analise_salva['criado_em'].replace('T', ' ')} "
+              f"(ID {analise_salva['id']}). Use --refazer para analisar novamente.")
+        resultados = analise_salva['resultados']
+    else:
+        # Executar análise
+        print("\n🔄 Iniciando análise...")
+        # Cada critério vai para o diário (e para o disco) assim que termina: uma queda não perde o que já foi feito
+        diario = DiarioRelatorio(f"relatorio_analise_{datetime.now().strftime('%Y%m%d_%H%M%S')}.jsonl",
+                                 arquivo_roteiro, analisador.modelo)
+        try:
+            resultados = analisador.analisar_roteiro_completo(arquivo_roteiro, arquivo_criterios, ao_concluir=diario.registrar)
+        except KeyboardInterrupt:
+            analisador.cancelar()  # A análise roda na thread do event loop: parar as requisições pendentes
+            print(f"\n🛑 Análise interrompida; {diario.registrados} critério(s) em {diario.arquivo} "
+                  f"(python relatorios.py {diario.arquivo} para o relatório)")
+            return
+        diario.fechar()
+        
+        if not resultados:
+            os.remove(diario.arquivo)
+            print("❌ Erro na análise. Verifique os arquivos e tente novamente.")
+            return
+        
+        if not args.reproduzir:
+            historico.salvar(roteiro, resultados, analisador.modelo, analisador.log_requisicoes, assinatura=assinatura)
+        
+        for tipo, dados in analisador.metricas.resumo().items():
+            print(f"📈 {tipo}: {dados['requisicoes']} requisição(ões), {dados['cache']} do cache, "
+                  f"{dados['erros']} erro(s), {dados['duplicadas']} duplicada(s), {dados['tokens_total']} tokens, "
+                  f"{dados['latencia_media']:.2f}s em média")
+            if dados['ttft_medio'] is not None:
+                print(f"   ⚡ primeiro token em {dados['ttft_medio']:.2f}s em média, "
+                      f"{dados['interrompidas']} encerrada(s) no \"✅ APROVADO\"")
+        for classe, dados in ESCALONADOR.estatisticas().items():
+            if dados['espera_maxima']:
+                print(f"⏳ Fila ({classe}): {dados['atendidas']} requisição(ões), espera média "
+                      f"{dados['espera_media']:.2f}s, máxima {dados['espera_maxima']:.2f}s")
+        for backend in analisador.roteador.backends.values():
+            if len(backend.chaves) > 1:
+                for uso in backend.uso_chaves():
+                    print(f"🔑 {uso['nome']}: {uso['requisicoes']} requisição(ões), {uso['tokens_total']} tokens, "
+                          f"{uso['limites_taxa']} limite(s) de taxa, {uso['estado']}")
+        custo, sem_preco = custo_requisicoes(analisador.log_requisicoes)
+        aviso = f" (sem preço conhecido, fora da soma: {', '.join(sem_preco)})" if sem_preco else ""
+        print(f"💰 Custo estimado: US$ {custo:.4f}{aviso}")
     
     # Gerar relatório
     print("\n📄 Gerando relatório...")
-    arquivo_relatorio = analisador.gerar_relatorio(resultados, arquivo_roteiro)
+    arquivo_relatorio = analisador.gerar_relatorio(
+        resultados, arquivo_roteiro, formato=args.formato, diario=diario and diario.arquivo
+    )
     
     if arquivo_relatorio:
         print(f"\n✅ Análise concluída!")
@@ -74,6 +268,15 @@ def main():
         print(f"📊 {len(resultados)} critérios analisados")
     else:
         print("❌ Erro ao gerar relatório.")
+    
+    if analisador.perfil:
+        print(f"\n{analisador.perfil.texto()}")
+        salvar_pilhas(analisador.perfil.pilhas(), f"{args.perfil}.folded")
+        print(f"🔥 Fases em {args.perfil}.folded (flamegraph.pl ou speedscope.app)")
+    if amostrador:
+        amostras = amostrador.parar()
+        salvar_pilhas(amostras, f"{args.perfil}.amostras.folded")
+        print(f"🔥 {sum(amostras.values())} amostras de pilha em {args.perfil}.amostras.folded")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,164 @@
+import json
+import threading
+from ingestao import TAMANHO_TRECHO
+
+ARQUIVO_MODELOS = 'modelos.json'
+
+CARACTERES_POR_TOKEN = 3  # Estimativa conservadora para português (o tokenizador dá ~3,5-4)
+RESERVA_PROMPT = 1500  # Tokens das instruções do sistema e do critério em cada requisição
+TAMANHO_TRECHO_MAX = 32000  # Caracteres por trecho mesmo com janelas enormes (respostas piores e mais lentas acima disso)
+COTACAO_DOLAR = 6  # Reais por dólar nas estimativas de custo
+
+# Modelos conhecidos: janela de contexto e saída máxima em tokens, preços em US$ por 1M de tokens
+# (entrada, entrada em cache, saída) e limite padrão de requisições por minuto (tier 1 da OpenAI)
+MODELOS_CONHECIDOS = {
+    "gpt-4o-mini": {"janela_contexto": 128000, "max_saida": 16384, "preco_entrada": 0.15,
+                    "preco_cache": 0.075, "preco_saida": 0.60, "requisicoes_por_minuto": 500},
+    "gpt-4o": {"janela_contexto": 128000, "max_saida": 16384, "preco_entrada": 2.50,
+               "preco_cache": 1.25, "preco_saida": 10.00, "requisicoes_por_minuto": 500},
+    "gpt-4.1-nano": {"janela_contexto": 1047576, "max_saida": 32768, "preco_entrada": 0.10,
+                     "preco_cache": 0.025, "preco_saida": 0.40, "requisicoes_por_minuto": 500},
+    "gpt-4.1-mini": {"janela_contexto": 1047576, "max_saida": 32768, "preco_entrada": 0.40,
+                     "preco_cache": 0.10, "preco_saida": 1.60, "requisicoes_por_minuto": 500},
+    "gpt-4.1": {"janela_contexto": 1047576, "max_saida": 32768, "preco_entrada": 2.00,
+                "preco_cache": 0.50, "preco_saida": 8.00, "requisicoes_por_minuto": 500},
+    "gpt-4-turbo": {"janela_contexto": 128000, "max_saida": 4096, "preco_entrada": 10.00,
+                    "preco_saida": 30.00, "requisicoes_por_minuto": 500},
+    "gpt-4": {"janela_contexto": 8192, "max_saida": 8192, "preco_entrada": 30.00,
+              "preco_saida": 60.00, "requisicoes_por_minuto": 500},
+    "gpt-3.5-turbo": {"janela_contexto": 16385, "max_saida": 4096, "preco_entrada": 0.50,
+                      "preco_saida": 1.50, "requisicoes_por_minuto": 3500},
+}
+
+class CapacidadesModelo:
+    """Limites e preços de um modelo; campos None são desconhecidos e caem nos padrões do analisador"""
+
+    def __init__(self, nome, janela_contexto=None, max_saida=None, preco_entrada=None, preco_cache=None,
+                 preco_saida=None, requisicoes_por_minuto=None, suporta_json=True, conhecido=True):
+        self.nome = nome
+        self.janela_contexto = janela_contexto  # Tokens de entrada + saída por requisição
+        self.max_saida = max_saida  # Tokens máximos da resposta
+        self.preco_entrada = preco_entrada  # US$ por 1M de tokens
+        self.preco_cache = preco_cache  # Entrada servida do cache de prompt (None = mesmo da entrada)
+        self.preco_saida = preco_saida
+        self.requisicoes_por_minuto = requisicoes_por_minuto  # Limite padrão na API da OpenAI
+        self.suporta_json = suporta_json
+        self.conhecido = conhecido  # False = modelo fora do registro (capacidades genéricas)
+
+    @classmethod
+    def de_config(cls, nome, config):
+        """Cria as capacidades a partir de um dicionário (ex: uma entrada de modelos.json)"""
+        return cls(nome=nome, **config)
+
+    def tamanho_trecho(self, max_tokens):
+        """Caracteres de roteiro por requisição que cabem na janela junto com o prompt e a resposta"""
+        if not self.janela_contexto:
+            return TAMANHO_TRECHO
+        tokens = self.janela_contexto - self.limitar_saida(max_tokens) - RESERVA_PROMPT
+        if tokens <= 0:
+            return TAMANHO_TRECHO
+        return min(TAMANHO_TRECHO_MAX, tokens * CARACTERES_POR_TOKEN)
+
+    def limitar_saida(self, max_tokens):
+        """max_tokens dentro da saída máxima do modelo"""
+        return min(max_tokens, self.max_saida) if self.max_saida else max_tokens
+
+    @property
+    def tem_preco(self):
+        return self.preco_entrada is not None and self.preco_saida is not None
+
+    def custo(self, tokens_input, tokens_output, tokens_cache=0):
+        """Custo estimado em US$ (0 se o modelo não tiver preço)"""
+        if not self.tem_preco:
+            return 0.0
+        preco_cache = self.preco_entrada if self.preco_cache is None else self.preco_cache
+        return ((tokens_input - tokens_cache) * self.preco_entrada + tokens_cache * preco_cache
+                + tokens_output * self.preco_saida) / 1_000_000
+
+    def resumo(self):
+        """Resumo para exibição (ex: "contexto 128k · saída 16k · US$ 0.15 / 0.60 por 1M tokens")"""
+        partes = []
+        if self.janela_contexto:
+            partes.append(f"contexto {self.janela_contexto // 1000}k")
+        if self.max_saida:
+            partes.append(f"saída {self.max_saida // 1000}k")
+        if self.tem_preco:
+            partes.append(f"US$ {self.preco_entrada:g} / {self.preco_saida:g} por 1M tokens")
+        return " · ".join(partes) or "capacidades desconhecidas"
+
+class RegistroModelos:
+    """Capacidades por nome de modelo; nomes com data ou sufixo (ex: gpt-4o-2024-08-06) usam o modelo base"""
+
+    def __init__(self, modelos=None):
+        self.modelos = dict(modelos or {})  # Nome -> CapacidadesModelo
+        self._lock = threading.Lock()
+
+    def registrar(self, nome, **capacidades):
+        """Registra (ou atualiza) um modelo para todo o processo (valores de uma sessão: capacidades_modelo)"""
+        with self._lock:
+            self.modelos[nome] = CapacidadesModelo(nome, **capacidades)
+        return self.modelos[nome]
+
+    def capacidades(self, nome):
+        """Capacidades do modelo pelo nome exato ou pelo prefixo mais longo; genéricas se desconhecido"""
+        with self._lock:
+            if nome in self.modelos:
+                return self.modelos[nome]
+            bases = [base for base in self.modelos if nome.startswith(base + "-")]
+            if bases:
+                return self.modelos[max(bases, key=len)]
+        return CapacidadesModelo(nome, conhecido=False)
+
+def carregar_modelos(arquivo=ARQUIVO_MODELOS):
+    """Registro com os modelos conhecidos e os de modelos.json (que também podem corrigir os conhecidos)"""
+    try:
+        with open(arquivo, 'r', encoding='utf-8') as f:
+            config = json.load(f)
+    except FileNotFoundError:
+        config = {}
+
+    modelos = {nome: dict(capacidades) for nome, capacidades in MODELOS_CONHECIDOS.items()}
+    for nome, capacidades in config.items():
+        modelos[nome] = {**modelos.get(nome, {}), **capacidades}
+    return RegistroModelos({nome: CapacidadesModelo.de_config(nome, opcoes) for nome, opcoes in modelos.items()})
+
+_registro = None
+_lock_registro = threading.Lock()
+
+def registro_modelos():
+    """Registro compartilhado pelo processo (carregado na primeira consulta)"""
+    global _registro
+    with _lock_registro:
+        if _registro is None:
+            _registro = carregar_modelos()
+    return _registro
+
+def capacidades_modelo(nome, informadas=None):
+    """Atalho para as capacidades de um modelo no registro compartilhado
+
+    informadas: {nome: {campo: valor}} com capacidades de uma sessão (ex: um modelo personalizado
+    digitado no app), usadas no lugar do registro sem alterá-lo para as outras sessões.
+    """
+    if informadas and nome in informadas:
+        return CapacidadesModelo(nome, **informadas[nome])
+    return registro_modelos().capacidades(nome)
+
+def custo_requisicoes(log_requisicoes, capacidades=None):
+    """Custo estimado em US$ das requisições do log e os modelos sem preço conhecido (fora da soma)
+
+    Cobra pelo modelo servido (após o mapa_modelos do backend); servidores locais não custam nada.
+    capacidades: valores informados pelo usuário por nome de modelo, que têm precedência sobre o registro.
+    """
+    total = 0.0
+    sem_preco = set()
+    for entrada in log_requisicoes:
+        if entrada.get('local'):
+            continue
+        modelo = entrada.get('modelo_servido') or entrada.get('modelo', '')
+        capacidades_entrada = capacidades_modelo(modelo, capacidades)
+        if not capacidades_entrada.tem_preco and entrada.get('tokens_total'):
+            sem_preco.add(modelo)
+        total += capacidades_entrada.custo(
+            entrada.get('tokens_input', 0), entrada.get('tokens_output', 0), entrada.get('tokens_cache', 0)
+        )
+    return total, sorted(sem_preco)
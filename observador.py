@@ -0,0 +1,145 @@
+import os
+import glob
+import time
+from analisador import classificar_resultado
+from ingestao import dividir_paragrafos
+from pipeline import executar_sincrono
+from relatorios import ICONES_VEREDITO
+
+EXTENSOES_ROTEIRO = (".txt", ".md", ".fountain")
+# Arquivos de texto comuns em uma pasta de projeto que não são roteiros (comparados sem a extensão)
+PREFIXOS_IGNORADOS = ("relatorio_", "requirements", "constraints", "readme", "license", "changelog")
+
+def roteiros_observados(alvo):
+    """Roteiros do alvo: o próprio arquivo ou os roteiros da pasta (sem relatórios, dependências e afins)"""
+    if os.path.isfile(alvo):
+        return [alvo]
+    return sorted(
+        arquivo for arquivo in glob.glob(os.path.join(alvo, "*"))
+        if os.path.splitext(arquivo)[1].lower() in EXTENSOES_ROTEIRO
+        and not os.path.basename(arquivo).lower().startswith(PREFIXOS_IGNORADOS)
+    )
+
+def nome_relatorio(arquivo_roteiro):
+    """Relatório reescrito a cada análise do roteiro (ex: relatorio_episodio1.txt)"""
+    return f"relatorio_{os.path.splitext(os.path.basename(arquivo_roteiro))[0]}.txt"
+
+class ObservadorArquivos:
+    """Observa arquivos por consulta periódica (data de modificação e tamanho), sem dependências
+
+    Avisa só depois de uma pausa de `espera` segundos sem mudanças, para juntar as gravações
+    seguidas de um editor (ex: salvar em arquivo temporário e renomear) em uma única análise.
+    """
+
+    def __init__(self, listar, intervalo=0.5, espera=1.0):
+        self.listar = listar  # Função que devolve os arquivos observados (a pasta pode ganhar arquivos)
+        self.intervalo = intervalo
+        self.espera = espera
+        self._conhecido = self._estado()
+
+    def _estado(self):
+        estado = {}
+        for arquivo in self.listar():
+            try:
+                info = os.stat(arquivo)
+            except FileNotFoundError:
+                continue  # Removido entre a listagem e a consulta (editor salvando)
+            estado[arquivo] = (info.st_mtime_ns, info.st_size)
+        return estado
+
+    def esperar_mudancas(self):
+        """Bloqueia até haver mudanças seguidas de uma pausa; devolve os arquivos alterados ou criados"""
+        ultima_mudanca = None
+        visto = self._conhecido
+        while True:
+            time.sleep(self.intervalo)
+            atual = self._estado()
+            if atual != visto:
+                visto = atual
+                ultima_mudanca = time.monotonic()
+            elif ultima_mudanca is not None and time.monotonic() - ultima_mudanca >= self.espera:
+                alterados = {arquivo for arquivo, marca in atual.items() if self._conhecido.get(arquivo) != marca}
+                self._conhecido = atual
+                if alterados:
+                    return alterados
+                ultima_mudanca = None  # Só remoções: nada a analisar
+
+def _analisar(analisador, arquivo_roteiro, criterios, vereditos_anteriores):
+    """Analisa um roteiro, reescreve o relatório e mostra o resumo e os vereditos que mudaram"""
+    try:
+        with open(arquivo_roteiro, 'r', encoding='utf-8') as f:
+            roteiro = f.read()
+    except (FileNotFoundError, UnicodeDecodeError) as e:
+        print(f"⚠️ {arquivo_roteiro} ignorado: {e}")
+        return
+    if not roteiro.strip():
+        return
+
+    analisador.log_requisicoes.clear()  # Só o log desta análise (o processo pode ficar aberto o dia todo)
+    inicio = time.perf_counter()
+    # Trechos pequenos cortados pelo conteúdo dos parágrafos: uma edição muda só o trecho dela
+    trechos = lambda max_chars: dividir_paragrafos(roteiro, max_chars)
+    # Critérios em paralelo no event loop compartilhado (os clientes e o cache continuam entre as análises)
+    resultados = executar_sincrono(analisador.analisar_texto_async(trechos, criterios))
+    duracao = time.perf_counter() - inicio
+    if not resultados:
+        return
+
+    arquivo_relatorio = analisador.gerar_relatorio(resultados, arquivo_roteiro, nome_arquivo=nome_relatorio(arquivo_roteiro))
+    log = analisador.log_requisicoes
+    novas = sum(1 for entrada in log if not entrada.get('reaproveitado'))
+    tokens = sum(entrada.get('tokens_total', 0) for entrada in log)
+
+    vereditos = {resultado['criterio']['titulo']: classificar_resultado(resultado['resultado']) for resultado in resultados}
+    contagem = " ".join(
+        f"{ICONES_VEREDITO[veredito]} {list(vereditos.values()).count(veredito)}"
+        for veredito in ICONES_VEREDITO if veredito in vereditos.values()
+    )
+    print(f"📄 {arquivo_relatorio} em {duracao:.1f}s — {contagem} · {novas} requisição(ões) nova(s), "
+          f"{len(log) - novas} reaproveitada(s), {tokens} tokens")
+
+    anteriores = vereditos_anteriores.get(arquivo_roteiro)
+    if anteriores:
+        for titulo, veredito in vereditos.items():
+            if titulo in anteriores and anteriores[titulo] != veredito:
+                print(f"   ↪ {titulo}: {ICONES_VEREDITO[anteriores[titulo]]} → {ICONES_VEREDITO[veredito]}")
+    vereditos_anteriores[arquivo_roteiro] = vereditos
+
+def observar(analisador, alvo, arquivo_criterios='criterios.txt', intervalo=0.5, espera=1.0):
+    """Analisa os roteiros do alvo e reanalisa cada um a cada gravação, até Ctrl+C
+
+    O roteiro é dividido em trechos pequenos de parágrafos inteiros (dividir_paragrafos) e o cache do
+    pipeline continua vivo entre as análises: só o trecho com o parágrafo editado vai de novo ao modelo
+    em cada critério, e a consolidação só muda se algum veredito mudar. Com limiar_similaridade/
+    reverificar_trechos no analisador, até o trecho editado pode reaproveitar o veredito de um quase igual.
+    """
+    def roteiros():
+        # O arquivo de critérios pode estar na pasta observada, mas não é um roteiro
+        return [arquivo for arquivo in roteiros_observados(alvo)
+                if os.path.abspath(arquivo) != os.path.abspath(arquivo_criterios)]
+
+    def listar():
+        return roteiros() + [arquivo_criterios]
+
+    criterios = analisador.ler_criterios(arquivo_criterios)
+    vereditos_anteriores = {}  # Roteiro -> {critério: veredito} da última análise
+    observador = ObservadorArquivos(listar, intervalo, espera)
+
+    print(f"\n👀 Observando {alvo} (Ctrl+C para sair)")
+    try:
+        for arquivo in roteiros():
+            _analisar(analisador, arquivo, criterios, vereditos_anteriores)
+
+        while True:
+            print("\n⏳ Aguardando alterações...")
+            alterados = observador.esperar_mudancas()
+            if arquivo_criterios in alterados:
+                # Critérios mudaram: todos os roteiros, mas só os critérios alterados vão ao modelo
+                criterios = analisador.ler_criterios(arquivo_criterios)
+                alterados = set(roteiros())
+                print(f"📝 {arquivo_criterios} alterado: {len(criterios)} critério(s)")
+            for arquivo in sorted(alterados):
+                print(f"\n🔄 {arquivo} alterado")
+                _analisar(analisador, arquivo, criterios, vereditos_anteriores)
+    except KeyboardInterrupt:
+        print("\n👋 Observação encerrada")
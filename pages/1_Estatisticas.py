@@ -0,0 +1,70 @@
+import os
+import streamlit as st
+from historico import ARQUIVO_HISTORICO, HistoricoAnalises
+from estatisticas import (DadosAnalises, importar_relatorios, vereditos_por_criterio,
+                          resumo_por_modelo, tokens_por_tamanho, serie_diaria, resumo_requisicoes)
+
+@st.cache_data(show_spinner="Calculando estatísticas...")
+def calcular_estatisticas(arquivo, modificado_em):
+    """Carrega o histórico em colunas e calcula os agregados (refeito apenas quando o histórico muda)"""
+    dados = DadosAnalises(HistoricoAnalises(arquivo))
+    return {
+        'analises': len(dados),
+        'criterios': vereditos_por_criterio(dados),
+        'modelos': resumo_por_modelo(dados),
+        'tamanho': tokens_por_tamanho(dados),
+        'diario': serie_diaria(dados),
+        'requisicoes': resumo_requisicoes(dados)
+    }
+
+def main():
+    st.set_page_config(page_title="Estatísticas", page_icon="📈", layout="wide")
+    st.title("📈 Estatísticas do Histórico")
+
+    with st.sidebar:
+        st.header("📥 Relatórios antigos")
+        padrao = st.text_input("Arquivos", value="relatorio_analise_*.txt",
+                               help="Relatórios em texto gerados antes do histórico")
+        if st.button("Importar relatórios"):
+            st.toast(f"📥 {importar_relatorios(padrao)} relatório(s) importado(s)")
+
+    modificado_em = os.path.getmtime(ARQUIVO_HISTORICO) if os.path.exists(ARQUIVO_HISTORICO) else 0
+    estatisticas = calcular_estatisticas(ARQUIVO_HISTORICO, modificado_em)
+    if not estatisticas['analises']:
+        st.info("Nenhuma análise no histórico ainda.")
+        return
+
+    modelos = estatisticas['modelos']
+    col1, col2, col3 = st.columns(3)
+    with col1:
+        st.metric("Análises", estatisticas['analises'])
+    with col2:
+        st.metric("Modelos", len(modelos['modelo']))
+    with col3:
+        st.metric("Tokens (total)", f"{int(estatisticas['diario']['tokens'].sum()):,}".replace(",", "."))
+
+    st.subheader("❌ Critérios que mais reprovam")
+    criterios = estatisticas['criterios']
+    st.bar_chart({'Critério': criterios['criterio'], 'Taxa de reprovação': criterios['taxa_reprovacao']},
+                 x='Critério', y='Taxa de reprovação', horizontal=True)
+    st.dataframe(criterios, hide_index=True)
+
+    st.subheader("🤖 Por modelo")
+    st.dataframe(modelos, hide_index=True)
+
+    st.subheader("📏 Tokens por tamanho do roteiro")
+    tamanho = estatisticas['tamanho']
+    st.bar_chart({'Faixa (caracteres)': tamanho['faixa'], 'Tokens médios': tamanho['tokens_medio']},
+                 x='Faixa (caracteres)', y='Tokens médios')
+    st.caption(f"Tendência: {round(tamanho['tokens_fixos'])} tokens fixos + "
+               f"{round(tamanho['tokens_por_mil_chars'])} a cada 1.000 caracteres")
+
+    st.subheader("📅 Por dia")
+    diario = estatisticas['diario']
+    st.line_chart({'Data': diario['data'], 'Taxa de aprovação': diario['taxa_aprovacao']}, x='Data', y='Taxa de aprovação')
+    st.bar_chart({'Data': diario['data'], 'Análises': diario['analises']}, x='Data', y='Análises')
+
+    st.subheader("📡 Requisições por tipo")
+    st.dataframe(estatisticas['requisicoes'], hide_index=True)
+
+main()
@@ -0,0 +1,164 @@
+import sys
+import time
+import threading
+import contextlib
+import contextvars
+from collections import Counter
+
+# Perfil em gravação e fase atual (herdados pelas tarefas asyncio criadas dentro da fase)
+_perfil = contextvars.ContextVar('perfil', default=None)
+_caminho = contextvars.ContextVar('caminho_perfil', default=())
+
+_NULO = contextlib.nullcontext()
+
+class Perfil:
+    """Fases medidas de uma análise (leitura, trechos, fila, modelo, relatório...) com início e duração"""
+
+    def __init__(self):
+        self.fases = []  # (caminho da fase, início em time.perf_counter, duração em segundos)
+        self._lock = threading.Lock()
+
+    def registrar(self, caminho, inicio, duracao):
+        with self._lock:
+            self.fases.append((caminho, inicio, duracao))
+
+    def resumo(self):
+        """Por fase (nome): chamadas, tempo somado, médio e máximo, na ordem do maior tempo somado
+
+        Fases em paralelo (ex: um critério por tarefa) se sobrepõem, então a soma pode passar do tempo total.
+        """
+        with self._lock:
+            fases = list(self.fases)
+        resumo = {}
+        for caminho, _, duracao in fases:
+            dados = resumo.setdefault(caminho[-1], {'chamadas': 0, 'total': 0.0, 'maxima': 0.0})
+            dados['chamadas'] += 1
+            dados['total'] += duracao
+            dados['maxima'] = max(dados['maxima'], duracao)
+        for dados in resumo.values():
+            dados['media'] = dados['total'] / dados['chamadas']
+        return dict(sorted(resumo.items(), key=lambda item: -item[1]['total']))
+
+    def duracao_total(self):
+        """Do início da primeira fase ao fim da última (tempo de parede)"""
+        with self._lock:
+            if not self.fases:
+                return 0.0
+            return max(i + d for _, i, d in self.fases) - min(i for _, i, _ in self.fases)
+
+    def pilhas(self):
+        """Tempo próprio (sem as subfases) de cada caminho em microssegundos, no formato das pilhas colapsadas"""
+        with self._lock:
+            fases = list(self.fases)
+        totais = Counter()
+        for caminho, _, duracao in fases:
+            totais[caminho] += duracao
+        filhos = Counter()
+        for caminho, total in totais.items():
+            if len(caminho) > 1:
+                filhos[caminho[:-1]] += total
+        # Subfases em paralelo podem somar mais que a fase de cima: o tempo próprio não fica negativo
+        return {
+            ";".join(caminho): int(max(0.0, total - filhos[caminho]) * 1_000_000)
+            for caminho, total in totais.items()
+        }
+
+    def texto(self):
+        """Tabela da divisão do tempo por fase, para o terminal"""
+        linhas = [f"⏱️ Perfil da análise: {self.duracao_total():.2f}s no total",
+                  f"{'Fase':<32} {'chamadas':>9} {'somado':>9} {'média':>9} {'máximo':>9}"]
+        for nome, dados in self.resumo().items():
+            linhas.append(f"{nome[:32]:<32} {dados['chamadas']:>9} {dados['total']:>8.2f}s "
+                          f"{dados['media']:>8.3f}s {dados['maxima']:>8.3f}s")
+        return "\n".join(linhas)
+
+def formatar_pilhas(pilhas):
+    """Pilhas colapsadas ("a;b;c valor" por linha), o formato do flamegraph.pl e do speedscope"""
+    return "".join(f"{pilha} {valor}\n" for pilha, valor in sorted(pilhas.items()) if valor > 0)
+
+def salvar_pilhas(pilhas, arquivo):
+    """Grava as pilhas colapsadas em um arquivo"""
+    with open(arquivo, 'w', encoding='utf-8') as f:
+        f.write(formatar_pilhas(pilhas))
+
+class _Fase:
+    """Mede uma fase e a torna a fase atual (as fases abertas dentro dela ficam abaixo no caminho)"""
+
+    def __init__(self, perfil, nome, ativar):
+        self.perfil = perfil
+        self.nome = nome
+        self.ativar = ativar
+
+    def __enter__(self):
+        self.token_perfil = _perfil.set(self.perfil) if self.ativar else None
+        self.caminho = _caminho.get() + (self.nome,)
+        self.token_caminho = _caminho.set(self.caminho)
+        self.inicio = time.perf_counter()
+        return self
+
+    def __exit__(self, *erro):
+        self.perfil.registrar(self.caminho, self.inicio, time.perf_counter() - self.inicio)
+        _caminho.reset(self.token_caminho)
+        if self.token_perfil is not None:
+            _perfil.reset(self.token_perfil)
+        return False
+
+def fase(nome, perfil=None):
+    """Mede a fase no perfil em gravação (ou ativa o perfil informado); sem perfil, não faz nada"""
+    atual = _perfil.get()
+    if atual is not None:
+        return _Fase(atual, nome, False)
+    if perfil is not None:
+        return _Fase(perfil, nome, True)
+    return _NULO
+
+def levar_perfil(corrotina):
+    """Corrotina que continua o perfil e a fase atuais em outro event loop ou thread"""
+    perfil, caminho = _perfil.get(), _caminho.get()
+    if perfil is None:
+        return corrotina
+
+    async def com_perfil():
+        _perfil.set(perfil)
+        _caminho.set(caminho)
+        return await corrotina
+    return com_perfil()
+
+class AmostradorPilhas:
+    """Amostra as pilhas de todas as threads em intervalos fixos (perfil estatístico sem dependências)"""
+
+    def __init__(self, intervalo=0.005):
+        self.intervalo = intervalo
+        self.amostras = Counter()  # Pilha colapsada -> número de amostras
+        self._parar = threading.Event()
+        self._thread = None
+
+    def _pilha(self, frame):
+        funcoes = []
+        while frame is not None:
+            codigo = frame.f_code
+            funcoes.append(f"{codigo.co_name} ({codigo.co_filename.rsplit('/', 1)[-1]}:{codigo.co_firstlineno})")
+            frame = frame.f_back
+        return ";".join(reversed(funcoes))
+
+    def _amostrar(self):
+        proprio = threading.get_ident()
+        nomes = {}
+        while not self._parar.wait(self.intervalo):
+            for ident, frame in sys._current_frames().items():
+                if ident == proprio:
+                    continue
+                if ident not in nomes:
+                    nomes = {thread.ident: thread.name for thread in threading.enumerate()}
+                self.amostras[f"{nomes.get(ident, ident)};{self._pilha(frame)}"] += 1
+
+    def iniciar(self):
+        self._thread = threading.Thread(target=self._amostrar, name="amostrador-pilhas", daemon=True)
+        self._thread.start()
+        return self
+
+    def parar(self):
+        self._parar.set()
+        if self._thread:
+            self._thread.join()
+        return self.amostras
@@ -0,0 +1,803 @@
+import copy
+import json
+import time
+import random
+import asyncio
+import hashlib
+import threading
+from collections import OrderedDict, deque
+from datetime import datetime
+from modelos import CARACTERES_POR_TOKEN, capacidades_modelo
+from perfil import fase, levar_perfil
+
+# Erros da API que valem uma nova tentativa (comparados pelo nome, sem importar o pacote openai)
+ERROS_TRANSITORIOS = {"RateLimitError", "APIConnectionError", "APITimeoutError", "InternalServerError"}
+
+# Classes de prioridade e seus pesos: com fila, a interativa recebe 4 vagas para cada 1 do lote
+PESOS_CLASSES = {"interativa": 4, "lote": 1}
+
+class Requisicao:
+    """Uma chamada ao modelo, com tudo que os estágios do pipeline precisam"""
+
+    def __init__(self, tipo, backend, modelo, messages, max_tokens, temperature, prompt="", limite=None,
+                 classe="interativa", usuario=None, modelo_pedido=None, ao_receber=None, parar_em=None,
+                 ao_despachar=None):
+        self.tipo = tipo  # Ex: "Análise de Critério", "Consolidação", "Veredito"
+        self.backend = backend
+        self.modelo = modelo  # Nome do modelo já traduzido para o backend
+        self.messages = messages
+        self.max_tokens = max_tokens
+        self.temperature = temperature
+        self.prompt = prompt  # Prompt do usuário, para o log
+        self.limite = limite  # Instante (time.monotonic) em que a análise precisa terminar
+        self.classe = classe  # Prioridade na fila: "interativa" (editor esperando) ou "lote"
+        self.usuario = usuario  # Usuário ou sessão, para dividir as vagas de forma justa
+        self.modelo_pedido = modelo_pedido  # Modelo antes da tradução do backend (ex: escolhido pelo critério)
+        # Com streaming: ao_receber(texto até agora) a cada pedaço e parar_em encerra a resposta cuja primeira linha for ele
+        self.ao_receber = ao_receber
+        self.parar_em = parar_em
+        # ao_despachar(requisicao) ao receber a vaga, antes do envio: uma exceção impede o envio (ex: orçamento)
+        self.ao_despachar = ao_despachar
+        self.despachada_em = None  # Instante (time.monotonic) em que o escalonador deu a vaga
+        self.concluida_em = None  # Instante em que a resposta chegou (ou a requisição falhou)
+
+    @property
+    def streaming(self):
+        """Resposta em streaming: só se alguém acompanha o texto parcial ou pode encerrá-lo cedo"""
+        return self.backend.suporta_streaming and bool(self.ao_receber or self.parar_em)
+
+    @property
+    def prompt_chars(self):
+        """Tamanho do que foi enviado pelo usuário (trecho e instruções)"""
+        return sum(len(mensagem['content']) for mensagem in self.messages if mensagem['role'] == 'user')
+
+    def tempo_restante(self):
+        """Segundos até o prazo (None se não houver prazo)"""
+        if self.limite is None:
+            return None
+        return self.limite - time.monotonic()
+
+    def chave(self):
+        """Identifica requisições idênticas (mesmo backend, modelo, mensagens e parâmetros)"""
+        dados = [self.backend.nome, self.modelo, self.messages, self.max_tokens, self.temperature]
+        return hashlib.sha256(json.dumps(dados, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+async def _ler_stream(stream, requisicao, inicio):
+    """Lê a resposta em streaming; devolve o texto, o uso (se veio) e o tempo até o primeiro token
+
+    Se a primeira linha da resposta for exatamente requisicao.parar_em (ex: "✅ APROVADO"), o stream é
+    fechado ao fim dela, sem esperar (nem pagar) o que o modelo ainda acrescentaria. O marcador citado
+    em uma frase ("✅ APROVADO com ressalvas", "... não seria ✅ APROVADO") não encerra a resposta.
+    """
+    texto = ""
+    uso = None
+    extras = {'ttft': None}
+    decidido = not requisicao.parar_em  # Já se sabe se a primeira linha é parar_em
+    try:
+        async for pedaco in stream:
+            if getattr(pedaco, 'usage', None):
+                uso = pedaco.usage  # Último evento, com stream_options include_usage
+            if not pedaco.choices or not pedaco.choices[0].delta.content:
+                continue
+            if extras['ttft'] is None:
+                extras['ttft'] = time.perf_counter() - inicio
+            texto += pedaco.choices[0].delta.content
+            if not decidido:
+                primeira_linha, quebra, _ = texto.lstrip().partition("\n")
+                if not requisicao.parar_em.startswith(primeira_linha.strip()):
+                    decidido = True  # A primeira linha já é outra coisa
+                elif quebra:
+                    decidido = True
+                    if primeira_linha.strip() == requisicao.parar_em:
+                        texto = requisicao.parar_em
+                        extras['interrompida'] = True
+            if requisicao.ao_receber:
+                requisicao.ao_receber(texto)
+            if extras.get('interrompida'):
+                break
+    finally:
+        await stream.close()
+    return texto, uso, extras
+
+def _contar_tokens(uso, requisicao, conteudo):
+    """Tokens do uso informado pela API; sem ele (stream encerrado antes do fim), estimados pelos caracteres"""
+    if uso is None and requisicao.streaming:
+        entrada = sum(len(mensagem['content']) for mensagem in requisicao.messages) // CARACTERES_POR_TOKEN
+        saida = max(1, len(conteudo) // CARACTERES_POR_TOKEN)
+        return {'tokens_input': entrada, 'tokens_output': saida, 'tokens_total': entrada + saida,
+                'tokens_cache': 0, 'tokens_estimados': True}
+    detalhes = getattr(uso, 'prompt_tokens_details', None)
+    return {
+        'tokens_input': uso.prompt_tokens if uso else 0,
+        'tokens_output': uso.completion_tokens if uso else 0,
+        'tokens_total': uso.total_tokens if uso else 0,
+        'tokens_cache': getattr(detalhes, 'cached_tokens', None) or 0  # Entrada do cache de prompt
+    }
+
+async def enviar(requisicao):
+    """Último estágio: envia a requisição ao backend e devolve a resposta como dicionário"""
+    backend = requisicao.backend
+    opcoes = {}
+    restante = requisicao.tempo_restante()
+    if restante is not None:
+        opcoes['timeout'] = max(min(restante, backend.timeout), 0.1)
+    if requisicao.streaming:
+        opcoes.update(stream=True, stream_options={"include_usage": True})
+
+    while True:
+        # Chave do pool do backend; 429 ou erro de autenticação passam para outra chave, se houver
+        with fase("chave"):
+            chave = await backend.reservar_chave()
+        uso_chave = None
+        try:
+            with fase("cliente"):  # Na primeira requisição, inclui importar o openai
+                cliente = backend.cliente_async(chave)
+            with fase("modelo"):
+                inicio = time.perf_counter()
+                response = await cliente.chat.completions.create(
+                    model=requisicao.modelo,
+                    messages=requisicao.messages,
+                    max_tokens=requisicao.max_tokens,
+                    temperature=requisicao.temperature,
+                    **opcoes
+                )
+                if requisicao.streaming:
+                    conteudo, uso, extras = await _ler_stream(response, requisicao, inicio)
+                else:
+                    conteudo, uso, extras = response.choices[0].message.content or "", getattr(response, 'usage', None), {}
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            if backend.registrar_erro(chave, e):
+                continue
+            raise
+        else:
+            uso_chave = _contar_tokens(uso, requisicao, conteudo)
+            break
+        finally:
+            backend.liberar_chave(chave, uso_chave)
+
+    resposta = {
+        'conteudo': conteudo,
+        **uso_chave,
+        **{campo: valor for campo, valor in extras.items() if valor is not None},
+        'backend': backend.nome,
+        'cache': False
+    }
+    if len(backend.chaves) > 1:
+        resposta['chave'] = chave.nome
+    return resposta
+
+class LogRequisicoes:
+    """Registra cada requisição (e cada erro) no log exibido no app e salvo no histórico"""
+
+    def __init__(self, log, modelo):
+        self.log = log
+        self.modelo = modelo
+
+    async def processar(self, requisicao, proximo):
+        prompt = requisicao.prompt
+        prompt_log = prompt[:200] + "..." if len(prompt) > 200 else prompt
+        try:
+            resposta = await proximo(requisicao)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            self.log.append({
+                "timestamp": datetime.now().strftime("%H:%M:%S"),
+                "modelo": requisicao.modelo_pedido or self.modelo,
+                "modelo_servido": requisicao.modelo,
+                "backend": requisicao.backend.nome,
+                "tipo": f"ERRO - {requisicao.tipo}",
+                "erro": str(e),
+                "prompt_chars": requisicao.prompt_chars,
+                "resposta_chars": 0,
+                "tokens_input": 0,
+                "tokens_output": 0,
+                "tokens_total": 0,
+                "prompt": prompt_log,
+                "resposta": f"Erro: {str(e)}"
+            })
+            raise
+
+        entrada = {
+            "timestamp": datetime.now().strftime("%H:%M:%S"),
+            "modelo": requisicao.modelo_pedido or self.modelo,
+            "modelo_servido": requisicao.modelo,  # Nome no servidor (após o mapa_modelos): é o que é cobrado
+            "backend": resposta['backend'],
+            "tipo": requisicao.tipo,
+            "prompt_chars": requisicao.prompt_chars,
+            "resposta_chars": len(resposta['conteudo']),
+            "tokens_input": resposta['tokens_input'],
+            "tokens_output": resposta['tokens_output'],
+            "tokens_total": resposta['tokens_total'],
+            "prompt": prompt_log,
+            "resposta": resposta['conteudo']
+        }
+        if requisicao.backend.local:
+            entrada["local"] = True  # Servidor nesta máquina: sem custo
+        if resposta.get('tokens_cache'):
+            entrada["tokens_cache"] = resposta['tokens_cache']  # Parte da entrada cobrada com desconto
+        if resposta['cache']:
+            # Resposta reaproveitada: não conta como requisição nem como tokens gastos
+            entrada.update({"tipo": f"{requisicao.tipo} (cache)", "reaproveitado": True,
+                            "tokens_input": 0, "tokens_output": 0, "tokens_total": 0, "tokens_cache": 0})
+        elif resposta.get('duplicada'):
+            vencedora = "duplicata" if resposta['duplicata_venceu'] else "original"
+            entrada.update({"tipo": f"{requisicao.tipo} (duplicada, venceu a {vencedora})", "duplicada": True})
+        if resposta.get('ttft') is not None and not resposta['cache']:
+            entrada["ttft"] = round(resposta['ttft'], 3)  # Segundos até o primeiro token (streaming)
+        if resposta.get('interrompida') and not resposta['cache']:
+            entrada["interrompida"] = True  # Encerrada ao começar com o veredito de aprovação
+        if resposta.get('tokens_estimados'):
+            entrada["tokens_estimados"] = True  # Sem o uso da API (stream encerrado): contados pelos caracteres
+        if resposta.get('chave'):
+            entrada["chave"] = resposta['chave']  # Nome da chave do pool que atendeu
+        if resposta.get('espera_fila'):
+            entrada["espera_fila"] = round(resposta['espera_fila'], 3)  # Segundos esperando vaga no escalonador
+        self.log.append(entrada)
+        descartada = resposta.get('descartada')
+        if descartada and not resposta['cache']:
+            # A cópia que perdeu também foi enviada (e cobrada): entra no log com os seus tokens
+            perdedora = "original" if resposta['duplicata_venceu'] else "duplicata"
+            self.log.append({
+                "timestamp": entrada["timestamp"],
+                "modelo": entrada["modelo"],
+                "modelo_servido": entrada["modelo_servido"],
+                "backend": resposta['backend'],
+                "tipo": f"{requisicao.tipo} ({perdedora} descartada)",
+                "prompt_chars": requisicao.prompt_chars,
+                "resposta_chars": descartada['resposta_chars'],
+                "tokens_input": descartada['tokens_input'],
+                "tokens_output": descartada['tokens_output'],
+                "tokens_total": descartada['tokens_total'],
+                "prompt": prompt_log,
+                "resposta": "",
+                "descartada": True,
+                **({"local": True} if entrada.get("local") else {}),
+                **({"tokens_estimados": True} if descartada.get('tokens_estimados') else {})
+            })
+        return resposta
+
+class Metricas:
+    """Contadores por tipo de requisição: chamadas, erros, cache, tokens e latência"""
+
+    def __init__(self):
+        self._por_tipo = {}
+        self._lock = threading.Lock()
+
+    async def processar(self, requisicao, proximo):
+        inicio = time.perf_counter()
+        erro = False
+        resposta = None
+        try:
+            resposta = await proximo(requisicao)
+            return resposta
+        except Exception:
+            erro = True
+            raise
+        finally:
+            self._registrar(requisicao.tipo, time.perf_counter() - inicio, resposta, erro)
+
+    def _registrar(self, tipo, duracao, resposta, erro):
+        with self._lock:
+            dados = self._por_tipo.setdefault(tipo, {
+                'requisicoes': 0, 'erros': 0, 'cache': 0, 'duplicadas': 0, 'tokens_total': 0, 'segundos': 0.0,
+                'com_ttft': 0, 'ttft_total': 0.0, 'interrompidas': 0
+            })
+            dados['requisicoes'] += 1
+            dados['segundos'] += duracao
+            if erro:
+                dados['erros'] += 1
+            elif resposta and resposta['cache']:
+                dados['cache'] += 1
+            elif resposta:
+                dados['tokens_total'] += resposta['tokens_total'] + resposta.get('descartada', {}).get('tokens_total', 0)
+                dados['duplicadas'] += bool(resposta.get('duplicada'))
+                dados['interrompidas'] += bool(resposta.get('interrompida'))
+                if resposta.get('ttft') is not None:
+                    dados['com_ttft'] += 1
+                    dados['ttft_total'] += resposta['ttft']
+
+    def resumo(self):
+        """Cópia dos contadores por tipo, com a latência e o tempo até o primeiro token médios em segundos"""
+        with self._lock:
+            resumo = {tipo: dict(dados) for tipo, dados in self._por_tipo.items()}
+        for dados in resumo.values():
+            dados['latencia_media'] = dados['segundos'] / dados['requisicoes'] if dados['requisicoes'] else 0.0
+            dados['ttft_medio'] = dados['ttft_total'] / dados['com_ttft'] if dados['com_ttft'] else None
+        return resumo
+
+class CacheRespostas:
+    """Cache em memória (LRU) de respostas a requisições idênticas"""
+
+    def __init__(self, max_itens=256):
+        self.max_itens = max_itens
+        self._itens = OrderedDict()
+        self._lock = threading.Lock()
+
+    async def processar(self, requisicao, proximo):
+        chave = requisicao.chave()
+        with self._lock:
+            if chave in self._itens:
+                self._itens.move_to_end(chave)
+                return {**self._itens[chave], 'cache': True}
+
+        resposta = await proximo(requisicao)
+        with self._lock:
+            self._itens[chave] = resposta
+            while len(self._itens) > self.max_itens:
+                self._itens.popitem(last=False)
+        return resposta
+
+class LimiteTaxa:
+    """Baldes de fichas com o limite de requisicoes_por_minuto de cada backend (vale para todos os event loops)
+
+    Uma rajada de até um minuto de requisições sai na hora e as seguintes esperam a reposição. Não é um
+    estágio: o escalonador tira a ficha ao conceder cada vaga, então, com o limite atingido, a próxima
+    ficha vai para quem ele escolheria (a interativa passa à frente do lote). Na API da OpenAI sem limite
+    configurado, vale o limite padrão de cada modelo no registro (por chave do pool).
+    """
+
+    def __init__(self):
+        self._baldes = {}  # Backend (ou backend e modelo) -> (fichas, instante da última atualização)
+        self._lock = threading.Lock()
+
+    def taxa(self, requisicao):
+        """(requisições por minuto, chave do balde) da requisição; (None, None) se não houver limite
+
+        Soma o limite de cada chave do pool: o informado na chave, senão o do backend e, só na API da
+        OpenAI sem nenhum dos dois, o padrão do modelo no registro. Uma chave sem limite deixa o backend sem.
+        """
+        backend = requisicao.backend
+        padrao = None
+        if backend.base_url is None:
+            padrao = capacidades_modelo(requisicao.modelo).requisicoes_por_minuto
+        chaves = [chave for chave in backend.chaves if not chave.descartada] or backend.chaves
+        limites = [chave.requisicoes_por_minuto or backend.requisicoes_por_minuto for chave in chaves]
+        if all(limites):
+            return sum(limites), backend.nome
+        if padrao:
+            # O padrão do registro é por modelo
+            return sum(limite or padrao for limite in limites), (backend.nome, requisicao.modelo)
+        return None, None
+
+    def consumir(self, taxa):
+        """Tira uma ficha do balde da taxa; devolve 0 se conseguiu ou os segundos até haver uma"""
+        por_minuto, chave = taxa
+        if not por_minuto:
+            return 0.0
+        with self._lock:
+            agora = time.monotonic()
+            fichas, atualizado = self._baldes.get(chave, (por_minuto, agora))
+            fichas = min(por_minuto, fichas + (agora - atualizado) * por_minuto / 60)
+            if fichas >= 1:
+                self._baldes[chave] = (fichas - 1, agora)
+                return 0.0
+            self._baldes[chave] = (fichas, agora)
+            return (1 - fichas) * 60 / por_minuto
+
+class Retentativas:
+    """Repete requisições com erros transitórios (limite de taxa, conexão, 5xx) com espera exponencial"""
+
+    def __init__(self, espera_base=0.5, espera_maxima=8.0):
+        self.espera_base = espera_base
+        self.espera_maxima = espera_maxima
+
+    def _transitorio(self, erro):
+        status = getattr(erro, 'status_code', None)
+        return type(erro).__name__ in ERROS_TRANSITORIOS or status == 429 or (status or 0) >= 500
+
+    def _espera(self, erro, tentativa):
+        """Respeita o Retry-After do servidor; senão, espera exponencial com variação aleatória"""
+        resposta = getattr(erro, 'response', None)
+        try:
+            return min(float(resposta.headers.get('retry-after')), self.espera_maxima)
+        except (AttributeError, TypeError, ValueError):
+            return min(self.espera_base * 2 ** tentativa, self.espera_maxima) * random.uniform(0.5, 1.5)
+
+    async def processar(self, requisicao, proximo):
+        tentativa = 0
+        while True:
+            try:
+                return await proximo(requisicao)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if tentativa >= requisicao.backend.max_tentativas or not self._transitorio(e):
+                    raise
+                espera = self._espera(e, tentativa)
+                restante = requisicao.tempo_restante()
+                if restante is not None and espera >= restante:
+                    # Não dá tempo de tentar de novo antes do prazo
+                    raise
+                tentativa += 1
+                with fase("espera_retentativa"):
+                    await asyncio.sleep(espera)
+
+class HistoricoLatencias:
+    """Latências recentes por backend, modelo e tipo de requisição, para estimar percentis"""
+
+    def __init__(self, janela=200):
+        self.janela = janela
+        self._latencias = {}  # (backend, modelo, tipo) -> deque das últimas latências
+        self._lock = threading.Lock()
+
+    def registrar(self, chave, segundos):
+        with self._lock:
+            self._latencias.setdefault(chave, deque(maxlen=self.janela)).append(segundos)
+
+    def percentil(self, chave, percentil, minimo_amostras=20):
+        """Latência no percentil (0-100) ou None se ainda houver poucas amostras"""
+        with self._lock:
+            amostras = sorted(self._latencias.get(chave, ()))
+        if len(amostras) < minimo_amostras:
+            return None
+        return amostras[min(int(len(amostras) * percentil / 100), len(amostras) - 1)]
+
+class RequisicoesRedundantes:
+    """Hedging: se a requisição passar do percentil de latência, envia uma duplicata e fica com a primeira resposta
+
+    A que perder é cancelada, mas o que ela gastou volta na resposta (descartada) para o log e o custo.
+    A duplicata passa pelo escalonador como qualquer requisição (vaga e ficha do limite de taxa próprias).
+    As latências são medidas a partir da vaga, sem a espera na fila. taxa_maxima limita a fração de
+    requisições duplicadas (custo extra).
+    """
+
+    def __init__(self, percentil=95, taxa_maxima=0.1, espera_minima=0.5, latencias=None):
+        self.percentil = percentil
+        self.taxa_maxima = taxa_maxima
+        self.espera_minima = espera_minima  # Nunca duplicar antes disso (segundos)
+        self.latencias = latencias or LATENCIAS
+        self._requisicoes = 0
+        self._duplicadas = 0
+        self._lock = threading.Lock()
+
+    def _pode_duplicar(self):
+        """Reserva uma duplicata se a taxa de duplicação ainda estiver abaixo do limite"""
+        with self._lock:
+            if self._duplicadas + 1 > self.taxa_maxima * self._requisicoes:
+                return False
+            self._duplicadas += 1
+            return True
+
+    def _copia(self, requisicao, dono, textos, indice):
+        """Cópia da requisição (com o próprio instante de despacho) que guarda o texto parcial recebido
+        e só o repassa se for a primeira a produzir texto"""
+        copia = copy.copy(requisicao)
+        if requisicao.ao_receber is not None:
+            def ao_receber(texto):
+                textos[indice] = texto
+                # Original e duplicata escrevem ao mesmo tempo: a tela acompanha só uma delas
+                if dono.setdefault('indice', indice) == indice:
+                    requisicao.ao_receber(texto)
+            copia.ao_receber = ao_receber
+        return copia
+
+    async def _cronometrar(self, chave, proximo, requisicao):
+        """Executa a requisição registrando sua latência desde a vaga (só quando termina com sucesso)"""
+        resposta = await proximo(requisicao)
+        if requisicao.despachada_em is not None:
+            self.latencias.registrar(chave, time.monotonic() - requisicao.despachada_em)
+        return resposta
+
+    def _gasto(self, tarefa, copia, texto):
+        """Tokens gastos pela cópia que perdeu (estimados pelos caracteres se ela foi cancelada no meio)"""
+        if tarefa.done() and not tarefa.cancelled() and tarefa.exception() is None:
+            resposta = tarefa.result()
+            return {'resposta_chars': len(resposta['conteudo']), 'tokens_input': resposta['tokens_input'],
+                    'tokens_output': resposta['tokens_output'], 'tokens_total': resposta['tokens_total']}
+        if copia.despachada_em is None or (tarefa.done() and not tarefa.cancelled()):
+            return None  # Nem saiu da fila, ou falhou: nada cobrado
+        entrada = sum(len(mensagem['content']) for mensagem in copia.messages) // CARACTERES_POR_TOKEN
+        saida = len(texto) // CARACTERES_POR_TOKEN
+        return {'resposta_chars': len(texto), 'tokens_input': entrada, 'tokens_output': saida,
+                'tokens_total': entrada + saida, 'tokens_estimados': True}
+
+    async def processar(self, requisicao, proximo):
+        chave = (requisicao.backend.nome, requisicao.modelo, requisicao.tipo)
+        with self._lock:
+            self._requisicoes += 1
+
+        dono = {}  # Cópia (0 = original, 1 = duplicata) cujo texto parcial é repassado
+        textos = {}  # Cópia -> último texto parcial recebido
+        copias = [self._copia(requisicao, dono, textos, 0)]
+        original = asyncio.create_task(self._cronometrar(chave, proximo, copias[0]))
+        tarefas = [original]
+        try:
+            limiar = self.latencias.percentil(chave, self.percentil)
+            if limiar is not None:
+                espera = max(limiar, self.espera_minima)
+                restante = requisicao.tempo_restante()
+                # Sem tempo para a duplicata antes do prazo, segue só com a original
+                if restante is None or espera < restante:
+                    await asyncio.wait(tarefas, timeout=espera)
+                    if not original.done() and self._pode_duplicar():
+                        copias.append(self._copia(requisicao, dono, textos, 1))
+                        tarefas.append(asyncio.create_task(self._cronometrar(chave, proximo, copias[1])))
+
+            # Primeira resposta bem-sucedida; se uma falhar, ainda espera a outra
+            pendentes = set(tarefas)
+            while True:
+                feitas, pendentes = await asyncio.wait(pendentes, return_when=asyncio.FIRST_COMPLETED)
+                vencedora = next((tarefa for tarefa in feitas if tarefa.exception() is None), None)
+                if vencedora or not pendentes:
+                    break
+            if vencedora is None:
+                # Todas falharam: propaga o erro da original
+                return original.result()
+
+            resposta = vencedora.result()
+            if len(tarefas) > 1:
+                perdedora = 1 if vencedora is original else 0
+                tarefas[perdedora].cancel()
+                await asyncio.gather(tarefas[perdedora], return_exceptions=True)
+                gasto = self._gasto(tarefas[perdedora], copias[perdedora], textos.get(perdedora, ""))
+                resposta = {**resposta, 'duplicada': True, 'duplicata_venceu': vencedora is not original}
+                if gasto:
+                    resposta['descartada'] = gasto
+            return resposta
+        finally:
+            for tarefa in tarefas:
+                if not tarefa.done():
+                    tarefa.cancel()
+
+class _Espera:
+    """Requisição na fila do escalonador, acordada (por qualquer thread) quando recebe uma vaga"""
+
+    __slots__ = ('loop', 'futuro', 'classe', 'usuario', 'taxa', 'inicio', 'concedida')
+
+    def __init__(self, classe, usuario, taxa):
+        self.loop = asyncio.get_running_loop()
+        self.futuro = self.loop.create_future()
+        self.classe = classe
+        self.usuario = usuario
+        self.taxa = taxa  # Balde de limite de taxa de onde sai a ficha ao receber a vaga
+        self.inicio = time.monotonic()
+        self.concedida = False
+
+def _acordar(futuro):
+    if not futuro.done():
+        futuro.set_result(None)
+
+class EscalonadorRequisicoes:
+    """Divide as conexões de cada backend entre classes de prioridade e usuários (vale para todos os event loops)
+
+    Sem fila, a requisição segue direto. Com o backend cheio (capacidade das suas chaves em uso) ou sem
+    ficha no limite de taxa, cada vaga vai para a classe com menor uso ponderado pelo peso (a interativa
+    passa à frente, mas o lote nunca para) e, dentro dela, para o usuário com menor uso, para que um lote
+    grande não tome a vez dos demais. A fila é do processo: outro processo (ex: um lote pela linha de
+    comando ao lado do servidor do app) disputa o backend sem passar por ela.
+    """
+
+    def __init__(self, pesos_classes=None, limite_taxa=None):
+        self.pesos_classes = pesos_classes or PESOS_CLASSES
+        self.limite_taxa = limite_taxa  # LimiteTaxa cujas fichas acompanham as vagas (None = sem limite)
+        self._backends = {}  # Nome do backend -> vagas em uso, filas e uso de cada classe/usuário
+        self._contadores = {}  # Classe -> na fila, em execução, atendidas e espera
+        self._lock = threading.Lock()
+
+    def _estado(self, nome):
+        if nome not in self._backends:
+            self._backends[nome] = {
+                'ocupadas': 0,
+                'filas': {},  # Classe -> {usuário: deque de _Espera}
+                'uso_classe': {},  # Classe -> vagas recebidas / peso (stride scheduling)
+                'uso_usuario': {},  # (classe, usuário) -> vagas recebidas
+                'relogio_classe': 0.0,  # Uso da última classe atendida (quem chega não acumula crédito)
+                'relogio_usuario': {},  # Classe -> uso do último usuário atendido
+                'retomada': None  # Instante em que a distribuição volta a tentar (esperando ficha)
+            }
+        return self._backends[nome]
+
+    def _contador(self, classe):
+        return self._contadores.setdefault(classe, {
+            'na_fila': 0, 'em_execucao': 0, 'atendidas': 0, 'espera_total': 0.0, 'espera_maxima': 0.0
+        })
+
+    def _enfileirar(self, estado, espera):
+        """Põe a requisição na fila da classe e do usuário (chamado com o lock)"""
+        filas_classe = estado['filas'].setdefault(espera.classe, {})
+        if not any(filas_classe.values()):
+            estado['uso_classe'][espera.classe] = max(estado['uso_classe'].get(espera.classe, 0.0), estado['relogio_classe'])
+        chave = (espera.classe, espera.usuario)
+        if not filas_classe.get(espera.usuario):
+            relogio = estado['relogio_usuario'].get(espera.classe, 0.0)
+            estado['uso_usuario'][chave] = max(estado['uso_usuario'].get(chave, 0.0), relogio)
+        filas_classe.setdefault(espera.usuario, deque()).append(espera)
+        self._contador(espera.classe)['na_fila'] += 1
+
+    def _retirar(self, estado, espera):
+        """Remove uma requisição que desistiu da fila (chamado com o lock)"""
+        fila = estado['filas'][espera.classe][espera.usuario]
+        fila.remove(espera)
+        if not fila:
+            del estado['filas'][espera.classe][espera.usuario]
+            estado['uso_usuario'].pop((espera.classe, espera.usuario), None)
+        self._contador(espera.classe)['na_fila'] -= 1
+
+    def _espera_ficha(self, taxa):
+        """Tira a ficha do limite de taxa; devolve 0 ou os segundos até haver uma"""
+        return self.limite_taxa.consumir(taxa) if self.limite_taxa else 0.0
+
+    def _proxima(self, backend, estado):
+        """Escolhe e remove a próxima requisição da fila, se houver ficha para ela (chamado com o lock)"""
+        ativas = [classe for classe, filas in estado['filas'].items() if filas]
+        if not ativas:
+            return None
+        classe = min(ativas, key=lambda c: estado['uso_classe'][c])
+        filas_classe = estado['filas'][classe]
+        usuario = min(filas_classe, key=lambda u: estado['uso_usuario'][(classe, u)])
+        falta = self._espera_ficha(filas_classe[usuario][0].taxa)
+        if falta:
+            # A escolhida espera a ficha na frente da fila: nada passa por ela até lá
+            self._agendar(backend, estado, falta)
+            return None
+
+        estado['relogio_classe'] = estado['uso_classe'][classe]
+        estado['uso_classe'][classe] += 1 / self.pesos_classes.get(classe, 1)
+        estado['relogio_usuario'][classe] = estado['uso_usuario'][(classe, usuario)]
+        estado['uso_usuario'][(classe, usuario)] += 1
+
+        espera = filas_classe[usuario].popleft()
+        if not filas_classe[usuario]:
+            # Usuário sem fila sai do controle (volta com o relógio atual, sem crédito acumulado)
+            del filas_classe[usuario]
+            del estado['uso_usuario'][(classe, usuario)]
+        return espera
+
+    def _iniciar(self, classe, segundos):
+        """Contabiliza uma requisição que recebeu vaga (chamado com o lock)"""
+        contador = self._contador(classe)
+        contador['em_execucao'] += 1
+        contador['atendidas'] += 1
+        contador['espera_total'] += segundos
+        contador['espera_maxima'] = max(contador['espera_maxima'], segundos)
+
+    def _liberar(self, backend, classe):
+        """Devolve a vaga e a repassa às próximas da fila"""
+        with self._lock:
+            self._contador(classe)['em_execucao'] -= 1
+            estado = self._estado(backend.nome)
+            estado['ocupadas'] -= 1
+            self._distribuir(backend, estado)
+
+    def _agendar(self, backend, estado, segundos):
+        """Volta a distribuir as vagas quando o balde tiver ficha (chamado com o lock)"""
+        instante = time.monotonic() + segundos
+        if estado['retomada'] is not None and estado['retomada'] <= instante:
+            return
+        estado['retomada'] = instante
+        # Thread própria: as requisições na fila podem ser de event loops diferentes (ou já encerrados)
+        temporizador = threading.Timer(segundos + 0.001, self._retomar, (backend, instante))
+        temporizador.daemon = True
+        temporizador.start()
+
+    def _retomar(self, backend, instante):
+        with self._lock:
+            estado = self._estado(backend.nome)
+            if estado['retomada'] == instante:
+                estado['retomada'] = None
+            self._distribuir(backend, estado)
+
+    def _distribuir(self, backend, estado):
+        """Concede as vagas livres às próximas requisições da fila (chamado com o lock)"""
+        while estado['ocupadas'] < backend.capacidade:
+            espera = self._proxima(backend, estado)
+            if espera is None:
+                return
+            self._contador(espera.classe)['na_fila'] -= 1
+            try:
+                espera.loop.call_soon_threadsafe(_acordar, espera.futuro)
+            except RuntimeError:
+                # Event loop da requisição já foi encerrado: a vaga vai para a próxima
+                continue
+            espera.concedida = True
+            estado['ocupadas'] += 1
+            self._iniciar(espera.classe, time.monotonic() - espera.inicio)
+
+    async def processar(self, requisicao, proximo):
+        backend = requisicao.backend
+        classe = requisicao.classe
+        taxa = self.limite_taxa.taxa(requisicao) if self.limite_taxa else (None, None)
+        with self._lock:
+            estado = self._estado(backend.nome)
+            fila_vazia = not any(filas for filas in estado['filas'].values())
+            if fila_vazia and estado['ocupadas'] < backend.capacidade and not self._espera_ficha(taxa):
+                estado['ocupadas'] += 1
+                self._iniciar(classe, 0.0)
+                espera = None
+            else:
+                espera = _Espera(classe, requisicao.usuario, taxa)
+                self._enfileirar(estado, espera)
+                # Sem ficha: a distribuição agenda a volta para quando houver
+                self._distribuir(backend, estado)
+
+        if espera:
+            try:
+                with fase("fila"):
+                    await espera.futuro
+            except asyncio.CancelledError:
+                with self._lock:
+                    if not espera.concedida:
+                        self._retirar(estado, espera)
+                if espera.concedida:
+                    self._liberar(backend, classe)
+                raise
+
+        requisicao.despachada_em = time.monotonic()
+        try:
+            if requisicao.ao_despachar:
+                requisicao.ao_despachar(requisicao)
+            resposta = await proximo(requisicao)
+        finally:
+            requisicao.concluida_em = time.monotonic()
+            self._liberar(backend, classe)
+        if espera:
+            resposta = {**resposta, 'espera_fila': requisicao.despachada_em - espera.inicio}
+        return resposta
+
+    def estatisticas(self):
+        """Por classe: requisições na fila e em execução, atendidas e espera média/máxima em segundos"""
+        with self._lock:
+            resumo = {classe: dict(contador) for classe, contador in self._contadores.items()}
+        for contador in resumo.values():
+            contador['espera_media'] = contador['espera_total'] / contador['atendidas'] if contador['atendidas'] else 0.0
+        return resumo
+
+# Compartilhados por todas as análises do processo
+LIMITE_TAXA = LimiteTaxa()
+LATENCIAS = HistoricoLatencias()
+ESCALONADOR = EscalonadorRequisicoes(limite_taxa=LIMITE_TAXA)
+
+class PipelineRequisicoes:
+    """Encadeia os estágios (na ordem da lista) até o envio ao backend"""
+
+    def __init__(self, estagios, transporte=enviar):
+        self.estagios = list(estagios)
+        self.transporte = transporte
+
+    async def executar_async(self, requisicao):
+        """Passa a requisição por todos os estágios e devolve o dicionário da resposta"""
+        async def chamar(indice, req):
+            if indice == len(self.estagios):
+                return await self.transporte(req)
+            return await self.estagios[indice].processar(req, lambda r: chamar(indice + 1, r))
+        return await chamar(0, requisicao)
+
+    def executar(self, requisicao):
+        """Fachada síncrona: executa no event loop compartilhado e espera o resultado"""
+        return executar_sincrono(self.executar_async(requisicao))
+
+def criar_pipeline(log, modelo, metricas=None, cache=None, redundancia=None, gravador=None, transporte=enviar):
+    """Pipeline padrão: log, métricas, cache, retentativas, (opcional) requisições redundantes, o escalonador,
+    que dá a vez (e a ficha do limite de taxa) a cada tentativa ou duplicata, e (opcional) o gravador das respostas"""
+    estagios = [
+        LogRequisicoes(log, modelo),
+        metricas or Metricas(),
+        cache or CacheRespostas(),
+        Retentativas()
+    ]
+    if redundancia:
+        estagios.append(redundancia)
+    estagios.append(ESCALONADOR)
+    if gravador:
+        estagios.append(gravador)
+    return PipelineRequisicoes(estagios, transporte)
+
+_loop_compartilhado = None
+_lock_loop = threading.Lock()
+
+def _obter_loop():
+    """Event loop em uma thread própria para as chamadas síncronas (criado na primeira chamada)"""
+    global _loop_compartilhado
+    with _lock_loop:
+        if _loop_compartilhado is None:
+            _loop_compartilhado = asyncio.new_event_loop()
+            threading.Thread(target=_loop_compartilhado.run_forever, name="pipeline-sincrono", daemon=True).start()
+        return _loop_compartilhado
+
+def executar_sincrono(corrotina):
+    """Executa uma corrotina no event loop compartilhado e bloqueia até o resultado"""
+    # O perfil em gravação (se houver) continua na thread do event loop
+    return asyncio.run_coroutine_threadsafe(levar_perfil(corrotina), _obter_loop()).result()
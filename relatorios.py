@@ -0,0 +1,218 @@
+#!/usr/bin/env python3
+"""
+Relatórios de análise
+O diário (JSONL) é o formato canônico: cada critério é gravado, com fsync, assim que termina,
+então uma análise interrompida não perde o que já foi analisado. Texto, Markdown e HTML são
+gerados a partir dele quando pedidos, na ordem dos critérios: só a posição de cada resultado no
+arquivo fica na memória, e os resultados são lidos um por vez.
+"""
+
+import os
+import json
+import html
+import argparse
+import threading
+from datetime import datetime
+from analisador import classificar_resultado, descrever_opcoes_criterio
+
+# Extensão do arquivo de cada formato
+EXTENSOES = {"texto": ".txt", "markdown": ".md", "html": ".html"}
+
+ICONES_VEREDITO = {"aprovado": "✅", "parcial": "⚠️", "nao_atende": "❌", "erro": "💥", "interrompido": "⏱️"}
+
+class DiarioRelatorio:
+    """Diário de uma análise: cabeçalho, um registro por critério concluído e o fechamento
+
+    registrar(indice, resultado) tem a assinatura do ao_concluir do analisador.
+    """
+
+    def __init__(self, arquivo, arquivo_roteiro, modelo=None):
+        self.arquivo = arquivo
+        self.registrados = 0
+        self._lock = threading.Lock()  # ao_concluir pode vir de outra thread (app, tarefas)
+        self._f = open(arquivo, 'w', encoding='utf-8')
+        self._gravar({"tipo": "inicio", "roteiro": arquivo_roteiro, "modelo": modelo,
+                      "data": datetime.now().isoformat(timespec='seconds')})
+
+    def _gravar(self, registro):
+        with self._lock:
+            self._f.write(json.dumps(registro, ensure_ascii=False) + "\n")
+            self._f.flush()
+            os.fsync(self._f.fileno())  # No disco antes de seguir: sobrevive a uma queda do processo
+
+    def registrar(self, indice, resultado):
+        """Grava o resultado de um critério (indice na ordem dos critérios)"""
+        criterio = resultado['criterio']
+        self._gravar({
+            "tipo": "resultado",
+            "indice": indice,
+            "titulo": criterio['titulo'] if isinstance(criterio, dict) else criterio,
+            "opcoes": descrever_opcoes_criterio(criterio),
+            "veredito": classificar_resultado(resultado['resultado']),
+            "status": resultado.get('status', 'concluido'),
+            "resultado": resultado['resultado']
+        })
+        self.registrados += 1
+
+    def fechar(self):
+        """Grava o fechamento (análise completa) e fecha o arquivo"""
+        if self._f.closed:
+            return
+        self._gravar({"tipo": "fim", "data": datetime.now().isoformat(timespec='seconds'),
+                      "criterios": self.registrados})
+        self._f.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *erro):
+        self.fechar()
+        return False
+
+def ler_diario(arquivo):
+    """Registros do diário, um por vez (a última linha, se cortada por uma queda, é ignorada)"""
+    with open(arquivo, 'r', encoding='utf-8') as f:
+        for numero, linha in enumerate(f, 1):
+            if not linha.strip():
+                continue
+            try:
+                yield json.loads(linha)
+            except json.JSONDecodeError:
+                print(f"⚠️ {arquivo}: linha {numero} incompleta, ignorada")
+
+def _indexar_diario(arquivo):
+    """Cabeçalho do diário, se a análise terminou e as posições dos resultados na ordem dos critérios"""
+    inicio = None
+    completo = False
+    posicoes = []  # (indice do critério, posição da linha no arquivo)
+    with open(arquivo, 'rb') as f:
+        posicao = 0
+        for numero, linha in enumerate(f, 1):
+            atual, posicao = posicao, posicao + len(linha)
+            if not linha.strip():
+                continue
+            try:
+                registro = json.loads(linha)
+            except json.JSONDecodeError:
+                print(f"⚠️ {arquivo}: linha {numero} incompleta, ignorada")
+                continue
+            if registro['tipo'] == "inicio":
+                inicio = registro
+            elif registro['tipo'] == "resultado":
+                posicoes.append((registro['indice'], atual))
+            elif registro['tipo'] == "fim":
+                completo = True
+    posicoes.sort()  # Gravados na ordem em que terminaram
+    return inicio, completo, posicoes
+
+def resultados_diario(arquivo, posicoes=None):
+    """Resultados do diário, um por vez, na ordem dos critérios"""
+    if posicoes is None:
+        posicoes = _indexar_diario(arquivo)[2]
+    with open(arquivo, 'rb') as f:
+        for _, posicao in posicoes:
+            f.seek(posicao)
+            yield json.loads(f.readline())
+
+def _texto_inicio(f, inicio, total, completo):
+    f.write("="*80 + "\n")
+    f.write("RELATÓRIO DE ANÁLISE DE ROTEIRO\n")
+    f.write("="*80 + "\n\n")
+    f.write(f"Arquivo analisado: {inicio['roteiro']}\n")
+    f.write(f"Data da análise: {datetime.fromisoformat(inicio['data']).strftime('%d/%m/%Y %H:%M:%S')}\n")
+    f.write(f"Número de critérios analisados: {total}\n\n")
+    if not completo:
+        f.write("⚠️ Análise interrompida: só os critérios concluídos até a interrupção\n\n")
+
+def _texto_resultado(f, registro):
+    f.write(f"CRITÉRIO {registro['indice'] + 1}: {registro['titulo']}\n")
+    if registro['opcoes']:
+        f.write(f"Opções: {registro['opcoes']}\n")
+    f.write("-" * 40 + "\n")
+    f.write("Análise:\n")
+    f.write(registro['resultado'])
+    f.write("\n\n" + "="*80 + "\n\n")
+
+def _markdown_inicio(f, inicio, total, completo):
+    f.write("# Relatório de análise de roteiro\n\n")
+    f.write(f"- **Arquivo analisado:** {inicio['roteiro']}\n")
+    f.write(f"- **Data da análise:** {datetime.fromisoformat(inicio['data']).strftime('%d/%m/%Y %H:%M:%S')}\n")
+    if inicio.get('modelo'):
+        f.write(f"- **Modelo:** {inicio['modelo']}\n")
+    f.write(f"- **Critérios analisados:** {total}\n\n")
+    if not completo:
+        f.write("> ⚠️ Análise interrompida: só os critérios concluídos até a interrupção\n\n")
+
+def _markdown_resultado(f, registro):
+    f.write(f"## {ICONES_VEREDITO[registro['veredito']]} {registro['indice'] + 1}. {registro['titulo']}\n\n")
+    if registro['opcoes']:
+        f.write(f"*Opções: {registro['opcoes']}*\n\n")
+    f.write(f"{registro['resultado'].strip()}\n\n")
+
+def _html_inicio(f, inicio, total, completo):
+    f.write("<!DOCTYPE html>\n<html lang=\"pt-BR\">\n<head>\n<meta charset=\"utf-8\">\n")
+    f.write(f"<title>Relatório - {html.escape(inicio['roteiro'])}</title>\n")
+    f.write("<style>body{font-family:sans-serif;max-width:60em;margin:2em auto}"
+            "section{border-left:4px solid #ccc;padding-left:1em;margin-bottom:1.5em}"
+            ".aprovado{border-color:#2e7d32}.parcial{border-color:#f9a825}.nao_atende,.erro{border-color:#c62828}"
+            "pre{white-space:pre-wrap;font-family:inherit}</style>\n</head>\n<body>\n")
+    f.write("<h1>Relatório de análise de roteiro</h1>\n<ul>\n")
+    f.write(f"<li><b>Arquivo analisado:</b> {html.escape(inicio['roteiro'])}</li>\n")
+    f.write(f"<li><b>Data da análise:</b> {datetime.fromisoformat(inicio['data']).strftime('%d/%m/%Y %H:%M:%S')}</li>\n")
+    if inicio.get('modelo'):
+        f.write(f"<li><b>Modelo:</b> {html.escape(inicio['modelo'])}</li>\n")
+    f.write(f"<li><b>Critérios analisados:</b> {total}</li>\n</ul>\n")
+    if not completo:
+        f.write("<p>⚠️ Análise interrompida: só os critérios concluídos até a interrupção</p>\n")
+
+def _html_resultado(f, registro):
+    f.write(f"<section class=\"{registro['veredito']}\">\n")
+    f.write(f"<h2>{ICONES_VEREDITO[registro['veredito']]} {registro['indice'] + 1}. {html.escape(registro['titulo'])}</h2>\n")
+    if registro['opcoes']:
+        f.write(f"<p><i>Opções: {html.escape(registro['opcoes'])}</i></p>\n")
+    f.write(f"<pre>{html.escape(registro['resultado'].strip())}</pre>\n</section>\n")
+
+def _html_fim(f):
+    f.write("</body>\n</html>\n")
+
+# Formato -> (cabeçalho, um resultado, fechamento)
+RENDERIZADORES = {
+    "texto": (_texto_inicio, _texto_resultado, None),
+    "markdown": (_markdown_inicio, _markdown_resultado, None),
+    "html": (_html_inicio, _html_resultado, _html_fim),
+}
+
+def renderizar(arquivo_diario, formato="texto", saida=None):
+    """Gera o relatório no formato a partir do diário; devolve o nome do arquivo gerado"""
+    if formato not in RENDERIZADORES:
+        raise ValueError(f"Formato desconhecido: {formato} (use {', '.join(RENDERIZADORES)})")
+    saida = saida or os.path.splitext(arquivo_diario)[0] + EXTENSOES[formato]
+
+    # Primeira passada só indexa: o cabeçalho traz o total e os resultados saem na ordem dos critérios
+    inicio, completo, posicoes = _indexar_diario(arquivo_diario)
+    if inicio is None:
+        raise ValueError(f"{arquivo_diario} não é um diário de análise")
+
+    cabecalho, resultado, fechamento = RENDERIZADORES[formato]
+    # Escrito ao lado e trocado de uma vez: quem está com o relatório aberto nunca vê um arquivo pela metade
+    temporario = saida + ".tmp"
+    with open(temporario, 'w', encoding='utf-8') as f:
+        cabecalho(f, inicio, len(posicoes), completo)
+        for registro in resultados_diario(arquivo_diario, posicoes):
+            resultado(f, registro)
+        if fechamento:
+            fechamento(f)
+    os.replace(temporario, saida)
+    return saida
+
+def main():
+    parser = argparse.ArgumentParser(description="Gera o relatório (texto, Markdown ou HTML) a partir do diário de uma análise")
+    parser.add_argument('diario', help="Diário da análise (relatorio_analise_*.jsonl)")
+    parser.add_argument('--formato', choices=list(RENDERIZADORES), default="texto")
+    parser.add_argument('--saida', help="Arquivo gerado (padrão: o nome do diário com a extensão do formato)")
+    args = parser.parse_args()
+
+    print(f"📄 Relatório salvo em: {renderizar(args.diario, args.formato, args.saida)}")
+
+if __name__ == "__main__":
+    main()
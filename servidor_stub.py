@@ -0,0 +1,178 @@
+#!/usr/bin/env python3
+"""
+Servidor stub compatível com a API de chat da OpenAI
+Responde localmente, sem custo, para testar backends, o app e a carga de ponta a ponta
+"""
+
+import json
+import time
+import uuid
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+RESPOSTA_PADRAO = "✅ APROVADO"
+
+def _contar_tokens(texto):
+    """Aproximação grosseira: ~4 caracteres por token"""
+    return max(1, len(texto) // 4)
+
+class ManipuladorStub(BaseHTTPRequestHandler):
+    """Atende /v1/chat/completions (com e sem streaming) e /v1/models"""
+
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, formato, *args):
+        if self.server.verbose:
+            super().log_message(formato, *args)
+
+    def _enviar_json(self, status, dados):
+        corpo = json.dumps(dados, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(corpo)))
+        self.end_headers()
+        try:
+            self.wfile.write(corpo)
+        except (BrokenPipeError, ConnectionResetError):
+            # Cliente desistiu da requisição (ex: duplicata cancelada)
+            self.close_connection = True
+
+    def do_GET(self):
+        if self.path.rstrip('/').endswith('/models'):
+            self._enviar_json(200, {"object": "list", "data": [{"id": "stub", "object": "model", "owned_by": "stub"}]})
+        else:
+            self._enviar_json(404, {"error": {"message": "rota não encontrada"}})
+
+    def do_POST(self):
+        if not self.path.rstrip('/').endswith('/chat/completions'):
+            self._enviar_json(404, {"error": {"message": "rota não encontrada"}})
+            return
+
+        tamanho = int(self.headers.get('Content-Length', 0))
+        pedido = json.loads(self.rfile.read(tamanho) or b'{}')
+        chave = self.headers.get('Authorization', '').removeprefix('Bearer ')
+        self.server.registrar(pedido, chave)
+
+        status = self.server.erros_por_chave.get(chave)
+        if status:
+            self._enviar_json(status, {"error": {"message": f"erro simulado {status}", "type": "stub", "code": status}})
+            return
+
+        prompt = "".join(str(mensagem.get('content', '')) for mensagem in pedido.get('messages', []))
+        resposta = self.server.responder(pedido)
+        uso = {
+            "prompt_tokens": _contar_tokens(prompt),
+            "completion_tokens": _contar_tokens(resposta),
+            "total_tokens": _contar_tokens(prompt) + _contar_tokens(resposta)
+        }
+        identificador = f"chatcmpl-{uuid.uuid4().hex[:12]}"
+
+        if self.server.atraso:
+            time.sleep(self.server.atraso)
+
+        if pedido.get('stream'):
+            self._enviar_stream(identificador, pedido.get('model', 'stub'), resposta, uso, pedido)
+            return
+
+        self._enviar_json(200, {
+            "id": identificador,
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": pedido.get('model', 'stub'),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": resposta},
+                "finish_reason": "stop"
+            }],
+            "usage": uso
+        })
+
+    def _enviar_stream(self, identificador, modelo, resposta, uso, pedido):
+        """Envia a resposta em eventos SSE, palavra por palavra"""
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Connection", "close")
+        self.end_headers()
+
+        def evento(dados):
+            self.wfile.write(f"data: {json.dumps(dados, ensure_ascii=False)}\n\n".encode('utf-8'))
+            self.wfile.flush()
+
+        base = {"id": identificador, "object": "chat.completion.chunk", "created": int(time.time()), "model": modelo}
+        try:
+            for i, palavra in enumerate(resposta.split(" ")):
+                pedaco = palavra if i == 0 else " " + palavra
+                evento({**base, "choices": [{"index": 0, "delta": {"content": pedaco}, "finish_reason": None}]})
+                if self.server.atraso_token:
+                    time.sleep(self.server.atraso_token)
+            evento({**base, "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]})
+            if (pedido.get('stream_options') or {}).get('include_usage'):
+                evento({**base, "choices": [], "usage": uso})
+            self.wfile.write(b"data: [DONE]\n\n")
+            self.wfile.flush()
+        except (BrokenPipeError, ConnectionResetError):
+            # Cliente encerrou o stream antes do fim
+            pass
+        self.close_connection = True
+
+class ServidorStub(ThreadingHTTPServer):
+    """Servidor HTTP com resposta, atraso e registro de pedidos configuráveis"""
+
+    daemon_threads = True
+
+    def __init__(self, endereco, resposta=RESPOSTA_PADRAO, atraso=0.0, atraso_token=0.0, verbose=False):
+        super().__init__(endereco, ManipuladorStub)
+        self.resposta = resposta  # Texto fixo ou função pedido -> texto
+        self.atraso = atraso  # Segundos antes de responder
+        self.atraso_token = atraso_token  # Segundos entre palavras no streaming
+        self.verbose = verbose
+        self.erros_por_chave = {}  # Chave de API -> status HTTP devolvido (ex: 429, 401) para testar o pool
+        self.pedidos = []
+        self.pedidos_por_chave = {}
+        self._lock = threading.Lock()
+
+    @property
+    def url(self):
+        host, porta = self.server_address[:2]
+        return f"http://{host}:{porta}/v1"
+
+    def responder(self, pedido):
+        return self.resposta(pedido) if callable(self.resposta) else self.resposta
+
+    def registrar(self, pedido, chave=None):
+        with self._lock:
+            self.pedidos.append(pedido)
+            self.pedidos_por_chave[chave] = self.pedidos_por_chave.get(chave, 0) + 1
+
+def iniciar_servidor_stub(porta=0, host="127.0.0.1", **opcoes):
+    """Inicia o stub em uma thread e devolve o servidor (porta 0 = porta livre; veja servidor.url)"""
+    servidor = ServidorStub((host, porta), **opcoes)
+    threading.Thread(target=servidor.serve_forever, name="servidor-stub", daemon=True).start()
+    return servidor
+
+def main():
+    parser = argparse.ArgumentParser(description="Servidor stub compatível com a API de chat da OpenAI")
+    parser.add_argument('--host', default="127.0.0.1")
+    parser.add_argument('--porta', type=int, default=8089)
+    parser.add_argument('--resposta', default=RESPOSTA_PADRAO, help="Texto devolvido em todas as respostas")
+    parser.add_argument('--atraso', type=float, default=0.0, help="Segundos de espera antes de cada resposta")
+    parser.add_argument('--atraso-token', type=float, default=0.0, help="Segundos entre palavras no streaming")
+    parser.add_argument('--verbose', action='store_true', help="Mostra cada requisição recebida")
+    args = parser.parse_args()
+
+    servidor = ServidorStub(
+        (args.host, args.porta),
+        resposta=args.resposta,
+        atraso=args.atraso,
+        atraso_token=args.atraso_token,
+        verbose=args.verbose
+    )
+    print(f"🧪 Servidor stub em {servidor.url} (Ctrl+C para sair)")
+    try:
+        servidor.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
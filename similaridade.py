@@ -0,0 +1,191 @@
+import re
+import zlib
+import random
+import sqlite3
+import hashlib
+import difflib
+import threading
+from array import array
+from collections import OrderedDict
+from concurrent.futures import Future
+from datetime import datetime
+
+ARQUIVO_INDICE = 'indice_trechos.db'
+
+NUM_PERMUTACOES = 128
+BANDAS = 16  # 16 bandas x 8 linhas: pares com similaridade acima de ~0.7 viram candidatos
+LINHAS_POR_BANDA = NUM_PERMUTACOES // BANDAS
+TAMANHO_SHINGLE = 3  # Sequências de 3 palavras
+MAX_ASSINATURAS = 256  # Assinaturas guardadas em memória (um trecho é consultado por todos os critérios)
+
+_PRIMO = (1 << 61) - 1
+_aleatorio = random.Random(20240501)  # Semente fixa: assinaturas precisam ser estáveis entre execuções
+_COEFICIENTES = [(_aleatorio.randrange(1, _PRIMO), _aleatorio.randrange(0, _PRIMO)) for _ in range(NUM_PERMUTACOES)]
+
+def _palavras(texto):
+    """Normaliza o texto em palavras minúsculas (pontuação e espaços não contam)"""
+    return re.findall(r'\w+', texto.lower())
+
+def assinatura_minhash(texto):
+    """Calcula a assinatura MinHash das sequências de palavras do texto"""
+    palavras = _palavras(texto)
+    if len(palavras) < TAMANHO_SHINGLE:
+        shingles = {" ".join(palavras)}
+    else:
+        shingles = {" ".join(palavras[i:i + TAMANHO_SHINGLE]) for i in range(len(palavras) - TAMANHO_SHINGLE + 1)}
+
+    hashes = [
+        int.from_bytes(hashlib.blake2b(shingle.encode('utf-8'), digest_size=8).digest(), 'little')
+        for shingle in shingles
+    ]
+    return [min((a * h + b) % _PRIMO for h in hashes) for a, b in _COEFICIENTES]
+
+def similaridade_estimada(assinatura_a, assinatura_b):
+    """Estima a similaridade de Jaccard pela fração de posições iguais nas assinaturas"""
+    iguais = sum(1 for a, b in zip(assinatura_a, assinatura_b) if a == b)
+    return iguais / len(assinatura_a)
+
+def _valores_bandas(assinatura):
+    """Divide a assinatura em bandas e devolve um valor (hash) por banda para o LSH"""
+    valores = []
+    for banda in range(BANDAS):
+        linhas = assinatura[banda * LINHAS_POR_BANDA:(banda + 1) * LINHAS_POR_BANDA]
+        digest = hashlib.blake2b(array('Q', linhas).tobytes(), digest_size=8).hexdigest()
+        valores.append(f"{banda}:{digest}")
+    return valores
+
+def trechos_alterados(texto_anterior, texto_novo, contexto=15):
+    """Extrai do texto novo apenas as regiões que mudaram, com algumas palavras de contexto"""
+    anteriores = texto_anterior.split()
+    novas = texto_novo.split()
+    blocos = []
+    for operacao, _, _, inicio, fim in difflib.SequenceMatcher(None, anteriores, novas, autojunk=False).get_opcodes():
+        if operacao == 'equal':
+            continue
+        inicio = max(inicio - contexto, 0)
+        fim = min(fim + contexto, len(novas))
+        # Juntar regiões que se sobrepõem
+        if blocos and inicio <= blocos[-1][1]:
+            blocos[-1] = (blocos[-1][0], max(fim, blocos[-1][1]))
+        else:
+            blocos.append((inicio, fim))
+    return ["... " + " ".join(novas[inicio:fim]) + " ..." for inicio, fim in blocos]
+
+class IndiceSimilaridade:
+    """Índice MinHash/LSH local dos trechos já aprovados, por critério e modelo"""
+
+    def __init__(self, arquivo=ARQUIVO_INDICE, limiar=0.9):
+        self.arquivo = arquivo
+        self.limiar = limiar  # Similaridade mínima para reaproveitar o veredito
+        self._assinaturas = OrderedDict()  # Hash do texto -> Future da assinatura (LRU)
+        self._lock = threading.Lock()
+        self._criar_tabelas()
+
+    def _assinatura(self, texto):
+        """Assinatura MinHash do texto, calculada uma vez por trecho mesmo com vários critérios ao mesmo tempo"""
+        chave = hashlib.sha256(texto.encode('utf-8')).hexdigest()
+        with self._lock:
+            futuro = self._assinaturas.get(chave)
+            calcular = futuro is None
+            if calcular:
+                futuro = self._assinaturas[chave] = Future()
+                while len(self._assinaturas) > MAX_ASSINATURAS:
+                    self._assinaturas.popitem(last=False)
+            else:
+                self._assinaturas.move_to_end(chave)
+        if calcular:
+            try:
+                futuro.set_result(assinatura_minhash(texto))
+            except Exception as e:
+                with self._lock:
+                    self._assinaturas.pop(chave, None)
+                futuro.set_exception(e)
+        return futuro.result()  # Outro critério calculando o mesmo trecho: espera por ele
+
+    def _conectar(self):
+        """Abre uma conexão nova (seguro para threads)"""
+        return sqlite3.connect(self.arquivo, timeout=30)
+
+    def _criar_tabelas(self):
+        """Cria tabelas e índices se ainda não existirem"""
+        con = self._conectar()
+        try:
+            con.executescript("""
+                CREATE TABLE IF NOT EXISTS trechos (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    chave TEXT NOT NULL,
+                    texto_hash TEXT NOT NULL,
+                    assinatura BLOB NOT NULL,
+                    texto BLOB NOT NULL,
+                    resultado TEXT NOT NULL,
+                    criado_em TEXT NOT NULL,
+                    UNIQUE (chave, texto_hash)
+                );
+                CREATE TABLE IF NOT EXISTS bandas_trechos (
+                    chave TEXT NOT NULL,
+                    valor TEXT NOT NULL,
+                    trecho_id INTEGER NOT NULL
+                );
+                CREATE INDEX IF NOT EXISTS idx_bandas_trechos ON bandas_trechos (chave, valor);
+            """)
+            con.commit()
+        finally:
+            con.close()
+
+    def _chave(self, descricao, modelo):
+        """Critério (pela descrição, que muda quando o critério muda) + modelo"""
+        return hashlib.sha1(f"{modelo}\n{descricao}".encode('utf-8')).hexdigest()
+
+    def buscar(self, texto, descricao, modelo):
+        """Devolve o trecho aprovado mais parecido acima do limiar ({similaridade, texto, resultado}) ou None"""
+        chave = self._chave(descricao, modelo)
+        assinatura = self._assinatura(texto)
+        valores = _valores_bandas(assinatura)
+
+        con = self._conectar()
+        try:
+            candidatos = con.execute(
+                f"""SELECT id, assinatura, texto, resultado FROM trechos WHERE id IN (
+                        SELECT trecho_id FROM bandas_trechos
+                        WHERE chave = ? AND valor IN ({', '.join('?' * len(valores))})
+                    )""",
+                (chave, *valores)
+            ).fetchall()
+        finally:
+            con.close()
+
+        melhor = None
+        for _, assinatura_candidato, texto_candidato, resultado in candidatos:
+            similaridade = similaridade_estimada(assinatura, array('Q', assinatura_candidato))
+            if similaridade >= self.limiar and (melhor is None or similaridade > melhor['similaridade']):
+                melhor = {
+                    'similaridade': similaridade,
+                    'texto': zlib.decompress(texto_candidato).decode('utf-8'),
+                    'resultado': resultado
+                }
+        return melhor
+
+    def registrar(self, texto, descricao, modelo, resultado):
+        """Guarda um trecho aprovado para reaproveitamento futuro"""
+        chave = self._chave(descricao, modelo)
+        assinatura = self._assinatura(texto)
+
+        con = self._conectar()
+        try:
+            cursor = con.execute(
+                """INSERT OR IGNORE INTO trechos (chave, texto_hash, assinatura, texto, resultado, criado_em)
+                   VALUES (?, ?, ?, ?, ?, ?)""",
+                (
+                    chave, hashlib.sha256(texto.encode('utf-8')).hexdigest(),
+                    array('Q', assinatura).tobytes(), zlib.compress(texto.encode('utf-8')),
+                    resultado, datetime.now().isoformat(timespec='seconds')
+                )
+            )
+            if cursor.rowcount:
+                con.executemany(
+                    "INSERT INTO bandas_trechos (chave, valor, trecho_id) VALUES (?, ?, ?)",
+                    [(chave, valor, cursor.lastrowid) for valor in _valores_bandas(assinatura)]
+                )
+            con.commit()
+        finally:
+            con.close()
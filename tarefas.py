@@ -0,0 +1,273 @@
+import time
+import uuid
+import asyncio
+import threading
+from analisador import AnalisadorRoteiro
+from historico import assinatura_analise
+from modelos import CARACTERES_POR_TOKEN
+
+class OrcamentoEsgotado(Exception):
+    """A próxima requisição da pré-análise passaria do orçamento de tokens"""
+
+class TarefaAnalise:
+    """Análise executada em uma thread do servidor, acompanhada pela interface a cada rerun"""
+
+    def __init__(self, roteiro, criterios, modelo, prazo=None, historico=None, especulativa=False,
+                 orcamento_tokens=None, **opcoes_analisador):
+        self.id = uuid.uuid4().hex
+        self.assinatura = assinatura_analise(roteiro, criterios, modelo, opcoes_analisador)
+        self.especulativa = especulativa  # Pré-análise iniciada sem o clique do usuário
+        self.orcamento_tokens = orcamento_tokens  # Pré-análise para de enviar requisições antes de passar disso
+        self.roteiro = roteiro
+        self.criterios = criterios
+        self.modelo = modelo
+        self.prazo = prazo
+        self.historico = historico  # Se informado, a análise é salva ao terminar
+        self.analisador = AnalisadorRoteiro(modelo=modelo, **opcoes_analisador)
+        self.estado = "aguardando"  # aguardando, executando, concluida, cancelada, erro
+        self.erro = None
+        self.parciais = [None] * len(criterios)  # Resultados que já chegaram, na ordem dos critérios
+        self.textos_parciais = [None] * len(criterios)  # Texto que o modelo está escrevendo (streaming)
+        self.resultados = None
+        self.iniciada_em = None
+        self.finalizada_em = None
+        self._salva = False
+        self._em_envio = []  # (requisição, tokens estimados) enviadas pela pré-análise e ainda sem resposta
+        self._sem_orcamento = False  # Uma requisição foi recusada pelo orçamento: o resultado fica incompleto
+        self._lock = threading.Lock()
+        if especulativa and orcamento_tokens is not None:
+            self.analisador.ao_despachar = self._conferir_orcamento
+        self._thread = threading.Thread(target=self._executar, name=f"analise-{self.id[:8]}", daemon=True)
+
+    def iniciar(self):
+        """Inicia a análise em segundo plano"""
+        self.iniciada_em = time.time()
+        self.estado = "executando"
+        self._thread.start()
+
+    def cancelar(self):
+        """Pede o cancelamento; os critérios pendentes voltam como cancelados"""
+        self.analisador.cancelar()
+
+    @property
+    def ativa(self):
+        return self.estado in ("aguardando", "executando")
+
+    def progresso(self):
+        """Devolve (critérios concluídos, total)"""
+        with self._lock:
+            concluidos = sum(1 for parcial in self.parciais if parcial is not None)
+        return concluidos, len(self.criterios)
+
+    def tokens_gastos(self):
+        """Tokens consumidos até agora pelas requisições da tarefa"""
+        return sum(log.get('tokens_total', 0) for log in list(self.analisador.log_requisicoes))
+
+    def promover(self, historico=None, prazo=None):
+        """Transforma a pré-análise em análise pedida pelo usuário (passa à frente na fila, ganha o prazo e vai para o histórico)
+
+        Devolve False, sem mudar nada, se a pré-análise já foi cancelada ou esgotou o orçamento.
+        """
+        with self._lock:
+            if self.analisador.cancelado or self._sem_orcamento:
+                return False
+            self.especulativa = False
+            self.analisador.prioridade = "interativa"
+            self.historico = historico
+            if prazo is not None:
+                self.prazo = prazo
+                self.analisador.impor_prazo(prazo)
+        return True
+
+    def _conferir_orcamento(self, requisicao):
+        """Chamado pelo escalonador antes de cada envio: recusa a requisição que passaria do orçamento
+
+        Soma os tokens já gastos, os estimados das requisições ainda sem resposta e os desta. As que já
+        foram enviadas terminam (os tokens já estão pagos); nenhuma outra sai depois da primeira recusa.
+        """
+        caracteres = sum(len(mensagem['content']) for mensagem in requisicao.messages)
+        estimativa = caracteres // CARACTERES_POR_TOKEN + requisicao.max_tokens
+        with self._lock:
+            if not self.especulativa:
+                return  # Promovida: o orçamento não vale mais
+            self._em_envio = [(enviada, tokens) for enviada, tokens in self._em_envio if enviada.concluida_em is None]
+            previsto = self.tokens_gastos() + sum(tokens for _, tokens in self._em_envio) + estimativa
+            if self._sem_orcamento or previsto > self.orcamento_tokens:
+                self._sem_orcamento = True
+                raise OrcamentoEsgotado(f"orçamento de pré-análise esgotado ({self.orcamento_tokens} tokens)")
+            self._em_envio.append((requisicao, estimativa))
+
+    def _registrar_parcial(self, indice, resultado):
+        """Callback do analisador a cada critério concluído"""
+        with self._lock:
+            self.parciais[indice] = resultado
+
+    def _registrar_texto(self, indice, texto):
+        """Callback do analisador a cada pedaço de texto recebido de um critério"""
+        with self._lock:
+            self.textos_parciais[indice] = texto
+
+    def _salvar(self):
+        """Salva no histórico uma única vez, quando concluída e com histórico definido"""
+        with self._lock:
+            if self._salva or not (self.historico and self.resultados and self.estado == "concluida"):
+                return
+            self._salva = True
+        try:
+            self.historico.salvar(self.roteiro, self.resultados, self.modelo, self.analisador.log_requisicoes,
+                                  assinatura=self.assinatura)
+        except Exception as e:
+            print(f"⚠️ Não foi possível salvar no histórico: {e}")
+
+    def _executar(self):
+        """Corpo da thread: roda a análise em um event loop próprio"""
+        try:
+            self.resultados = asyncio.run(self.analisador.analisar_texto_async(
+                self.roteiro, self.criterios, prazo=self.prazo, ao_concluir=self._registrar_parcial,
+                ao_parcial=self._registrar_texto
+            ))
+            self.estado = "cancelada" if self.analisador.cancelado or self._sem_orcamento else "concluida"
+        except Exception as e:
+            self.erro = str(e)
+            self.estado = "erro"
+        finally:
+            self.finalizada_em = time.time()
+
+        self._salvar()
+
+class GerenciadorTarefas:
+    """Mantém as tarefas de análise do processo, no máximo uma ativa por sessão"""
+
+    def __init__(self, retencao_segundos=3600):
+        self.retencao_segundos = retencao_segundos  # Tempo que uma tarefa finalizada fica disponível
+        self._tarefas = {}
+        self._ativas_por_sessao = {}
+        self._especulativas = {}  # Sessão -> pré-análise do texto atual
+        self._descartadas = {}  # Sessão -> pré-análises não aproveitadas (contam no orçamento)
+        self._lock = threading.Lock()
+
+    def submeter(self, sessao, roteiro, criterios, modelo, prazo=None, historico=None, **opcoes_analisador):
+        """Inicia uma análise para a sessão, ou devolve a que já está em andamento (opções vão para o AnalisadorRoteiro)"""
+        with self._lock:
+            self._limpar_antigas()
+
+            tarefa_atual = self._tarefas.get(self._ativas_por_sessao.get(sessao))
+            if tarefa_atual and tarefa_atual.ativa:
+                # Evita análises duplicadas (e custo dobrado) em reruns acidentais
+                return tarefa_atual
+
+            # Pré-análise do mesmo texto (em andamento ou concluída) vira a análise pedida
+            especulativa = self._especulativas.pop(sessao, None)
+            aproveitar = (
+                especulativa is not None
+                and especulativa.estado in ("aguardando", "executando", "concluida")
+                and especulativa.assinatura == assinatura_analise(roteiro, criterios, modelo, opcoes_analisador)
+                # A que esgotou o orçamento pode continuar "executando", mas devolveria critérios sem resposta
+                and especulativa.promover(historico, prazo)
+            )
+            if especulativa and not aproveitar:
+                self._descartar(sessao, especulativa)
+
+            if aproveitar:
+                tarefa = especulativa
+                self._ativas_por_sessao[sessao] = tarefa.id
+            else:
+                # A sessão identifica o usuário na divisão justa das vagas do escalonador
+                opcoes_analisador.setdefault('usuario', sessao)
+                tarefa = TarefaAnalise(roteiro, criterios, modelo, prazo, historico, **opcoes_analisador)
+                self._tarefas[tarefa.id] = tarefa
+                self._ativas_por_sessao[sessao] = tarefa.id
+
+        if aproveitar:
+            tarefa._salvar()  # Pré-análise já concluída vai direto para o histórico
+        else:
+            tarefa.iniciar()
+        return tarefa
+
+    def especular(self, sessao, roteiro, criterios, modelo, orcamento_tokens, **opcoes_analisador):
+        """Pré-analisa o texto atual da sessão em segundo plano (prioridade de lote)
+
+        Mantém a pré-análise se ela já cobre o texto, os critérios e as opções; senão, cancela a anterior
+        e começa outra. Devolve a tarefa, ou None se as pré-análises descartadas já gastaram o orçamento.
+        """
+        assinatura = assinatura_analise(roteiro, criterios, modelo, opcoes_analisador)
+        with self._lock:
+            self._limpar_antigas()
+            atual = self._especulativas.get(sessao)
+            if atual and atual.assinatura == assinatura:
+                return atual
+            if atual:
+                del self._especulativas[sessao]
+                self._descartar(sessao, atual)
+
+            restante = orcamento_tokens - self._gasto_especulativo(sessao)
+            if restante <= 0:
+                return None
+
+            tarefa = TarefaAnalise(
+                roteiro, criterios, modelo, especulativa=True, orcamento_tokens=restante,
+                prioridade="lote", usuario=sessao, **opcoes_analisador
+            )
+            self._tarefas[tarefa.id] = tarefa
+            self._especulativas[sessao] = tarefa
+
+        tarefa.iniciar()
+        return tarefa
+
+    def descartar_especulativa(self, sessao, roteiro):
+        """Cancela na hora a pré-análise da sessão se o texto mudou (sem esperar a pausa na edição)"""
+        with self._lock:
+            atual = self._especulativas.get(sessao)
+            if atual and atual.roteiro != roteiro:
+                del self._especulativas[sessao]
+                self._descartar(sessao, atual)
+
+    def especulativa(self, sessao):
+        """Pré-análise atual da sessão (None se não houver)"""
+        with self._lock:
+            return self._especulativas.get(sessao)
+
+    def gasto_especulativo(self, sessao):
+        """Tokens gastos em pré-análises da sessão que não foram aproveitadas"""
+        with self._lock:
+            return self._gasto_especulativo(sessao)
+
+    def _gasto_especulativo(self, sessao):
+        return sum(tarefa.tokens_gastos() for tarefa in self._descartadas.get(sessao, []))
+
+    def _descartar(self, sessao, tarefa):
+        """Cancela uma pré-análise não aproveitada e a mantém na conta do orçamento (chamado com o lock)"""
+        if tarefa.ativa:
+            tarefa.cancelar()
+        self._descartadas.setdefault(sessao, []).append(tarefa)
+
+    def obter(self, tarefa_id):
+        """Devolve a tarefa pelo ID (None se não existir ou já tiver sido descartada)"""
+        with self._lock:
+            return self._tarefas.get(tarefa_id)
+
+    def cancelar_todas(self):
+        """Cancela todas as tarefas ativas (ex: ao desligar o servidor)"""
+        with self._lock:
+            tarefas = list(self._tarefas.values())
+        for tarefa in tarefas:
+            if tarefa.ativa:
+                tarefa.cancelar()
+
+    def _limpar_antigas(self):
+        """Descarta tarefas finalizadas há mais tempo que a retenção (chamado com o lock)"""
+        agora = time.time()
+        for tarefa_id, tarefa in list(self._tarefas.items()):
+            if tarefa.finalizada_em and agora - tarefa.finalizada_em > self.retencao_segundos:
+                del self._tarefas[tarefa_id]
+        for sessao, tarefa_id in list(self._ativas_por_sessao.items()):
+            if tarefa_id not in self._tarefas:
+                del self._ativas_por_sessao[sessao]
+        for sessao, tarefa in list(self._especulativas.items()):
+            if tarefa.id not in self._tarefas:
+                del self._especulativas[sessao]
+        # O orçamento de pré-análise vale para as descartadas dentro da retenção
+        for sessao, tarefas in list(self._descartadas.items()):
+            tarefas[:] = [tarefa for tarefa in tarefas if tarefa.id in self._tarefas]
+            if not tarefas:
+                del self._descartadas[sessao]
@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Teste de carga do app Streamlit
+Sobe um único servidor (streamlit run app.py) apontado para o servidor stub e conecta a ele vários
+editores simultâneos pelo websocket, como navegadores. Mede a latência de cada sessão, o throughput
+e o uso de CPU e memória do servidor; o stub roda em outro processo, fora das medidas.
+"""
+
+import os
+import sys
+import json
+import time
+import random
+import shutil
+import socket
+import asyncio
+import argparse
+import resource
+import tempfile
+import subprocess
+import statistics
+
+DIRETORIO = os.path.dirname(os.path.abspath(__file__))
+ARQUIVO_APP = os.path.join(DIRETORIO, "app.py")
+
+# Orçamento padrão do p95 de um rerun do app, em segundos (falha acima disso)
+ORCAMENTO_PADRAO = 2.0
+
+PARAGRAFOS = [
+    "Olá pessoal! Hoje vamos falar sobre um assunto que muita gente pergunta nos comentários.",
+    "Primeiro, vamos entender de onde vem essa ideia e por que ela ficou tão popular.",
+    "Repare que o detalhe mais importante está no começo, e quase ninguém presta atenção nele.",
+    "Agora a parte prática: separe os materiais, siga a ordem e não pule nenhuma etapa.",
+    "E aí, gostaram? Deixem um like, se inscrevam e contem nos comentários o que acharam!",
+]
+
+def percentil(valores, p):
+    """Percentil p (0-100) por interpolação linear; 0 se não houver valores"""
+    if not valores:
+        return 0.0
+    ordenados = sorted(valores)
+    posicao = (len(ordenados) - 1) * p / 100
+    inferior = int(posicao)
+    superior = min(inferior + 1, len(ordenados) - 1)
+    return ordenados[inferior] + (ordenados[superior] - ordenados[inferior]) * (posicao - inferior)
+
+def gerar_roteiro(aleatorio, paragrafos):
+    """Roteiro sintético diferente a cada chamada (evita cache e histórico)"""
+    linhas = [f"[CENA {i + 1}] {aleatorio.choice(PARAGRAFOS)} ({aleatorio.random():.6f})" for i in range(paragrafos)]
+    return "\n\n".join(linhas)
+
+def uso_processo(pid):
+    """(segundos de CPU, memória residente atual e pico em MB) do processo pelo /proc; None fora do Linux"""
+    try:
+        with open(f"/proc/{pid}/stat", encoding="ascii") as f:
+            campos = f.read().rsplit(")", 1)[1].split()  # O nome do processo pode ter espaços
+        with open(f"/proc/{pid}/status", encoding="ascii") as f:
+            memoria = {linha.split(":")[0]: int(linha.split()[1]) for linha in f if linha.startswith("Vm")}
+    except OSError:
+        return None
+    cpu = (int(campos[11]) + int(campos[12])) / os.sysconf("SC_CLK_TCK")  # utime + stime
+    return cpu, memoria.get("VmRSS", 0) / 1024, memoria.get("VmHWM", 0) / 1024
+
+def uso_filhos():
+    """(segundos de CPU, pico de memória em MB) dos processos filhos já encerrados (fora do Linux)"""
+    uso = resource.getrusage(resource.RUSAGE_CHILDREN)
+    # macOS informa em bytes, Linux em KB
+    pico = uso.ru_maxrss / 1024 / 1024 if sys.platform == "darwin" else uso.ru_maxrss / 1024
+    return uso.ru_utime + uso.ru_stime, pico
+
+def porta_livre():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+def esperar_porta(processo, porta, segundos, nome):
+    """Espera o processo aceitar conexões na porta (erro se ele sair ou demorar demais)"""
+    limite = time.monotonic() + segundos
+    while time.monotonic() < limite and processo.poll() is None:
+        try:
+            socket.create_connection(("127.0.0.1", porta), timeout=0.2).close()
+            return
+        except OSError:
+            time.sleep(0.05)
+    processo.terminate()
+    raise RuntimeError(f"o {nome} não subiu")
+
+def iniciar_stub(atraso):
+    """Sobe o servidor stub em outro processo (a CPU dele não entra nas medidas); devolve (processo, url)"""
+    porta = porta_livre()
+    processo = subprocess.Popen(
+        [sys.executable, os.path.join(DIRETORIO, "servidor_stub.py"), "--porta", str(porta), "--atraso", str(atraso)],
+        stdout=subprocess.DEVNULL
+    )
+    esperar_porta(processo, porta, 10, "servidor stub")
+    return processo, f"http://127.0.0.1:{porta}/v1"
+
+def iniciar_app(diretorio):
+    """Sobe um único servidor do app (streamlit run) no diretório de dados; devolve (processo, url do websocket)"""
+    porta = porta_livre()
+    processo = subprocess.Popen(
+        [sys.executable, "-m", "streamlit", "run", ARQUIVO_APP, "--server.headless", "true",
+         "--server.address", "127.0.0.1", "--server.port", str(porta), "--server.fileWatcherType", "none",
+         "--browser.gatherUsageStats", "false"],
+        cwd=diretorio,
+        # O app exige a chave antes de mostrar o roteiro
+        env={**os.environ, "OPENAI_API_KEY": os.environ.get("OPENAI_API_KEY", "sem-chave")},
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    esperar_porta(processo, porta, 60, "servidor do app")
+    return processo, f"ws://127.0.0.1:{porta}/_stcore/stream"
+
+def preparar_diretorio(url_stub):
+    """Diretório temporário com critérios e backends.json apontando para o stub (histórico isolado)"""
+    diretorio = tempfile.mkdtemp(prefix="teste_carga_")
+    shutil.copy(os.path.join(DIRETORIO, "criterios.txt"), diretorio)
+    with open(os.path.join(diretorio, "backends.json"), "w", encoding="utf-8") as f:
+        json.dump({
+            "padrao": "stub",
+            "backends": {"stub": {"base_url": url_stub, "api_key": "sem-chave", "max_conexoes": 50}}
+        }, f)
+    return diretorio
+
+class SessaoNavegador:
+    """Um editor usando o app pelo websocket, como o navegador: cola um roteiro, escolhe critérios, analisa e repete
+
+    Guarda os valores dos widgets e os reenvia a cada rerun, e repete os fragmentos com run_every
+    (acompanhamento da análise) no intervalo pedido pelo servidor.
+    """
+
+    def __init__(self, url, numero, analises, paragrafos, timeout, semente):
+        self.url = url
+        self.numero = numero
+        self.analises = analises
+        self.paragrafos = paragrafos
+        self.timeout = timeout
+        self.aleatorio = random.Random(semente)
+        self.reruns = []  # Do envio de cada rerun completo até o fim da execução do script
+        self.tempos_analise = []  # Do clique em analisar até o relatório na tela
+        self.requisicoes = 0  # Requisições ao modelo (métrica do relatório, sem as reaproveitadas)
+        self.erro = None
+        self._ws = None
+        self._widgets = {}  # Chave do widget (ou rótulo, sem chave) -> id, na última execução completa
+        self._estados = {}  # id -> WidgetState reenviado a cada rerun
+        self._fragmentos = {}  # fragment_id -> intervalo em segundos (run_every)
+        self._cabecalhos = set()  # Títulos da última execução completa
+        self._metricas = {}  # Rótulo -> valor das métricas da última execução completa
+        self._execucao = None  # Elementos da execução completa em andamento
+        self._terminadas = asyncio.Queue()  # ScriptFinishedStatus de cada execução (None: conexão perdida)
+        self._falha = None
+
+    def _registrar_elemento(self, elemento):
+        tipo = elemento.WhichOneof('type')
+        if tipo == 'exception':
+            raise RuntimeError(elemento.exception.message)
+        conteudo = getattr(elemento, tipo)
+        if tipo == 'heading':
+            self._execucao['cabecalhos'].add(conteudo.body)
+        elif tipo == 'metric':
+            self._execucao['metricas'][conteudo.label] = conteudo.body
+        elif getattr(conteudo, 'id', "").startswith("$$ID-"):
+            chave = conteudo.id.split("-", 2)[2]
+            self._execucao['widgets'][conteudo.label if chave == "None" else chave] = conteudo.id
+
+    async def _receber(self):
+        """Lê as mensagens do servidor enquanto a sessão estiver aberta"""
+        try:
+            await self._ler_mensagens()
+            self._falha = ConnectionError("o servidor fechou a conexão")
+        except Exception as e:
+            self._falha = e
+        self._terminadas.put_nowait(None)
+
+    async def _ler_mensagens(self):
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        async for dados in self._ws:
+            mensagem = ForwardMsg()
+            mensagem.ParseFromString(dados)
+            tipo = mensagem.WhichOneof('type')
+            if tipo == 'new_session':
+                # Começo de uma execução (completa ou de um fragmento)
+                self._execucao = {'widgets': {}, 'cabecalhos': set(), 'metricas': {}}
+            elif tipo == 'delta' and mensagem.delta.WhichOneof('type') == 'new_element':
+                self._registrar_elemento(mensagem.delta.new_element)
+            elif tipo == 'auto_rerun':
+                self._fragmentos[mensagem.auto_rerun.fragment_id] = mensagem.auto_rerun.interval
+            elif tipo == 'stop_auto_rerun':
+                for fragmento in mensagem.stop_auto_rerun.fragment_ids:
+                    self._fragmentos.pop(fragmento, None)
+            elif tipo == 'script_finished':
+                if mensagem.script_finished == ForwardMsg.FINISHED_SUCCESSFULLY and self._execucao:
+                    self._widgets = self._execucao['widgets']
+                    self._cabecalhos = self._execucao['cabecalhos']
+                    self._metricas = self._execucao['metricas']
+                self._terminadas.put_nowait(mensagem.script_finished)
+
+    async def _enviar(self, gatilho=None, fragmento=None):
+        """Pede um rerun com os valores dos widgets (gatilho: id de um botão clicado)"""
+        from streamlit.proto.BackMsg_pb2 import BackMsg
+
+        mensagem = BackMsg()
+        estado = mensagem.rerun_script
+        estado.widget_states.widgets.extend(self._estados.values())
+        if gatilho:
+            clique = estado.widget_states.widgets.add()
+            clique.id = gatilho
+            clique.trigger_value = True
+        if fragmento:
+            estado.fragment_id = fragmento
+            estado.is_auto_rerun = True
+        await self._ws.send(mensagem.SerializeToString())
+
+    async def _executar(self, gatilho=None):
+        """Rerun completo, esperando o script terminar (inclusive os st.rerun que ele pedir)"""
+        from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+
+        inicio = time.perf_counter()
+        await self._enviar(gatilho)
+        while (status := await asyncio.wait_for(self._terminadas.get(), self.timeout)) != ForwardMsg.FINISHED_SUCCESSFULLY:
+            if status is None:
+                raise self._falha
+        self.reruns.append(time.perf_counter() - inicio)
+
+    def _definir(self, chave, **valor):
+        from streamlit.proto.WidgetStates_pb2 import WidgetState
+
+        self._estados[self._widgets[chave]] = WidgetState(id=self._widgets[chave], **valor)
+
+    def _botao(self, prefixo):
+        return next((widget for rotulo, widget in self._widgets.items() if rotulo.startswith(prefixo)), None)
+
+    @property
+    def _relatorio_na_tela(self):
+        return "📊 Relatório de Análise" in self._cabecalhos
+
+    async def _esperar_relatorio(self, inicio):
+        """Repete os fragmentos com run_every, como o navegador, até o relatório aparecer"""
+        while not self._relatorio_na_tela:
+            if time.perf_counter() - inicio > self.timeout:
+                raise TimeoutError("análise não terminou no tempo limite")
+            await asyncio.sleep(min(self._fragmentos.values(), default=1.0))
+            if self._relatorio_na_tela:
+                break
+            for fragmento in list(self._fragmentos):
+                await self._enviar(fragmento=fragmento)
+
+    async def executar(self):
+        import websockets
+
+        try:
+            async with websockets.connect(self.url, subprotocols=["streamlit"], max_size=None) as self._ws:
+                receptor = asyncio.create_task(self._receber())
+                try:
+                    await self._sessao()
+                finally:
+                    receptor.cancel()
+        except Exception as e:
+            self.erro = f"{type(e).__name__}: {e}"
+
+    async def _sessao(self):
+        await self._executar()
+        for _ in range(self.analises):
+            # Voltar à seleção de critérios depois de uma análise
+            nova = self._botao("🔄 Nova Análise com")
+            if nova:
+                await self._executar(gatilho=nova)
+
+            self._definir("roteiro_input", string_value=gerar_roteiro(self.aleatorio, self.paragrafos))
+            await self._executar()
+
+            # Desmarcar alguns critérios ao acaso (pelo menos um fica marcado)
+            caixas = [chave for chave in self._widgets if chave.startswith("criterio_")]
+            desmarcadas = set(self.aleatorio.sample(caixas, self.aleatorio.randint(0, max(0, len(caixas) - 1))))
+            for caixa in caixas:
+                self._definir(caixa, bool_value=caixa not in desmarcadas)
+            await self._executar()
+
+            inicio = time.perf_counter()
+            await self._executar(gatilho=self._botao("🔍 Analisar"))
+            await self._esperar_relatorio(inicio)
+            self.tempos_analise.append(time.perf_counter() - inicio)
+            self.requisicoes += int(self._metricas.get("Total de Requisições", 0))
+
+async def executar_sessoes(url, args):
+    sessoes = [
+        SessaoNavegador(url, i + 1, args.analises, args.paragrafos, args.timeout, args.semente + i)
+        for i in range(args.sessoes)
+    ]
+    await asyncio.gather(*(sessao.executar() for sessao in sessoes))
+    return sessoes
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga de um servidor do app Streamlit com sessões simuladas")
+    parser.add_argument('--sessoes', type=int, default=5, help="Editores simultâneos (padrão: 5)")
+    parser.add_argument('--analises', type=int, default=3, help="Análises por sessão (padrão: 3)")
+    parser.add_argument('--paragrafos', type=int, default=20, help="Tamanho do roteiro em parágrafos (padrão: 20)")
+    parser.add_argument('--atraso', type=float, default=0.2, help="Latência simulada do modelo em segundos (padrão: 0.2)")
+    parser.add_argument('--stub', metavar='URL',
+                        help="Usa um stub já rodando (python servidor_stub.py) em vez de subir um")
+    parser.add_argument('--timeout', type=float, default=60, help="Tempo máximo de cada análise em segundos")
+    parser.add_argument('--orcamento', type=float, default=ORCAMENTO_PADRAO,
+                        help=f"p95 máximo de um rerun do app em segundos (padrão: {ORCAMENTO_PADRAO})")
+    parser.add_argument('--semente', type=int, default=42, help="Semente dos roteiros e critérios sorteados")
+    args = parser.parse_args()
+
+    stub = None
+    if args.stub:
+        url_stub = args.stub
+    else:
+        stub, url_stub = iniciar_stub(args.atraso)
+
+    diretorio = preparar_diretorio(url_stub)
+    app = None
+    filhos = None
+    try:
+        app, url_app = iniciar_app(diretorio)
+        print(f"🧪 Stub em {url_stub}, app em {url_app}, dados em {diretorio}")
+        print(f"👥 {args.sessoes} sessão(ões) x {args.analises} análise(s) no mesmo servidor\n")
+
+        uso_inicio = uso_processo(app.pid)
+        inicio = time.perf_counter()
+        sessoes = asyncio.run(executar_sessoes(url_app, args))
+        duracao = time.perf_counter() - inicio
+        uso_fim = uso_processo(app.pid)
+    finally:
+        if app:
+            app.terminate()
+            app.wait()
+            filhos = uso_filhos()  # Antes de encerrar o stub, que também é filho
+        if stub:
+            stub.terminate()
+            stub.wait()
+
+    print(f"{'Sessão':<8} {'análises':>9} {'rerun p50':>10} {'rerun p95':>10} {'análise p50':>12} {'análise máx':>12}  status")
+    for sessao in sessoes:
+        status = f"❌ {sessao.erro}" if sessao.erro else "✅"
+        print(f"{sessao.numero:<8} {len(sessao.tempos_analise):>9} "
+              f"{percentil(sessao.reruns, 50) * 1000:>8.0f}ms {percentil(sessao.reruns, 95) * 1000:>8.0f}ms "
+              f"{percentil(sessao.tempos_analise, 50):>11.2f}s {max(sessao.tempos_analise, default=0):>11.2f}s  {status}")
+
+    reruns = [tempo for sessao in sessoes for tempo in sessao.reruns]
+    analises = [tempo for sessao in sessoes for tempo in sessao.tempos_analise]
+    requisicoes = sum(sessao.requisicoes for sessao in sessoes)
+    p95 = percentil(reruns, 95)
+    print(f"\n⏱️  Rerun do app: p50 {percentil(reruns, 50) * 1000:.0f} ms, p95 {p95 * 1000:.0f} ms, "
+          f"máx {max(reruns, default=0) * 1000:.0f} ms ({len(reruns)} reruns)")
+    if analises:
+        print(f"🔍 Análise completa: p50 {statistics.median(analises):.2f} s, p95 {percentil(analises, 95):.2f} s")
+    print(f"🚀 Throughput: {len(analises) / duracao * 60:.1f} análises/min em {duracao:.1f} s, "
+          f"{requisicoes / duracao:.1f} requisições/s ao modelo")
+    if uso_inicio and uso_fim:
+        cpu = uso_fim[0] - uso_inicio[0]
+        print(f"🖥️  CPU do servidor: {cpu:.1f} s ({cpu / duracao:.1f} núcleo(s) em média)")
+        print(f"💾 Memória do servidor: {uso_inicio[1]:.0f} MB ocioso, pico {uso_fim[2]:.0f} MB "
+              f"(~{(uso_fim[2] - uso_inicio[1]) / max(1, args.sessoes):.0f} MB por sessão)")
+    else:
+        # Sem /proc: uso total do processo do servidor, inclusive a subida
+        cpu, pico = filhos
+        print(f"🖥️  CPU do servidor (com a subida): {cpu:.1f} s · 💾 pico de memória {pico:.0f} MB")
+
+    falhas = sum(1 for sessao in sessoes if sessao.erro)
+    if falhas:
+        print(f"\n❌ {falhas} sessão(ões) falharam")
+        sys.exit(1)
+    if p95 > args.orcamento:
+        print(f"\n❌ p95 do rerun acima do orçamento ({args.orcamento * 1000:.0f} ms)")
+        sys.exit(1)
+    print("\n✅ Carga dentro do orçamento")
+
+if __name__ == "__main__":
+    main()